@@ -2,10 +2,12 @@ from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
 from datetime import datetime, timedelta
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from app.config import settings
 from app.models import UsersMaster
-from app.database import get_db
+from app.database import get_db, get_async_db
 from app.schemas.token_schemas import TokenData
 from passlib.context import CryptContext
 
@@ -33,10 +35,8 @@ def create_access_token(data: dict, expires_delta: timedelta = None):
     to_encode.update({"exp": expire})
     return jwt.encode(to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
 
-async def get_current_user(
-    token: str = Depends(oauth2_scheme), 
-    db: Session = Depends(get_db)
-):
+def get_token_username(token: str) -> str:
+    """Decode the bearer token and return its subject, raising 401 if invalid"""
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -49,10 +49,15 @@ async def get_current_user(
             raise credentials_exception
     except JWTError:
         raise credentials_exception
+    return username
 
-    user = db.query(UsersMaster).filter(UsersMaster.username == username).first()
+def _attach_roles(user: UsersMaster):
     if user is None:
-        raise credentials_exception
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
 
     # 🔥 Normalize roles into list
     if user.role:
@@ -62,3 +67,19 @@ async def get_current_user(
 
     return user
 
+def get_current_user(
+    token: str = Depends(oauth2_scheme), 
+    db: Session = Depends(get_db)
+):
+    username = get_token_username(token)
+    user = db.query(UsersMaster).filter(UsersMaster.username == username).first()
+    return _attach_roles(user)
+
+async def get_current_user_async(
+    token: str = Depends(oauth2_scheme),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """get_current_user for async endpoints, loads the user on the request's AsyncSession"""
+    username = get_token_username(token)
+    result = await db.execute(select(UsersMaster).where(UsersMaster.username == username))
+    return _attach_roles(result.scalars().first())
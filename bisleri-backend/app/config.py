@@ -8,10 +8,56 @@ class Settings(BaseSettings):
     DB_PORT: int = Field(..., env="DB_PORT")
     DB_NAME: str = Field(..., env="DB_NAME")
 
+    # SQLAlchemy connection pool (per worker process)
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 20
+    DB_POOL_TIMEOUT: int = 30  # Seconds to wait for a free connection before erroring
+    DB_POOL_RECYCLE: int = 1800  # Reconnect connections older than this (seconds)
+    DB_POOL_PRE_PING: bool = True
+
     SECRET_KEY: str
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 720  
 
+    # Gate entries for the same vehicle are serialized; how long a second lane waits
+    GATE_VEHICLE_LOCK_TIMEOUT_MS: int = 5000
+
+    # Idempotency-Key replay for create endpoints
+    IDEMPOTENCY_KEY_TTL_HOURS: int = 24
+    IDEMPOTENCY_KEY_WAIT_MS: int = 10000  # How long a retry waits for the original request to finish
+
+    # /filtered-movements keyset pagination
+    FILTERED_MOVEMENTS_PAGE_SIZE: int = 500
+    FILTERED_MOVEMENTS_MAX_PAGE_SIZE: int = 2000
+
+    # CSV / XLSX exports and ?stream= responses: rows fetched per server-side cursor round trip
+    STREAM_BATCH_SIZE: int = 1000
+
+    # Daily rollups for the dashboard / statistics endpoints
+    ROLLUP_CHUNK_DAYS: int = 31  # Days rolled up per transaction while catching up
+
+    # Offline queue replay (/bulk-ingest)
+    BULK_INGEST_MAX_ITEMS: int = 500
+    BULK_INGEST_MAX_CLOCK_SKEW_MINUTES: int = 5  # Reject client timestamps further in the future
+
+    # mfabric -> document_data consolidation
+    SYNC_PARALLEL: bool = True
+    # Incremental runs pick documents by load time (mfabric_document_changes), not document_date
+    SYNC_WATERMARK_LOOKBACK_HOURS: int = 24
+
+    # In-process sync scheduler (run by the API lifespan and by scheduler.py)
+    SYNC_SCHEDULER_ENABLED: bool = True
+    SYNC_INTERVAL_SECONDS: int = 600
+    SYNC_JITTER_SECONDS: int = 30
+    SYNC_RUN_ON_START: bool = True
+    SYNC_RUN_HISTORY_LIMIT: int = 20
+    SYNC_LOCK_WAIT_SECONDS: int = 30  # How long manual/API syncs wait for a running sync to finish
+
+    # Near-real-time consolidation driven by NOTIFY triggers on the mfabric tables
+    MFABRIC_LISTENER_ENABLED: bool = True
+    MFABRIC_LISTENER_DEBOUNCE_SECONDS: float = 1.0
+    MFABRIC_LISTENER_MAX_DELAY_SECONDS: float = 5.0
+
     class Config:
         env_file = ".env"
 
@@ -3,7 +3,10 @@ from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
 import logging
 import os
-from app.routers import auth, documents, gate, insights, ping, admin, sync , raw_materials
+from app.routers import auth, documents, gate, insights, ping, admin, sync , raw_materials, ingest
+from app.config import settings
+from app.services.sync_scheduler import sync_scheduler
+from app.services.mfabric_listener import mfabric_listener
  
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -13,7 +16,14 @@ async def lifespan(app: FastAPI):
     # Startup
     logger.info("Starting up FastAPI application...")
     try:
-        # Log that data sync service is available
+        # Run the mfabric -> document_data sync in-process on the shared engine
+        if settings.SYNC_SCHEDULER_ENABLED:
+            sync_scheduler.start()
+        else:
+            logger.info("In-process sync scheduler disabled (SYNC_SCHEDULER_ENABLED=false)")
+        # Consolidate new mfabric documents seconds after they land
+        if settings.MFABRIC_LISTENER_ENABLED:
+            mfabric_listener.start()
         logger.info("Data sync service initialized and ready")
         logger.info("Application startup complete")
     except Exception as e:
@@ -22,6 +32,8 @@ async def lifespan(app: FastAPI):
     # Shutdown
     logger.info("Shutting down FastAPI application...")
     try:
+        await sync_scheduler.stop()
+        mfabric_listener.stop()
         logger.info("Application shutdown complete")
     except Exception as e:
         logger.error(f"Error during shutdown: {str(e)}")
@@ -29,7 +41,8 @@ async def lifespan(app: FastAPI):
 app = FastAPI(
     title="Bisleri Backend API",
     description="Backend API for Bisleri with automated data synchronization", 
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
  
 # CORS - Allow localhost:8081 to access backend:8000
@@ -61,6 +74,7 @@ app.include_router(ping.router)
 app.include_router(admin.router)
 app.include_router(sync.router)
 app.include_router(raw_materials.router)
+app.include_router(ingest.router)
  
 @app.get("/")
 async def root():
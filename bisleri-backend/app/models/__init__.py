@@ -1,4 +1,9 @@
 from .documents import DocumentData, MfabricDeliveryChallanData, MfabricInvoiceData, MfabricTransferOrderRGPData
 from .users import UsersMaster, LocationMaster
 from .insights import InsightsData
-from .raw_materials import RawMaterialsData
\ No newline at end of file
+from .raw_materials import RawMaterialsData
+from .sync import SyncWatermark, SyncRun, MfabricDocumentChange
+from .counters import GateEntryCounter
+from .vehicles import VehicleState
+from .idempotency import IdempotencyKey
+from .rollups import InsightsDailyRollup, RawMaterialsDailyRollup, DailyVehicleActivity
@@ -0,0 +1,16 @@
+# app/models/counters.py
+from sqlalchemy import Column, String, Integer, DateTime
+from sqlalchemy.sql import func
+from app.database import Base
+
+class GateEntryCounter(Base):
+    """Last gate entry sequence number handed out per warehouse and year"""
+    __tablename__ = "gate_entry_counters"
+
+    warehouse_code = Column(String(50), primary_key=True)
+    year = Column(Integer, primary_key=True)
+    last_value = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+    def __repr__(self):
+        return f"<GateEntryCounter(warehouse_code='{self.warehouse_code}', year={self.year}, last_value={self.last_value})>"
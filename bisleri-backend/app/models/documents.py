@@ -1,6 +1,10 @@
-from sqlalchemy import Column, Integer, String, DateTime, Numeric
+from sqlalchemy import Column, Integer, String, DateTime, Numeric, Index, Computed
 from app.database import Base
 
+# vehicle_no with everything but letters/digits stripped and upper-cased; matches
+# app.utils.helpers.clean_vehicle_number so plate searches ignore spaces and dashes
+NORMALIZED_VEHICLE_NO = "upper(regexp_replace(vehicle_no, '[^A-Za-z0-9]', '', 'g'))"
+
 # Mfabric tables - NO PRIMARY KEYS (staging tables for client data)
 class MfabricDeliveryChallanData(Base):
     __tablename__ = "mfabric_deliverychallan_data"
@@ -81,4 +85,14 @@ class DocumentData(Base):
     from_warehouse_code = Column(String(100))
     to_warehouse_code = Column(String(100))
     sub_document_type = Column(String(100))
-    salesman = Column(String(100))
\ No newline at end of file
+    salesman = Column(String(100))
+    vehicle_no_norm = Column(String(100), Computed(NORMALIZED_VEHICLE_NO, persisted=True))
+
+    __table_args__ = (
+        # search-recent-documents / unassigned-documents: vehicle_no = ? AND document_date >= ?
+        Index("ix_document_data_vehicle_no_document_date", "vehicle_no", "document_date"),
+        Index("ix_document_data_gate_entry_no", "gate_entry_no"),
+        # Partial plate searches: vehicle_no_norm LIKE '%...%'
+        Index("ix_document_data_vehicle_no_norm_trgm", "vehicle_no_norm",
+              postgresql_using="gin", postgresql_ops={"vehicle_no_norm": "gin_trgm_ops"}),
+    )
\ No newline at end of file
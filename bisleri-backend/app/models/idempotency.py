@@ -0,0 +1,25 @@
+# app/models/idempotency.py
+from sqlalchemy import Column, Integer, String, DateTime, Index
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.sql import func
+from app.database import Base
+
+class IdempotencyKey(Base):
+    """Response of a create request sent with an Idempotency-Key header, replayed on retries"""
+    __tablename__ = "idempotency_keys"
+
+    idempotency_key = Column(String(100), primary_key=True)
+    username = Column(String(50), primary_key=True)  # Keys are scoped per user
+    endpoint = Column(String(100), nullable=False)
+    request_hash = Column(String(64), nullable=False)  # sha256 of the request body
+    status_code = Column(Integer)
+    response = Column(JSONB)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    expires_at = Column(DateTime(timezone=True), nullable=False)
+
+    __table_args__ = (
+        Index("ix_idempotency_keys_expires_at", "expires_at"),
+    )
+
+    def __repr__(self):
+        return f"<IdempotencyKey(idempotency_key='{self.idempotency_key}', endpoint='{self.endpoint}')>"
@@ -1,6 +1,10 @@
 # app/models/insights.py - UPDATED WITH OPERATIONAL FIELDS
-from sqlalchemy import Column, Integer, String, DateTime, Text, Time
+from datetime import datetime
+from sqlalchemy import Column, Integer, String, DateTime, Date, Text, Time, Index, Computed
+from sqlalchemy import Boolean, and_, bindparam, case, cast, extract, false, func, null
+from sqlalchemy.dialects.postgresql import ARRAY, array
 from app.database import Base
+from app.models.documents import NORMALIZED_VEHICLE_NO
 
 class InsightsData(Base):
     __tablename__ = "insights_data" 
@@ -27,6 +31,20 @@ class InsightsData(Base):
     loader_names = Column(String(200))          # Required for completion (comma-separated)
     last_edited_at = Column(DateTime)           # Track edit timestamps
     edit_count = Column(Integer, default=0)     # Track number of edits
+    vehicle_no_norm = Column(String(50), Computed(NORMALIZED_VEHICLE_NO, persisted=True))  # For partial plate search
+
+    __table_args__ = (
+        # Vehicle history: vehicle_no = ? ORDER BY date DESC, time DESC
+        Index("ix_insights_data_vehicle_no_date_time", "vehicle_no", "date", "time"),
+        Index("ix_insights_data_vehicle_no_norm_trgm", "vehicle_no_norm",
+              postgresql_using="gin", postgresql_ops={"vehicle_no_norm": "gin_trgm_ops"}),
+        Index("ix_insights_data_gate_entry_no", "gate_entry_no"),
+        # Insights / admin filters: warehouse_code = ? AND date BETWEEN ? AND ? ORDER BY date, time
+        Index("ix_insights_data_warehouse_code_date_time", "warehouse_code", "date", "time"),
+        Index("ix_insights_data_date", "date"),
+        # Edit statistics: last_edited_at >= today
+        Index("ix_insights_data_last_edited_at", "last_edited_at"),
+    )
     
     def __repr__(self):
         return f"<InsightsData(gate_entry_no='{self.gate_entry_no}', vehicle_no='{self.vehicle_no}')>"
@@ -111,49 +129,116 @@ class InsightsData(Base):
     
     def get_edit_button_config(self, current_user_username, current_user_role):
         """Get the complete button configuration for frontend"""
-        edit_status = self.get_edit_status()
-        can_edit = self.can_be_edited(current_user_username, current_user_role)
-        time_remaining = self.get_time_remaining()
-        missing_fields = self.get_missing_operational_fields()
-        
-        if edit_status == 'expired':
-            return {
-                'color': 'black',
-                'text': '⚫ Expired',
-                'enabled': False,
-                'priority': 'none',
-                'message': 'Edit window expired (48+ hours)',
-                'action': 'view_only'
-            }
-        
-        if not can_edit:
-            return {
-                'color': 'gray',
-                'text': '🚫 No Access',
-                'enabled': False,
-                'priority': 'none',
-                'message': 'Only creator or admin can edit',
-                'action': 'no_access'
-            }
-        
-        if edit_status == 'needs_completion':
-            return {
-                'color': 'yellow',
-                'text': '⚠️ Complete Info',
-                'enabled': True,
-                'priority': 'high',
-                'message': f'Missing: {", ".join(missing_fields)} | {time_remaining} remaining',
-                'action': 'complete_required',
-                'missing_fields': missing_fields
-            }
-        
-        # edit_status == 'editable'
+        return edit_button_config(
+            self.get_edit_status(),
+            self.can_be_edited(current_user_username, current_user_role),
+            self.get_time_remaining(),
+            self.get_missing_operational_fields(),
+            self.edit_count
+        )
+
+# ✅ SQL versions of the edit status helpers, for list endpoints: computed in the SELECT
+# against one `now` for the whole result instead of per row in Python
+EDIT_WINDOW_SECONDS = 48 * 3600
+OPERATIONAL_FIELDS = ('driver_name', 'km_reading', 'loader_names')
+
+def operational_field_filled(column):
+    """SQL: column is not NULL/blank (same test as `value and value.strip()`)"""
+    return func.coalesce(func.btrim(column, " \t\n\r\f\v"), '') != ''
+
+def seconds_since_entry(now: datetime):
+    """SQL: seconds since the gate entry's date + time (NULL without date/time)"""
+    record_datetime = cast(InsightsData.date, Date) + InsightsData.time
+    return extract('epoch', bindparam("now", now, type_=DateTime) - record_datetime)
+
+def edit_seconds_remaining(now: datetime):
+    """SQL: seconds left in the 48-hour edit window (NULL without date/time)"""
+    return EDIT_WINDOW_SECONDS - seconds_since_entry(now)
+
+def edit_status_expression(now: datetime):
+    """SQL version of InsightsData.get_edit_status"""
+    return case(
+        (edit_seconds_remaining(now).is_(None), 'expired'),
+        (edit_seconds_remaining(now) < 0, 'expired'),
+        (and_(*[operational_field_filled(getattr(InsightsData, field)) for field in OPERATIONAL_FIELDS]), 'editable'),
+        else_='needs_completion'
+    )
+
+def edit_state_columns(now: datetime, username: str, role: str) -> list:
+    """Labelled columns for edit_status, time_remaining, is_operational_complete,
+    missing_fields and can_edit, matching the InsightsData helper methods"""
+    remaining = edit_seconds_remaining(now)
+    status = edit_status_expression(now)
+    filled = {field: operational_field_filled(getattr(InsightsData, field)) for field in OPERATIONAL_FIELDS}
+
+    # Floor arithmetic rather than mod(): extract() is double precision, and PostgreSQL
+    # before 14 has no mod(double precision, integer)
+    hours = func.floor(remaining / 3600)
+    minutes = func.floor(remaining / 60) - hours * 60
+    time_remaining = case(
+        (remaining > 0,
+         cast(hours, Integer).cast(String) + 'h ' + cast(minutes, Integer).cast(String) + 'm'),
+        else_=null()
+    )
+    missing_fields = func.array_remove(
+        array([case((~filled[field], field)) for field in OPERATIONAL_FIELDS]),
+        null(),
+        type_=ARRAY(String)
+    )
+    if role == 'Admin':
+        has_access = True
+    else:
+        has_access = func.coalesce(InsightsData.security_username == bindparam("username", username, type_=String), false())
+    can_edit = and_(status != 'expired', has_access)
+
+    return [
+        status.label("edit_status"),
+        time_remaining.label("time_remaining"),
+        and_(*filled.values()).label("is_operational_complete"),
+        missing_fields.label("missing_fields"),
+        cast(can_edit, Boolean).label("can_edit"),
+    ]
+
+def edit_button_config(edit_status, can_edit, time_remaining, missing_fields, edit_count):
+    """Get the complete button configuration for frontend"""
+    if edit_status == 'expired':
         return {
-            'color': 'green',
-            'text': '✅ Edit Details',
+            'color': 'black',
+            'text': '⚫ Expired',
+            'enabled': False,
+            'priority': 'none',
+            'message': 'Edit window expired (48+ hours)',
+            'action': 'view_only'
+        }
+    
+    if not can_edit:
+        return {
+            'color': 'gray',
+            'text': '🚫 No Access',
+            'enabled': False,
+            'priority': 'none',
+            'message': 'Only creator or admin can edit',
+            'action': 'no_access'
+        }
+    
+    if edit_status == 'needs_completion':
+        return {
+            'color': 'yellow',
+            'text': '⚠️ Complete Info',
             'enabled': True,
-            'priority': 'medium',
-            'message': f'All data complete | {time_remaining} remaining',
-            'action': 'edit_optional',
-            'edit_count': self.edit_count or 0
-        }
\ No newline at end of file
+            'priority': 'high',
+            'message': f'Missing: {", ".join(missing_fields)} | {time_remaining} remaining',
+            'action': 'complete_required',
+            'missing_fields': missing_fields
+        }
+    
+    # edit_status == 'editable'
+    return {
+        'color': 'green',
+        'text': '✅ Edit Details',
+        'enabled': True,
+        'priority': 'medium',
+        'message': f'All data complete | {time_remaining} remaining',
+        'action': 'edit_optional',
+        'edit_count': edit_count or 0
+    }
@@ -1,6 +1,7 @@
 # app/models/raw_materials.py
-from sqlalchemy import Column, Integer, String, DateTime
+from sqlalchemy import Column, Integer, String, DateTime, Index, Computed
 from app.database import Base
+from app.models.documents import NORMALIZED_VEHICLE_NO
 
 class RawMaterialsData(Base):
     __tablename__ = "raw_materials_data"
@@ -22,6 +23,16 @@ class RawMaterialsData(Base):
     # Edit tracking fields (48-hour edit window)
     last_edited_at = Column(DateTime)
     edit_count = Column(Integer, default=0)
+    vehicle_no_norm = Column(String(50), Computed(NORMALIZED_VEHICLE_NO, persisted=True))  # For partial plate search
+
+    __table_args__ = (
+        Index("ix_raw_materials_data_gate_entry_no", "gate_entry_no"),
+        Index("ix_raw_materials_data_vehicle_no_norm_trgm", "vehicle_no_norm",
+              postgresql_using="gin", postgresql_ops={"vehicle_no_norm": "gin_trgm_ops"}),
+        # RM filters: warehouse_code = ? AND date_time BETWEEN ? AND ?
+        Index("ix_raw_materials_data_warehouse_code_date_time", "warehouse_code", "date_time"),
+        Index("ix_raw_materials_data_date_time", "date_time"),
+    )
     
     def __repr__(self):
         return f"<RawMaterialsData(gate_entry_no='{self.gate_entry_no}', vehicle_no='{self.vehicle_no}')>"
\ No newline at end of file
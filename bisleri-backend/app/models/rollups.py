@@ -0,0 +1,76 @@
+# app/models/rollups.py
+from sqlalchemy import Column, Integer, String, Date, DateTime, Index
+from sqlalchemy.sql import func
+from app.database import Base
+
+class InsightsDailyRollup(Base):
+    """Per-day, per-warehouse insights_data totals for days past the edit window.
+
+    Rebuilt by app/services/rollups.py; warehouse_code / site_code are copied as-is
+    (NULL included) so the stats endpoints filter rollups and raw rows the same way.
+    """
+    __tablename__ = "insights_daily_rollup"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    day = Column(Date, nullable=False)
+    warehouse_code = Column(String(50))
+    site_code = Column(String(50))
+    movements = Column(Integer, nullable=False, default=0)
+    gate_in_entries = Column(Integer, nullable=False, default=0)    # Distinct non-blank gate_entry_no
+    gate_out_entries = Column(Integer, nullable=False, default=0)
+    operational_complete = Column(Integer, nullable=False, default=0)
+    missing_driver = Column(Integer, nullable=False, default=0)
+    missing_km = Column(Integer, nullable=False, default=0)
+    missing_loaders = Column(Integer, nullable=False, default=0)
+    multiple_edits = Column(Integer, nullable=False, default=0)     # edit_count > 1
+    total_edits = Column(Integer, nullable=False, default=0)
+    max_edit_count = Column(Integer, nullable=False, default=0)
+    most_edited_id = Column(Integer)                                # insights_data.id with max_edit_count (lowest id)
+    most_edited_gate_entry_no = Column(String(50))
+    updated_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    __table_args__ = (
+        Index("ix_insights_daily_rollup_day_warehouse_code", "day", "warehouse_code"),
+    )
+
+    def __repr__(self):
+        return f"<InsightsDailyRollup(day='{self.day}', warehouse_code='{self.warehouse_code}')>"
+
+class RawMaterialsDailyRollup(Base):
+    """Per-day, per-warehouse raw_materials_data totals for days past the edit window"""
+    __tablename__ = "raw_materials_daily_rollup"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    day = Column(Date, nullable=False)
+    warehouse_code = Column(String(50))
+    site_code = Column(String(50))
+    entries = Column(Integer, nullable=False, default=0)
+    gate_in_count = Column(Integer, nullable=False, default=0)
+    gate_out_count = Column(Integer, nullable=False, default=0)
+    edited_entries = Column(Integer, nullable=False, default=0)     # edit_count > 0
+    updated_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    __table_args__ = (
+        Index("ix_raw_materials_daily_rollup_day_warehouse_code", "day", "warehouse_code"),
+    )
+
+    def __repr__(self):
+        return f"<RawMaterialsDailyRollup(day='{self.day}', warehouse_code='{self.warehouse_code}')>"
+
+class DailyVehicleActivity(Base):
+    """Vehicles seen per day and warehouse, for distinct vehicle counts over rolled-up days"""
+    __tablename__ = "daily_vehicle_activity"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    source = Column(String(20), nullable=False)  # insights / raw_materials
+    day = Column(Date, nullable=False)
+    warehouse_code = Column(String(50))
+    site_code = Column(String(50))
+    vehicle_no = Column(String(50), nullable=False)
+
+    __table_args__ = (
+        Index("ix_daily_vehicle_activity_source_day_warehouse_code", "source", "day", "warehouse_code"),
+    )
+
+    def __repr__(self):
+        return f"<DailyVehicleActivity(day='{self.day}', vehicle_no='{self.vehicle_no}')>"
@@ -0,0 +1,52 @@
+# app/models/sync.py
+from sqlalchemy import Column, Integer, String, DateTime, Float, Text, Index
+from sqlalchemy.sql import func
+from app.database import Base
+
+class SyncWatermark(Base):
+    __tablename__ = "sync_watermarks"
+
+    source_table = Column(String(100), primary_key=True)
+    last_document_date = Column(DateTime(timezone=True))  # Newest document_date consolidated so far
+    last_change_at = Column(DateTime(timezone=True))  # mfabric_document_changes covered by the last run
+    last_run_at = Column(DateTime(timezone=True))
+
+    def __repr__(self):
+        return f"<SyncWatermark(source_table='{self.source_table}', last_document_date='{self.last_document_date}')>"
+
+class MfabricDocumentChange(Base):
+    """When each mfabric document was last loaded (written by triggers on the mfabric tables)"""
+    __tablename__ = "mfabric_document_changes"
+
+    source_table = Column(String(100), primary_key=True)
+    document_no = Column(String(255), primary_key=True)
+    changed_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+
+    __table_args__ = (
+        Index("ix_mfabric_document_changes_source_table_changed_at", "source_table", "changed_at"),
+    )
+
+    def __repr__(self):
+        return f"<MfabricDocumentChange(source_table='{self.source_table}', document_no='{self.document_no}')>"
+
+class SyncRun(Base):
+    __tablename__ = "sync_runs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    trigger = Column(String(20), nullable=False)  # scheduled, manual, api
+    mode = Column(String(20), nullable=False)  # incremental, full
+    status = Column(String(20), nullable=False, default="running")  # running, success, failed, skipped
+    started_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+    finished_at = Column(DateTime(timezone=True))
+    duration_seconds = Column(Float)
+    inserts = Column(Integer, default=0)
+    updates = Column(Integer, default=0)
+    unchanged = Column(Integer, default=0)
+    error = Column(Text)
+
+    __table_args__ = (
+        Index("ix_sync_runs_started_at", "started_at"),
+    )
+
+    def __repr__(self):
+        return f"<SyncRun(id={self.id}, trigger='{self.trigger}', status='{self.status}')>"
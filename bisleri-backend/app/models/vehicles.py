@@ -0,0 +1,22 @@
+# app/models/vehicles.py
+from sqlalchemy import Column, String, DateTime, Time
+from sqlalchemy.sql import func
+from app.database import Base
+
+class VehicleState(Base):
+    """Last gate movement per vehicle, written in the same transaction as the insights_data rows.
+
+    Gate In/Out sequencing reads this by primary key instead of scanning insights_data.
+    """
+    __tablename__ = "vehicle_state"
+
+    vehicle_no = Column(String(50), primary_key=True)
+    movement_type = Column(String(20), nullable=False)   # Gate-In / Gate-Out
+    gate_entry_no = Column(String(50))
+    date = Column(DateTime)                              # Same values as insights_data.date / time
+    time = Column(Time)
+    warehouse_code = Column(String(50))
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+    def __repr__(self):
+        return f"<VehicleState(vehicle_no='{self.vehicle_no}', movement_type='{self.movement_type}')>"
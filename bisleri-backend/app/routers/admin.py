@@ -8,9 +8,12 @@ from typing import Optional
 from datetime import datetime, timedelta
 from app.database import get_db
 from app.models import UsersMaster, LocationMaster, InsightsData, RawMaterialsData
+from app.models import InsightsDailyRollup, RawMaterialsDailyRollup
 from app.schemas import UserCreate, UserResponse, PasswordReset, UserRoleUpdate, UserUpdate,UserSearchResponse
 from app.auth import get_current_user, get_password_hash
-from sqlalchemy import func
+from sqlalchemy import distinct, func, select
+from app.services.rollups import rollup_span, outside_span, rollup_totals, count_distinct_vehicles
+from app.utils.streaming import stream_format, stream_response, stream_rows
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
@@ -151,10 +154,18 @@ def reset_password(
 
 # ✅ List Users
 @router.get("/list-users", response_model=List[UserResponse])
-def list_users(db: Session = Depends(get_db), current_user: UsersMaster = Depends(get_current_user)):
+def list_users(stream: Optional[str] = None, db: Session = Depends(get_db),
+               current_user: UsersMaster = Depends(get_current_user)):
+    """All users; ?stream=json or ?stream=ndjson streams them as a JSON array / one object per line"""
     roles = normalize_roles(current_user.role)
     if "itadmin" not in roles:
         raise HTTPException(status_code=403, detail="Only ITAdmins can list users")
+    mode = stream_format(stream)
+    if mode:
+        return stream_response(mode, stream_rows(
+            select(UsersMaster),
+            lambda row: UserResponse.model_validate(row.UsersMaster).model_dump()
+        ))
     return db.query(UsersMaster).all()
 
 # ✅ Get User
@@ -289,19 +300,18 @@ def get_dashboard_stats(
         raise HTTPException(status_code=403, detail=f"Only Admin/ITAdmin can view dashboard stats. Your roles: {current_user.role}")
 
     try:
-        # Build base query
-        base_query = db.query(InsightsData)
-        
-        # ✅ NEW: Role-based filtering
-        if "securityadmin" in roles and "itadmin" not in roles:
-            # Security Admin: only their warehouse
-            base_query = base_query.filter(InsightsData.warehouse_code == current_user.warehouse_code)
-        elif site_code or warehouse_code:
+        # ✅ NEW: Role-based filtering (applied to insights_data and to its daily rollups)
+        def scope(model):
+            if "securityadmin" in roles and "itadmin" not in roles:
+                # Security Admin: only their warehouse
+                return [model.warehouse_code == current_user.warehouse_code]
             # IT Admin: apply site/warehouse filters if provided
+            conditions = []
             if site_code:
-                base_query = base_query.filter(InsightsData.site_code == site_code)
+                conditions.append(model.site_code == site_code)
             if warehouse_code:
-                base_query = base_query.filter(InsightsData.warehouse_code == warehouse_code)
+                conditions.append(model.warehouse_code == warehouse_code)
+            return conditions
         
         # ✅ NEW: Date range filtering (default to last 7 days if not provided)
         if not from_date or not to_date:
@@ -311,44 +321,42 @@ def get_dashboard_stats(
             start_date = datetime.strptime(from_date, '%Y-%m-%d').date()
             end_date = datetime.strptime(to_date, '%Y-%m-%d').date()
         
-        base_query = base_query.filter(
+        # Days already rolled up are read from insights_daily_rollup, the rest from raw rows.
+        # Both cover whole days start_date..end_date: rollup day <= end_date, raw rows before the next day
+        span = rollup_span(db, start_date, end_date)
+        conditions = scope(InsightsData) + [
             InsightsData.date >= start_date,
-            InsightsData.date <= end_date
-        )
+            InsightsData.date < end_date + timedelta(days=1),
+            outside_span(InsightsData.date, span)
+        ]
         
-        # Calculate stats
+        # Calculate the raw-row stats in one aggregate query: movements and UNIQUE
+        # gate_entry_no per movement type (blank values are not counted)
         today = datetime.now().date()
-        today_query = base_query.filter(InsightsData.date == today)
+        is_today = InsightsData.date == today
+        is_gate_in = InsightsData.movement_type == "Gate-In"
+        is_gate_out = InsightsData.movement_type == "Gate-Out"
+        gate_entry_no = func.nullif(InsightsData.gate_entry_no, '')
         
-        total_movements = base_query.count()
-        unique_vehicles = len(set([r.vehicle_no for r in base_query.all() if r.vehicle_no]))
+        stats = db.query(
+            func.count().label("total_movements"),
+            func.count(distinct(gate_entry_no)).filter(is_gate_in).label("gate_in_total"),
+            func.count(distinct(gate_entry_no)).filter(is_gate_out).label("gate_out_total"),
+            func.count(distinct(gate_entry_no)).filter(is_gate_in, is_today).label("gate_in_today"),
+            func.count(distinct(gate_entry_no)).filter(is_gate_out, is_today).label("gate_out_today")
+        ).filter(*conditions).one()
+        rolled_up = rollup_totals(db, InsightsDailyRollup, span, scope,
+                                  ["movements", "gate_in_entries", "gate_out_entries"])
         
-        # gate_in_today = today_query.filter(InsightsData.movement_type == "Gate-In").count()
-        # gate_out_today = today_query.filter(InsightsData.movement_type == "Gate-Out").count()
-        
-        # gate_in_total = base_query.filter(InsightsData.movement_type == "Gate-In").count()
-        # gate_out_total = base_query.filter(InsightsData.movement_type == "Gate-Out").count()
-
-        # Count UNIQUE gate_entry_no for Gate-In
-        gate_in_today = len(set([
-            r.gate_entry_no for r in today_query.all() 
-            if r.movement_type == "Gate-In" and r.gate_entry_no
-        ]))
-
-        gate_out_today = len(set([
-            r.gate_entry_no for r in today_query.all() 
-            if r.movement_type == "Gate-Out" and r.gate_entry_no
-        ]))
-
-        gate_in_total = len(set([
-            r.gate_entry_no for r in base_query.all() 
-            if r.movement_type == "Gate-In" and r.gate_entry_no
-        ]))
-
-        gate_out_total = len(set([
-            r.gate_entry_no for r in base_query.all() 
-            if r.movement_type == "Gate-Out" and r.gate_entry_no
-        ]))
+        total_movements = stats.total_movements + rolled_up["movements"]
+        unique_vehicles = count_distinct_vehicles(
+            db, "insights", span, scope,
+            select(InsightsData.vehicle_no).where(*conditions, InsightsData.vehicle_no != '')
+        )
+        gate_in_today = stats.gate_in_today
+        gate_out_today = stats.gate_out_today
+        gate_in_total = stats.gate_in_total + rolled_up["gate_in_entries"]
+        gate_out_total = stats.gate_out_total + rolled_up["gate_out_entries"]
         
         return {
             "total_movements": total_movements,
@@ -390,16 +398,16 @@ def get_admin_rm_statistics(
         if not any(r in ["securityadmin", "itadmin"] for r in roles):
             raise HTTPException(status_code=403, detail="Access denied")
         
-        base_query = db.query(RawMaterialsData)
-        
-        # Role-based filtering
-        if "securityadmin" in roles and "itadmin" not in roles:
-            base_query = base_query.filter(RawMaterialsData.warehouse_code == current_user.warehouse_code)
-        else:
+        # Role-based filtering (applied to raw_materials_data and to its daily rollups)
+        def scope(model):
+            if "securityadmin" in roles and "itadmin" not in roles:
+                return [model.warehouse_code == current_user.warehouse_code]
+            conditions = []
             if site_code:
-                base_query = base_query.filter(RawMaterialsData.site_code == site_code)
+                conditions.append(model.site_code == site_code)
             if warehouse_code:
-                base_query = base_query.filter(RawMaterialsData.warehouse_code == warehouse_code)
+                conditions.append(model.warehouse_code == warehouse_code)
+            return conditions
         
         # Date filtering
         if not from_date or not to_date:
@@ -409,14 +417,26 @@ def get_admin_rm_statistics(
             start_date = datetime.strptime(from_date, '%Y-%m-%d').date()
             end_date = datetime.strptime(to_date, '%Y-%m-%d').date()
         
-        base_query = base_query.filter(
-            func.DATE(RawMaterialsData.date_time) >= start_date,
-            func.DATE(RawMaterialsData.date_time) <= end_date
-        )
+        # Days already rolled up are read from raw_materials_daily_rollup, the rest from raw rows
+        # (whole days start_date..end_date for both, as in get_dashboard_stats)
+        span = rollup_span(db, start_date, end_date)
+        conditions = scope(RawMaterialsData) + [
+            RawMaterialsData.date_time >= start_date,
+            RawMaterialsData.date_time < end_date + timedelta(days=1),
+            outside_span(RawMaterialsData.date_time, span)
+        ]
         
-        recent_records = base_query.all()
+        stats = db.query(
+            func.count().label("total_entries"),
+            func.count().filter(RawMaterialsData.gate_type == "Gate-In").label("gate_in_count"),
+            func.count().filter(RawMaterialsData.gate_type == "Gate-Out").label("gate_out_count"),
+            func.count().filter(func.coalesce(RawMaterialsData.edit_count, 0) > 0).label("edited_entries")
+        ).filter(*conditions).one()
+        rolled_up = rollup_totals(db, RawMaterialsDailyRollup, span, scope,
+                                  ["entries", "gate_in_count", "gate_out_count", "edited_entries"])
         
-        if not recent_records:
+        total_entries = stats.total_entries + rolled_up["entries"]
+        if not total_entries:
             return {
                 "total_entries": 0,
                 "gate_in_count": 0,
@@ -430,11 +450,12 @@ def get_admin_rm_statistics(
                 }
             }
         
-        total_entries = len(recent_records)
-        gate_in_count = len([r for r in recent_records if r.gate_type == "Gate-In"])
-        gate_out_count = len([r for r in recent_records if r.gate_type == "Gate-Out"])
-        unique_vehicles = len(set(r.vehicle_no for r in recent_records))
-        edited_entries = len([r for r in recent_records if (r.edit_count or 0) > 0])
+        gate_in_count = stats.gate_in_count + rolled_up["gate_in_count"]
+        gate_out_count = stats.gate_out_count + rolled_up["gate_out_count"]
+        unique_vehicles = count_distinct_vehicles(
+            db, "raw_materials", span, scope, select(RawMaterialsData.vehicle_no).where(*conditions)
+        )
+        edited_entries = stats.edited_entries + rolled_up["edited_entries"]
         
         return {
             "total_entries": total_entries,
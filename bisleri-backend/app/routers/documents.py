@@ -2,6 +2,9 @@ from fastapi import APIRouter, Depends, HTTPException, status
 from app.auth import get_current_user
 from app.models import UsersMaster
 from app.services.db_service import DBService
+from app.config import settings
+from app.services.data_sync_service import data_sync_service
+from app.services.sync_lock import SyncAlreadyRunning
 
 router = APIRouter(tags=["Document Management"])
 
@@ -10,11 +13,17 @@ def consolidate_document_data(current_user: UsersMaster = Depends(get_current_us
     if current_user.role != "admin":
         raise HTTPException(status_code=403, detail="Only admins can trigger consolidation")
 
-    db_service = DBService()
-    success = db_service.push_to_document_data()
+    try:
+        success = data_sync_service.push_to_document_data(
+            trigger="api",
+            lock_mode="wait",
+            lock_timeout=settings.SYNC_LOCK_WAIT_SECONDS
+        )
+    except SyncAlreadyRunning as e:
+        raise HTTPException(status_code=409, detail=str(e))
     
     if success:
-        count = db_service.get_document_data_count()
+        count = DBService().get_document_data_count()
         return {"status": "success", "message": "Data consolidated", "document_data_rows": count}
     else:
         raise HTTPException(status_code=500, detail="Failed to consolidate document data")
\ No newline at end of file
@@ -1,8 +1,12 @@
 # app/routers/gate.py - COMPLETE ENHANCED VERSION WITH MULTI-DOCUMENT MANUAL ENTRY
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, Header, HTTPException, status
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from sqlalchemy import text
-from app.database import get_db
+from sqlalchemy import String, any_, bindparam, func, select, text, tuple_, update
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.exc import DBAPIError
+from app.config import settings
+from app.database import get_db, get_async_db
 from app.schemas import (
     GateEntryCreate, 
     GateEntryResponse, 
@@ -12,20 +16,135 @@ from app.schemas import (
     BatchGateEntryCreate,
     MultiDocumentManualEntryCreate  # NEW: Multi-document schema
 )
-from app.models import DocumentData, InsightsData, UsersMaster
-from app.auth import get_current_user
-from app.utils.helpers import generate_gate_entry_no_for_user, fetch_user_details
+from app.models import DocumentData, InsightsData, UsersMaster, VehicleState, InsightsDailyRollup
+from app.models.insights import operational_field_filled
+from app.auth import get_current_user, get_current_user_async
+from app.utils.helpers import (
+    LOCK_NOT_AVAILABLE,
+    clean_vehicle_number,
+    generate_gate_entry_no_for_user,
+    record_vehicle_movement,
+    vehicle_search_pattern
+)
+from app.utils.idempotency import begin_idempotent_request, save_idempotent_response
+from app.utils.streaming import stream_format, stream_response, stream_rows
+from app.services.rollups import rollup_span, outside_span, rollup_totals, refresh_rolled_up_day
 from datetime import datetime, timedelta
 from typing import List, Optional
 from pydantic import BaseModel
 
 router = APIRouter(tags=["Gate Operations"])
 
+# Advisory lock namespace for per-vehicle gate entry locks ("GATE"); the second key is
+# hashtext() of the cleaned vehicle number
+VEHICLE_LOCK_NAMESPACE = 0x47415445
+
+def lock_vehicle(db: Session, vehicle_no: str):
+    """Serialize gate entries for one vehicle until the current transaction ends.
+
+    Waits at most GATE_VEHICLE_LOCK_TIMEOUT_MS, then raises HTTPException(409). The lock is
+    keyed on the cleaned plate, so "MH12 AB 1234" and "MH12AB1234" contend with each other.
+    """
+    try:
+        db.execute(text("SELECT set_config('lock_timeout', :timeout, true)"),
+                   {"timeout": f"{settings.GATE_VEHICLE_LOCK_TIMEOUT_MS}ms"})
+        db.execute(text("SELECT pg_advisory_xact_lock(CAST(:namespace AS INTEGER), hashtext(CAST(:vehicle_no AS TEXT)))"),
+                   {"namespace": VEHICLE_LOCK_NAMESPACE, "vehicle_no": clean_vehicle_number(vehicle_no)})
+        # Only the vehicle lock gets the short timeout
+        db.execute(text("SET LOCAL lock_timeout TO DEFAULT"))
+    except DBAPIError as e:
+        if getattr(e.orig, "pgcode", None) == LOCK_NOT_AVAILABLE:
+            raise HTTPException(
+                status_code=409,
+                detail=f"Another gate entry for vehicle {vehicle_no} is in progress. Please retry."
+            )
+        raise
+
+def _moved_at_key(moved_at: datetime):
+    """(date, time) of moved_at as insights_data stores it: a midnight DateTime plus a Time"""
+    return datetime.combine(moved_at.date(), datetime.min.time()), moved_at.time()
+
+def movement_before(db: Session, vehicle_no: str, moved_at: datetime):
+    """The vehicle's last insights_data movement before moved_at (None if there is none)"""
+    return db.query(InsightsData.movement_type, InsightsData.date, InsightsData.time).filter(
+        InsightsData.vehicle_no == vehicle_no,
+        tuple_(InsightsData.date, InsightsData.time) < tuple_(*_moved_at_key(moved_at))
+    ).order_by(InsightsData.date.desc(), InsightsData.time.desc()).first()
+
+def movement_after(db: Session, vehicle_no: str, moved_at: datetime):
+    """The vehicle's first insights_data movement after moved_at (None if there is none)"""
+    return db.query(InsightsData.movement_type, InsightsData.date, InsightsData.time).filter(
+        InsightsData.vehicle_no == vehicle_no,
+        tuple_(InsightsData.date, InsightsData.time) > tuple_(*_moved_at_key(moved_at))
+    ).order_by(InsightsData.date, InsightsData.time).first()
+
+def validate_gate_sequence(db: Session, vehicle_no: str, gate_type: str,
+                           allow_first_gate_out: bool = False, moved_at: Optional[datetime] = None):
+    """Enforce alternating Gate-In / Gate-Out per vehicle from its vehicle_state row.
+
+    Takes the vehicle lock first, so concurrent entries for the same vehicle are checked
+    one after the other. Raises HTTPException(400) on a repeated movement, or on a first
+    movement that is a Gate-Out unless allow_first_gate_out. Returns the movement checked
+    against (None for new vehicles).
+
+    moved_at is the time of a replayed offline entry: when the vehicle has moved since,
+    the entry is checked against the movements just before and just after it instead of
+    the latest one, so it can't end up between two movements of its own type.
+    """
+    lock_vehicle(db, vehicle_no)
+    state = db.get(VehicleState, vehicle_no)
+    if state and moved_at and state.date is not None:
+        if (state.date, state.time or datetime.min.time()) > _moved_at_key(moved_at):
+            following = movement_after(db, vehicle_no, moved_at)
+            if following and following.movement_type == gate_type:
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"Vehicle {vehicle_no} already has a later {gate_type} on "
+                           f"{following.date:%Y-%m-%d} {following.time:%H:%M}. Cannot record another {gate_type} before it."
+                )
+            state = movement_before(db, vehicle_no, moved_at)
+
+    if not state:
+        # First-time vehicle - only Gate-In allowed
+        if gate_type == "Gate-Out" and not allow_first_gate_out:
+            raise HTTPException(
+                status_code=400,
+                detail=f"First entry for vehicle {vehicle_no} must be Gate-In. Cannot do Gate-Out without prior Gate-In."
+            )
+    elif state.movement_type == gate_type:
+        if gate_type == "Gate-In":
+            raise HTTPException(
+                status_code=400,
+                detail=f"Vehicle {vehicle_no} already has Gate-In on {state.date}. Must do Gate-Out first."
+            )
+        else:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Vehicle {vehicle_no} already has Gate-Out on {state.date}. Must do Gate-In first."
+            )
+    return state
+
+def fetch_documents(db: Session, document_nos: List[str]) -> dict:
+    """Load the requested document_data rows in one query, keyed by document_no"""
+    documents = db.query(DocumentData).filter(
+        DocumentData.document_no == any_(bindparam("document_nos", list(document_nos), type_=ARRAY(String)))
+    ).all()
+    return {document.document_no: document for document in documents}
+
+def assign_gate_entry_no(db: Session, document_nos: List[str], gate_entry_no: str):
+    """Stamp gate_entry_no on all given documents with a single UPDATE"""
+    db.execute(
+        update(DocumentData)
+        .where(DocumentData.document_no == any_(bindparam("document_nos", list(document_nos), type_=ARRAY(String))))
+        .values(gate_entry_no=gate_entry_no),
+        execution_options={"synchronize_session": False}
+    )
+
 @router.get("/search-recent-documents/{vehicle_no}")
-def search_recent_documents(
+async def search_recent_documents(
     vehicle_no: str,
-    db: Session = Depends(get_db),
-    current_user: UsersMaster = Depends(get_current_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: UsersMaster = Depends(get_current_user_async)
 ):
     """Search documents within last 48 hours for a vehicle"""
     
@@ -72,7 +191,7 @@ ORDER BY document_date DESC;
 
         """)
         
-        result = db.execute(query, {"vehicle_no": clean_vehicle_no})
+        result = await db.execute(query, {"vehicle_no": clean_vehicle_no})
         documents = result.fetchall()
         
         if not documents:
@@ -123,18 +242,16 @@ ORDER BY document_date DESC;
             )
 
 @router.get("/vehicle-status/{vehicle_no}")
-def get_vehicle_status(
+async def get_vehicle_status(
     vehicle_no: str,
-    db: Session = Depends(get_db),
-    current_user: UsersMaster = Depends(get_current_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: UsersMaster = Depends(get_current_user_async)
 ):
     """Get current gate status of a vehicle"""
     
     clean_vehicle_no = vehicle_no.strip().upper()
     
-    last_entry = db.query(InsightsData).filter(
-        InsightsData.vehicle_no == clean_vehicle_no
-    ).order_by(InsightsData.date.desc(), InsightsData.time.desc()).first()
+    last_entry = await db.get(VehicleState, clean_vehicle_no)
     
     if not last_entry:
         return {
@@ -163,211 +280,204 @@ def get_vehicle_status(
         "message": f"Last movement: {last_entry.movement_type} on {last_entry.date}"
     }
 
-@router.post("/enhanced-batch-gate-entry")
-def create_enhanced_batch_gate_entry(
-    entry: EnhancedGateEntryCreate,
-    db: Session = Depends(get_db),
-    current_user: UsersMaster = Depends(get_current_user)
-):
-    """Enhanced batch gate entry with optional operational data capture"""
-    
-    try:
-        if not entry.document_nos and not entry.vehicle_no:
-            raise HTTPException(status_code=400, detail="Please provide vehicle number or select documents")
-        
-        vehicle_no = entry.vehicle_no.strip().upper()
-        
-        # Check GATE IN/OUT SEQUENCE VALIDATION
-        last_entry = db.query(InsightsData).filter(
-            InsightsData.vehicle_no == vehicle_no
-        ).order_by(InsightsData.date.desc(), InsightsData.time.desc()).first()
+def create_gate_movement(db: Session, entry: EnhancedGateEntryCreate, current_user: UsersMaster,
+                         moved_at: Optional[datetime] = None) -> dict:
+    """Record one enhanced gate entry (sequence check, gate entry number, insights rows,
+    document assignment, vehicle_state) without committing; returns the API response.
 
-        # ✅ NEW: Handle first-time vehicle (no history)
-        if not last_entry:
-            # First-time vehicle - only Gate-In allowed
-            if entry.gate_type == "Gate-Out":
-                raise HTTPException(
-                    status_code=400,
-                    detail=f"First entry for vehicle {vehicle_no} must be Gate-In. Cannot do Gate-Out without prior Gate-In."
-                )
-            # Gate-In is allowed for first-time vehicles - no validation needed
-        else:
-            # ✅ EXISTING: Vehicle has history - apply alternating sequence validation
-            if last_entry.movement_type == entry.gate_type:
-                if entry.gate_type == "Gate-In":
-                    raise HTTPException(
-                        status_code=400,
-                        detail=f"Vehicle {vehicle_no} already has Gate-In on {last_entry.date}. Must do Gate-Out first."
-                    )
-                else:
-                    raise HTTPException(
-                        status_code=400,
-                        detail=f"Vehicle {vehicle_no} already has Gate-Out on {last_entry.date}. Must do Gate-In first."
-                    )
-                
-        # Generate gate entry number
-        gate_entry_no = generate_gate_entry_no_for_user(current_user.username)
-        
-        if not gate_entry_no:
-            user_details = fetch_user_details(current_user.username)
-            if user_details and user_details.get('warehouse_code'):
-                from app.utils.helpers import generate_gate_entry_number
-                gate_entry_no = generate_gate_entry_number(user_details['warehouse_code'])
+    moved_at overrides the movement time (bulk ingest replays entries captured offline).
+    Raises HTTPException on validation errors; the caller owns commit and rollback.
+    """
+    if not entry.document_nos and not entry.vehicle_no:
+        raise HTTPException(status_code=400, detail="Please provide vehicle number or select documents")
+    
+    vehicle_no = entry.vehicle_no.strip().upper()
+    now = moved_at or datetime.now()
+    
+    # Check GATE IN/OUT SEQUENCE VALIDATION
+    validate_gate_sequence(db, vehicle_no, entry.gate_type, moved_at=moved_at)
             
-            if not gate_entry_no:
-                raise HTTPException(
-                    status_code=500,
-                    detail="Failed to generate gate entry number. Please check user warehouse assignment."
+    # Generate gate entry number (replayed entries use the series of their own year)
+    gate_entry_no = generate_gate_entry_no_for_user(db, current_user.username, now.year)
+    
+    if not gate_entry_no:
+        raise HTTPException(
+            status_code=500,
+            detail="Failed to generate gate entry number. Please check user warehouse assignment."
+        )
+    
+    security_name = f"{current_user.first_name} {current_user.last_name}"
+    security_username = current_user.username
+    
+    records_processed = 0
+    processed_documents = []
+    
+    # NEW: Validate operational data if provided
+    operational_data = {}
+    if entry.driver_name and entry.driver_name.strip():
+        if len(entry.driver_name.strip()) < 2:
+            raise HTTPException(status_code=400, detail="Driver name must be at least 2 characters")
+        operational_data['driver_name'] = entry.driver_name.strip()
+    
+    if entry.km_reading and entry.km_reading.strip():
+        km_reading = entry.km_reading.strip()
+        if not km_reading.isdigit() or len(km_reading) < 3 or len(km_reading) > 6:
+            raise HTTPException(status_code=400, detail="KM reading must be 3-6 digits")
+        operational_data['km_reading'] = km_reading
+    
+    if entry.loader_names and entry.loader_names.strip():
+        loader_names = entry.loader_names.strip()
+        names = [name.strip() for name in loader_names.split(',') if name.strip()]
+        if len(names) > 10:
+            raise HTTPException(status_code=400, detail="Maximum 10 loader names allowed")
+        operational_data['loader_names'] = ', '.join(names)
+    
+    # Process documents if provided
+    if entry.document_nos:
+        documents = fetch_documents(db, entry.document_nos)
+        insight_records = []
+        for document_no in entry.document_nos:
+            try:
+                document = documents.get(document_no)
+                
+                if not document:
+                    print(f"Document {document_no} not found, skipping...")
+                    continue
+                
+                # CREATE insights_data entry with operational data
+                insight_record = InsightsData(
+                    gate_entry_no=gate_entry_no,
+                    document_type=document.document_type or "",
+                    sub_document_type=document.sub_document_type or "",
+                    document_no=document.document_no,
+                    vehicle_no=document.vehicle_no or vehicle_no,
+                    warehouse_name=getattr(current_user, 'warehouse_name', f"Warehouse-{current_user.warehouse_code}"),
+                    date=now.date(),
+                    time=now.time(),
+                    movement_type=entry.gate_type,
+                    remarks=entry.remarks or f"Gate entry for {document_no}",
+                    warehouse_code=current_user.warehouse_code,
+                    site_code=current_user.site_code,
+                    security_name=security_name,
+                    security_username=security_username,
+                    document_date=document.document_date,
+                    # NEW: Include operational data if provided
+                    driver_name=operational_data.get('driver_name'),
+                    km_reading=operational_data.get('km_reading'),
+                    loader_names=operational_data.get('loader_names'),
+                    edit_count=0,
+                    last_edited_at=now if operational_data else None
                 )
+                
+                insight_records.append(insight_record)
+                records_processed += 1
+                
+                processed_documents.append({
+                    "document_no": document.document_no,
+                    "document_type": document.document_type,
+                    "vehicle_no": document.vehicle_no,
+                    "status": "success"
+                })
+                
+            except Exception as doc_error:
+                print(f"Error processing document {document_no}: {str(doc_error)}")
+                processed_documents.append({
+                    "document_no": document_no,
+                    "status": "error",
+                    "error": str(doc_error)
+                })
+                continue
         
-        now = datetime.now()
-        security_name = f"{current_user.first_name} {current_user.last_name}"
-        security_username = current_user.username
+        # One multi-row INSERT for insights_data and one UPDATE for document_data
+        if insight_records:
+            db.add_all(insight_records)
+            assign_gate_entry_no(db, [record.document_no for record in insight_records], gate_entry_no)
+    else:
+        # No documents - create single insights entry for empty vehicle
+        insight_record = InsightsData(
+            gate_entry_no=gate_entry_no,
+            document_type="EMPTY VEHICLE",
+            sub_document_type="Empty Vehicle",
+            vehicle_no=vehicle_no,
+            warehouse_name=getattr(current_user, 'warehouse_name', f"Warehouse-{current_user.warehouse_code}"),
+            date=now.date(),
+            time=now.time(),
+            movement_type=entry.gate_type,
+            remarks=entry.remarks or f"Empty vehicle {entry.gate_type}",
+            warehouse_code=current_user.warehouse_code,
+            site_code=current_user.site_code,
+            security_name=security_name,
+            security_username=security_username,
+            # NEW: Include operational data if provided
+            driver_name=operational_data.get('driver_name'),
+            km_reading=operational_data.get('km_reading'),
+            loader_names=operational_data.get('loader_names'),
+            edit_count=0,
+            last_edited_at=now if operational_data else None
+        )
         
-        records_processed = 0
-        processed_documents = []
+        db.add(insight_record)
+        records_processed = 1
+    
+    if records_processed > 0:
+        record_vehicle_movement(db, vehicle_no, entry.gate_type, gate_entry_no, now, current_user.warehouse_code)
         
-        # NEW: Validate operational data if provided
-        operational_data = {}
-        if entry.driver_name and entry.driver_name.strip():
-            if len(entry.driver_name.strip()) < 2:
-                raise HTTPException(status_code=400, detail="Driver name must be at least 2 characters")
-            operational_data['driver_name'] = entry.driver_name.strip()
+        # NEW: Calculate operational completeness
+        has_operational_data = bool(operational_data)
+        operational_complete = all([
+            operational_data.get('driver_name'),
+            operational_data.get('km_reading'), 
+            operational_data.get('loader_names')
+        ])
         
-        if entry.km_reading and entry.km_reading.strip():
-            km_reading = entry.km_reading.strip()
-            if not km_reading.isdigit() or len(km_reading) < 3 or len(km_reading) > 6:
-                raise HTTPException(status_code=400, detail="KM reading must be 3-6 digits")
-            operational_data['km_reading'] = km_reading
+        return {
+            "message": f"Successfully processed {records_processed} records",
+            "gate_entry_no": gate_entry_no,
+            "records_processed": records_processed,
+            "total_requested": len(entry.document_nos) if entry.document_nos else 1,
+            "processed_documents": processed_documents,
+            "date": now.isoformat(),
+            "vehicle_no": vehicle_no,
+            "movement_type": entry.gate_type,
+            # NEW: Operational data status
+            "operational_data_captured": has_operational_data,
+            "operational_complete": operational_complete,
+            "missing_operational_fields": [
+                field for field in ['driver_name', 'km_reading', 'loader_names']
+                if not operational_data.get(field)
+            ],
+            "edit_window_expires": (now + timedelta(hours=48)).isoformat()
+        }
+    else:
+        raise HTTPException(
+            status_code=400,
+            detail="No documents were processed successfully"
+        )
+
+@router.post("/enhanced-batch-gate-entry")
+async def create_enhanced_batch_gate_entry(
+    entry: EnhancedGateEntryCreate,
+    idempotency_key: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: UsersMaster = Depends(get_current_user_async)
+):
+    """Enhanced batch gate entry with optional operational data capture"""
+    # The entry logic is plain ORM code; run_sync runs it on this request's asyncpg
+    # connection, so the DB round trips no longer hold a threadpool worker
+    return await db.run_sync(_create_enhanced_batch_gate_entry, entry, current_user, idempotency_key)
+
+def _create_enhanced_batch_gate_entry(db: Session, entry: EnhancedGateEntryCreate, current_user: UsersMaster,
+                                      idempotency_key: Optional[str] = None):
+    try:
+        replay = begin_idempotent_request(db, idempotency_key, current_user.username, "/enhanced-batch-gate-entry", entry)
+        if replay:
+            return replay
         
-        if entry.loader_names and entry.loader_names.strip():
-            loader_names = entry.loader_names.strip()
-            names = [name.strip() for name in loader_names.split(',') if name.strip()]
-            if len(names) > 10:
-                raise HTTPException(status_code=400, detail="Maximum 10 loader names allowed")
-            operational_data['loader_names'] = ', '.join(names)
-        
-        # Process documents if provided
-        if entry.document_nos:
-            for document_no in entry.document_nos:
-                try:
-                    document = db.query(DocumentData).filter(
-                        DocumentData.document_no == document_no
-                    ).first()
-                    
-                    if not document:
-                        print(f"Document {document_no} not found, skipping...")
-                        continue
-                    
-                    # UPDATE document_data with gate_entry_no
-                    document.gate_entry_no = gate_entry_no
-                    
-                    # CREATE insights_data entry with operational data
-                    insight_record = InsightsData(
-                        gate_entry_no=gate_entry_no,
-                        document_type=document.document_type or "",
-                        sub_document_type=document.sub_document_type or "",
-                        document_no=document.document_no,
-                        vehicle_no=document.vehicle_no or vehicle_no,
-                        warehouse_name=getattr(current_user, 'warehouse_name', f"Warehouse-{current_user.warehouse_code}"),
-                        date=now.date(),
-                        time=now.time(),
-                        movement_type=entry.gate_type,
-                        remarks=entry.remarks or f"Gate entry for {document_no}",
-                        warehouse_code=current_user.warehouse_code,
-                        site_code=current_user.site_code,
-                        security_name=security_name,
-                        security_username=security_username,
-                        document_date=document.document_date,
-                        # NEW: Include operational data if provided
-                        driver_name=operational_data.get('driver_name'),
-                        km_reading=operational_data.get('km_reading'),
-                        loader_names=operational_data.get('loader_names'),
-                        edit_count=0,
-                        last_edited_at=now if operational_data else None
-                    )
-                    
-                    db.add(insight_record)
-                    records_processed += 1
-                    
-                    processed_documents.append({
-                        "document_no": document.document_no,
-                        "document_type": document.document_type,
-                        "vehicle_no": document.vehicle_no,
-                        "status": "success"
-                    })
-                    
-                except Exception as doc_error:
-                    print(f"Error processing document {document_no}: {str(doc_error)}")
-                    processed_documents.append({
-                        "document_no": document_no,
-                        "status": "error",
-                        "error": str(doc_error)
-                    })
-                    continue
-        else:
-            # No documents - create single insights entry for empty vehicle
-            insight_record = InsightsData(
-                gate_entry_no=gate_entry_no,
-                document_type=document.document_type or "",
-                sub_document_type=document.sub_document_type or "",
-                document_no=document.document_no,  # NEW FIELD
-                vehicle_no=document.vehicle_no or vehicle_no,           
-                warehouse_name=getattr(current_user, 'warehouse_name', f"Warehouse-{current_user.warehouse_code}"),
-                date=now.date(),
-                time=now.time(),
-                movement_type=entry.gate_type,
-                remarks=entry.remarks or f"Empty vehicle {entry.gate_type}",
-                warehouse_code=current_user.warehouse_code,
-                site_code=current_user.site_code,
-                security_name=security_name,
-                security_username=security_username,
-                # NEW: Include operational data if provided
-                driver_name=operational_data.get('driver_name'),
-                km_reading=operational_data.get('km_reading'),
-                loader_names=operational_data.get('loader_names'),
-                edit_count=0,
-                last_edited_at=now if operational_data else None
-            )
-            
-            db.add(insight_record)
-            records_processed = 1
+        response = create_gate_movement(db, entry, current_user)
         
-        if records_processed > 0:
-            db.commit()
-            
-            # NEW: Calculate operational completeness
-            has_operational_data = bool(operational_data)
-            operational_complete = all([
-                operational_data.get('driver_name'),
-                operational_data.get('km_reading'), 
-                operational_data.get('loader_names')
-            ])
-            
-            return {
-                "message": f"Successfully processed {records_processed} records",
-                "gate_entry_no": gate_entry_no,
-                "records_processed": records_processed,
-                "total_requested": len(entry.document_nos) if entry.document_nos else 1,
-                "processed_documents": processed_documents,
-                "date": now.isoformat(),
-                "vehicle_no": vehicle_no,
-                "movement_type": entry.gate_type,
-                # NEW: Operational data status
-                "operational_data_captured": has_operational_data,
-                "operational_complete": operational_complete,
-                "missing_operational_fields": [
-                    field for field in ['driver_name', 'km_reading', 'loader_names']
-                    if not operational_data.get(field)
-                ],
-                "edit_window_expires": (now + timedelta(hours=48)).isoformat()
-            }
-        else:
-            db.rollback()
-            raise HTTPException(
-                status_code=400,
-                detail="No documents were processed successfully"
-            )
+        save_idempotent_response(db, idempotency_key, current_user.username, response)
+        db.commit()
+        return response
             
     except HTTPException:
         raise
@@ -382,60 +492,33 @@ def create_enhanced_batch_gate_entry(
 @router.post("/batch-gate-entry")
 def create_batch_gate_entry(
     entry: BatchGateEntryCreate,
+    idempotency_key: Optional[str] = Header(None),
     db: Session = Depends(get_db),
     current_user: UsersMaster = Depends(get_current_user)
 ):
     """Batch gate entry with RAW SQL gate entry number generation"""
     
     try:
+        replay = begin_idempotent_request(db, idempotency_key, current_user.username, "/batch-gate-entry", entry)
+        if replay:
+            return replay
+        
         if not entry.document_nos:
             raise HTTPException(status_code=400, detail="Please select at least one document")
         
         vehicle_no = entry.vehicle_no.strip().upper()
         
         # Check GATE IN/OUT SEQUENCE VALIDATION
-        last_entry = db.query(InsightsData).filter(
-            InsightsData.vehicle_no == vehicle_no
-        ).order_by(InsightsData.date.desc(), InsightsData.time.desc()).first()
-
-        # ✅ NEW: Handle first-time vehicle (no history)
-        if not last_entry:
-            # First-time vehicle - only Gate-In allowed
-            if entry.gate_type == "Gate-Out":
-                raise HTTPException(
-                    status_code=400,
-                    detail=f"First entry for vehicle {vehicle_no} must be Gate-In. Cannot do Gate-Out without prior Gate-In."
-                )
-            # Gate-In is allowed for first-time vehicles - no validation needed
-        else:
-            # ✅ EXISTING: Vehicle has history - apply alternating sequence validation
-            if last_entry.movement_type == entry.gate_type:
-                if entry.gate_type == "Gate-In":
-                    raise HTTPException(
-                        status_code=400,
-                        detail=f"Vehicle {vehicle_no} already has Gate-In on {last_entry.date}. Must do Gate-Out first."
-                    )
-                else:
-                    raise HTTPException(
-                        status_code=400,
-                        detail=f"Vehicle {vehicle_no} already has Gate-Out on {last_entry.date}. Must do Gate-In first."
-                    )
-        
-        # RAW SQL: Generate gate entry number using fresh database data
-        gate_entry_no = generate_gate_entry_no_for_user(current_user.username)
+        validate_gate_sequence(db, vehicle_no, entry.gate_type)
+        
+        # Generate gate entry number using fresh database data
+        gate_entry_no = generate_gate_entry_no_for_user(db, current_user.username)
         
         if not gate_entry_no:
-            # Fallback: Get fresh user details and try again
-            user_details = fetch_user_details(current_user.username)
-            if user_details and user_details.get('warehouse_code'):
-                from app.utils.helpers import generate_gate_entry_number
-                gate_entry_no = generate_gate_entry_number(user_details['warehouse_code'])
-            
-            if not gate_entry_no:
-                raise HTTPException(
-                    status_code=500,
-                    detail="Failed to generate gate entry number. Please check user warehouse assignment."
-                )
+            raise HTTPException(
+                status_code=500,
+                detail="Failed to generate gate entry number. Please check user warehouse assignment."
+            )
         
         now = datetime.now()
         
@@ -447,19 +530,16 @@ def create_batch_gate_entry(
         processed_documents = []
         
         # Process each selected document
+        documents = fetch_documents(db, entry.document_nos)
+        insight_records = []
         for document_no in entry.document_nos:
             try:
-                document = db.query(DocumentData).filter(
-                    DocumentData.document_no == document_no
-                ).first()
+                document = documents.get(document_no)
                 
                 if not document:
                     print(f"Document {document_no} not found, skipping...")
                     continue
                 
-                # UPDATE document_data with gate_entry_no
-                document.gate_entry_no = gate_entry_no
-                
                 # CREATE insights_data entry
                 insight_record = InsightsData(
                     gate_entry_no=gate_entry_no,
@@ -480,7 +560,7 @@ def create_batch_gate_entry(
                     edit_count=0
                 )
                 
-                db.add(insight_record)
+                insight_records.append(insight_record)
                 records_processed += 1
                 
                 processed_documents.append({
@@ -500,9 +580,12 @@ def create_batch_gate_entry(
                 continue
         
         if records_processed > 0:
-            db.commit()
+            # One multi-row INSERT for insights_data and one UPDATE for document_data
+            db.add_all(insight_records)
+            assign_gate_entry_no(db, [record.document_no for record in insight_records], gate_entry_no)
+            record_vehicle_movement(db, vehicle_no, entry.gate_type, gate_entry_no, now, current_user.warehouse_code)
             
-            return {
+            response = {
                 "message": f"Successfully processed {records_processed} records",
                 "gate_entry_no": gate_entry_no,
                 "records_processed": records_processed,
@@ -512,6 +595,10 @@ def create_batch_gate_entry(
                 "vehicle_no": vehicle_no,
                 "movement_type": entry.gate_type
             }
+
+            save_idempotent_response(db, idempotency_key, current_user.username, response)
+            db.commit()
+            return response
         else:
             db.rollback()
             raise HTTPException(
@@ -532,59 +619,33 @@ def create_batch_gate_entry(
 @router.post("/enhanced-manual-gate-entry", response_model=GateEntryResponse)
 def create_enhanced_manual_gate_entry(
     entry: EnhancedManualGateEntryCreate,
+    idempotency_key: Optional[str] = Header(None),
     db: Session = Depends(get_db),
     current_user: UsersMaster = Depends(get_current_user)
 ):
     """Enhanced manual gate entry with operational data capture"""
     
     try:
+        replay = begin_idempotent_request(db, idempotency_key, current_user.username, "/enhanced-manual-gate-entry", entry)
+        if replay:
+            return replay
+        
         if not entry.vehicle_no.strip():
             raise HTTPException(status_code=400, detail="Vehicle number is required")
         
         vehicle_no = entry.vehicle_no.strip().upper()
         
         # Check GATE IN/OUT SEQUENCE VALIDATION
-        last_entry = db.query(InsightsData).filter(
-            InsightsData.vehicle_no == vehicle_no
-        ).order_by(InsightsData.date.desc(), InsightsData.time.desc()).first()
-
-        # ✅ NEW: Handle first-time vehicle (no history)
-        if not last_entry:
-            # First-time vehicle - only Gate-In allowed
-            if entry.gate_type == "Gate-Out":
-                raise HTTPException(
-                    status_code=400,
-                    detail=f"First entry for vehicle {vehicle_no} must be Gate-In. Cannot do Gate-Out without prior Gate-In."
-                )
-            # Gate-In is allowed for first-time vehicles - no validation needed
-        else:
-            # ✅ EXISTING: Vehicle has history - apply alternating sequence validation
-            if last_entry.movement_type == entry.gate_type:
-                if entry.gate_type == "Gate-In":
-                    raise HTTPException(
-                        status_code=400,
-                        detail=f"Vehicle {vehicle_no} already has Gate-In on {last_entry.date}. Must do Gate-Out first."
-                    )
-                else:
-                    raise HTTPException(
-                        status_code=400,
-                        detail=f"Vehicle {vehicle_no} already has Gate-Out on {last_entry.date}. Must do Gate-In first."
-                    )
+        validate_gate_sequence(db, vehicle_no, entry.gate_type)
         
         # Generate gate entry number
-        gate_entry_no = generate_gate_entry_no_for_user(current_user.username)
+        gate_entry_no = generate_gate_entry_no_for_user(db, current_user.username)
         
         if not gate_entry_no:
-            user_details = fetch_user_details(current_user.username)
-            if user_details and user_details.get('warehouse_code'):
-                from app.utils.helpers import generate_gate_entry_number
-                gate_entry_no = generate_gate_entry_number(user_details['warehouse_code'])
-            
-            if not gate_entry_no:
-                raise HTTPException(
-                    status_code=500,
-                    detail="Failed to generate gate entry number. Please check user warehouse assignment."
-                )
+            raise HTTPException(
+                status_code=500,
+                detail="Failed to generate gate entry number. Please check user warehouse assignment."
+            )
         
         now = datetime.now()
         to_warehouse_code = None        
@@ -625,9 +686,9 @@ def create_enhanced_manual_gate_entry(
         )
         
         db.add(insight_record)
-        db.commit()
+        record_vehicle_movement(db, vehicle_no, entry.gate_type, gate_entry_no, now, current_user.warehouse_code)
         
-        return GateEntryResponse(
+        response = GateEntryResponse(
             gate_entry_no=gate_entry_no,
             date=now,
             time=now,
@@ -636,6 +697,10 @@ def create_enhanced_manual_gate_entry(
             warehouse_name=f"Warehouse-{current_user.warehouse_code}",
             movement_type=entry.gate_type
         )
+
+        save_idempotent_response(db, idempotency_key, current_user.username, response)
+        db.commit()
+        return response
         
     except HTTPException:
         raise
@@ -650,60 +715,33 @@ def create_enhanced_manual_gate_entry(
 @router.post("/manual-gate-entry", response_model=GateEntryResponse)
 def create_manual_gate_entry(
     entry: ManualGateEntryCreate,
+    idempotency_key: Optional[str] = Header(None),
     db: Session = Depends(get_db),
     current_user: UsersMaster = Depends(get_current_user)
 ):
     """Manual gate entry with RAW SQL gate entry number generation"""
     
     try:
+        replay = begin_idempotent_request(db, idempotency_key, current_user.username, "/manual-gate-entry", entry)
+        if replay:
+            return replay
+        
         if not entry.vehicle_no.strip():
             raise HTTPException(status_code=400, detail="Vehicle number is required")
         
         vehicle_no = entry.vehicle_no.strip().upper()
         
         # Check GATE IN/OUT SEQUENCE VALIDATION
-        last_entry = db.query(InsightsData).filter(
-            InsightsData.vehicle_no == vehicle_no
-        ).order_by(InsightsData.date.desc(), InsightsData.time.desc()).first()
-
-        # ✅ NEW: Handle first-time vehicle (no history)
-        if not last_entry:
-            # First-time vehicle - only Gate-In allowed
-            if entry.gate_type == "Gate-Out":
-                raise HTTPException(
-                    status_code=400,
-                    detail=f"First entry for vehicle {vehicle_no} must be Gate-In. Cannot do Gate-Out without prior Gate-In."
-                )
-            # Gate-In is allowed for first-time vehicles - no validation needed
-        else:
-            # ✅ EXISTING: Vehicle has history - apply alternating sequence validation
-            if last_entry.movement_type == entry.gate_type:
-                if entry.gate_type == "Gate-In":
-                    raise HTTPException(
-                        status_code=400,
-                        detail=f"Vehicle {vehicle_no} already has Gate-In on {last_entry.date}. Must do Gate-Out first."
-                    )
-                else:
-                    raise HTTPException(
-                        status_code=400,
-                        detail=f"Vehicle {vehicle_no} already has Gate-Out on {last_entry.date}. Must do Gate-In first."
-                    )
-        
-        # RAW SQL: Generate gate entry number using fresh database data
-        gate_entry_no = generate_gate_entry_no_for_user(current_user.username)
+        validate_gate_sequence(db, vehicle_no, entry.gate_type)
+        
+        # Generate gate entry number using fresh database data
+        gate_entry_no = generate_gate_entry_no_for_user(db, current_user.username)
         
         if not gate_entry_no:
-            # Fallback: Get fresh user details and try again
-            user_details = fetch_user_details(current_user.username)
-            if user_details and user_details.get('warehouse_code'):
-                from app.utils.helpers import generate_gate_entry_number
-                gate_entry_no = generate_gate_entry_number(user_details['warehouse_code'])
-            
-            if not gate_entry_no:
-                raise HTTPException(
-                    status_code=500,
-                    detail="Failed to generate gate entry number. Please check user warehouse assignment."
-                )
+            raise HTTPException(
+                status_code=500,
+                detail="Failed to generate gate entry number. Please check user warehouse assignment."
+            )
         
         now = datetime.now()
         
@@ -728,9 +766,9 @@ def create_manual_gate_entry(
         )
         
         db.add(insight_record)
-        db.commit()
+        record_vehicle_movement(db, vehicle_no, entry.gate_type, gate_entry_no, now, current_user.warehouse_code)
         
-        return GateEntryResponse(
+        response = GateEntryResponse(
             gate_entry_no=gate_entry_no,
             date=now,
             time=now,
@@ -739,6 +777,10 @@ def create_manual_gate_entry(
             warehouse_name=f"Warehouse-{current_user.warehouse_code}",
             movement_type=entry.gate_type
         )
+
+        save_idempotent_response(db, idempotency_key, current_user.username, response)
+        db.commit()
+        return response
         
     except HTTPException:
         raise
@@ -909,6 +951,10 @@ def assign_document_to_manual_entry(
         # Update document record with gate entry number
         document_record.gate_entry_no = insights_record.gate_entry_no
         
+        # Manual entries can be assigned at any age, so the edit may land on a rolled-up day
+        if insights_record.date:
+            refresh_rolled_up_day(db, insights_record.date.date(), insights_record.warehouse_code)
+        
         db.commit()
         
         return {
@@ -951,7 +997,7 @@ def get_documents_by_vehicle(
     clean_vehicle_no = vehicle_no.strip().upper()
     
     documents = db.query(DocumentData).filter(
-        DocumentData.vehicle_no.ilike(f"%{clean_vehicle_no}%")
+        DocumentData.vehicle_no_norm.like(vehicle_search_pattern(clean_vehicle_no))
     ).all()
     
     if not documents:
@@ -983,19 +1029,52 @@ def get_documents_by_vehicle(
         for doc in documents
     ]
 
+def _history_dict(move: InsightsData) -> dict:
+    return {
+        "gate_entry_no": move.gate_entry_no,
+        "date": move.date,
+        "time": move.time,
+        "movement_type": move.movement_type,
+        "warehouse_name": move.warehouse_name,
+        "document_type": move.document_type,
+        "security_name": move.security_name,
+        "remarks": move.remarks,
+        # NEW: Include operational data in history
+        "driver_name": move.driver_name,
+        "km_reading": move.km_reading,
+        "loader_names": move.loader_names,
+        "edit_count": move.edit_count or 0
+    }
+
 @router.get("/vehicle-history/{vehicle_no}")
 def get_vehicle_history(
     vehicle_no: str,
+    stream: Optional[str] = None,
     db: Session = Depends(get_db),
     current_user: UsersMaster = Depends(get_current_user)
 ):
-    """Get complete movement history for a vehicle"""
+    """Get complete movement history for a vehicle.
+
+    ?stream=json or ?stream=ndjson streams just the history entries as a JSON array /
+    one object per line.
+    """
     
     clean_vehicle_no = vehicle_no.strip().upper()
+    mode = stream_format(stream)
+    vehicle_filter = InsightsData.vehicle_no_norm.like(vehicle_search_pattern(clean_vehicle_no))
+    order = (InsightsData.date.desc(), InsightsData.time.desc())
     
-    movements = db.query(InsightsData).filter(
-        InsightsData.vehicle_no.ilike(f"%{clean_vehicle_no}%")
-    ).order_by(InsightsData.date.desc(), InsightsData.time.desc()).all()
+    if mode:
+        # 404 must be decided before the response starts
+        if db.query(InsightsData.id).filter(vehicle_filter).first() is None:
+            raise HTTPException(
+                status_code=404,
+                detail=f"No movement history found for vehicle: {vehicle_no}"
+            )
+        query = select(InsightsData).where(vehicle_filter).order_by(*order)
+        return stream_response(mode, stream_rows(query, lambda row: _history_dict(row.InsightsData)))
+    
+    movements = db.query(InsightsData).filter(vehicle_filter).order_by(*order).all()
     
     if not movements:
         raise HTTPException(
@@ -1006,24 +1085,7 @@ def get_vehicle_history(
     return {
         "vehicle_no": clean_vehicle_no,
         "total_movements": len(movements),
-        "history": [
-            {
-                "gate_entry_no": move.gate_entry_no,
-                "date": move.date,
-                "time": move.time,
-                "movement_type": move.movement_type,
-                "warehouse_name": move.warehouse_name,
-                "document_type": move.document_type,
-                "security_name": move.security_name,
-                "remarks": move.remarks,
-                # NEW: Include operational data in history
-                "driver_name": move.driver_name,
-                "km_reading": move.km_reading,
-                "loader_names": move.loader_names,
-                "edit_count": move.edit_count or 0
-            }
-            for move in movements
-        ]
+        "history": [_history_dict(move) for move in movements]
     }
 
 @router.get("/operational-summary")
@@ -1033,20 +1095,33 @@ def get_operational_data_summary(
 ):
     """Get summary of operational data completion rates"""
     try:
-        # Base query with warehouse filter
-        base_query = db.query(InsightsData)
-        if current_user.role != "Admin":
-            base_query = base_query.filter(
-                InsightsData.warehouse_code == current_user.warehouse_code
-            )
+        # Warehouse filter (applied to insights_data and to its daily rollups)
+        def scope(model):
+            if current_user.role != "Admin":
+                return [model.warehouse_code == current_user.warehouse_code]
+            return []
         
-        # Get records from last 7 days
+        # Records from last 7 days: rolled-up days from insights_daily_rollup, the rest from raw rows
         seven_days_ago = datetime.now() - timedelta(days=7)
-        recent_records = base_query.filter(
-            InsightsData.date >= seven_days_ago.date()
-        ).all()
-        
-        if not recent_records:
+        span = rollup_span(db, seven_days_ago.date())
+        driver, km, loaders = (operational_field_filled(getattr(InsightsData, field))
+                               for field in ('driver_name', 'km_reading', 'loader_names'))
+        stats = db.query(
+            func.count().label("movements"),
+            func.count().filter(driver, km, loaders).label("operational_complete"),
+            func.count().filter(~driver).label("missing_driver"),
+            func.count().filter(~km).label("missing_km"),
+            func.count().filter(~loaders).label("missing_loaders"),
+            func.count().filter(func.coalesce(InsightsData.edit_count, 0) > 1).label("multiple_edits")
+        ).filter(
+            *scope(InsightsData),
+            InsightsData.date >= seven_days_ago.date(),
+            outside_span(InsightsData.date, span)
+        ).one()
+        rolled_up = rollup_totals(db, InsightsDailyRollup, span, scope, list(stats._fields))
+        totals = {field: stats._mapping[field] + rolled_up[field] for field in stats._fields}
+        
+        if not totals["movements"]:
             return {
                 "total_records": 0,
                 "completion_stats": {},
@@ -1054,31 +1129,12 @@ def get_operational_data_summary(
             }
         
         # Calculate completion statistics
-        total_records = len(recent_records)
-        complete_operational = 0
-        missing_driver = 0
-        missing_km = 0
-        missing_loaders = 0
-        multiple_edits = 0
-        
-        for record in recent_records:
-            # Check operational completeness
-            if (record.driver_name and record.driver_name.strip() and
-                record.km_reading and record.km_reading.strip() and
-                record.loader_names and record.loader_names.strip()):
-                complete_operational += 1
-            
-            # Count missing fields
-            if not (record.driver_name and record.driver_name.strip()):
-                missing_driver += 1
-            if not (record.km_reading and record.km_reading.strip()):
-                missing_km += 1
-            if not (record.loader_names and record.loader_names.strip()):
-                missing_loaders += 1
-            
-            # Count records with multiple edits
-            if (record.edit_count or 0) > 1:
-                multiple_edits += 1
+        total_records = totals["movements"]
+        complete_operational = totals["operational_complete"]
+        missing_driver = totals["missing_driver"]
+        missing_km = totals["missing_km"]
+        missing_loaders = totals["missing_loaders"]
+        multiple_edits = totals["multiple_edits"]
         
         completion_percentage = (complete_operational / total_records * 100) if total_records > 0 else 0
         
@@ -1117,49 +1173,33 @@ def get_operational_data_summary(
 @router.post("/multi-document-manual-entry")
 def create_multi_document_manual_entry(
     entry: MultiDocumentManualEntryCreate,
+    idempotency_key: Optional[str] = Header(None),
     db: Session = Depends(get_db),
     current_user: UsersMaster = Depends(get_current_user)
 ):
     """Create multiple manual gate entries with same gate entry number OR single empty vehicle entry"""
     
     try:
+        replay = begin_idempotent_request(db, idempotency_key, current_user.username, "/multi-document-manual-entry", entry)
+        if replay:
+            return replay
+        
         if not entry.vehicle_no.strip():
             raise HTTPException(status_code=400, detail="Vehicle number is required")
         
         vehicle_no = entry.vehicle_no.strip().upper()
         
-        # Check GATE IN/OUT SEQUENCE VALIDATION
-        last_entry = db.query(InsightsData).filter(
-            InsightsData.vehicle_no == vehicle_no
-        ).order_by(InsightsData.date.desc(), InsightsData.time.desc()).first()
-        
-        if last_entry:
-            if last_entry.movement_type == entry.gate_type:
-                if entry.gate_type == "Gate-In":
-                    raise HTTPException(
-                        status_code=400,
-                        detail=f"Vehicle {vehicle_no} already has Gate-In. Must do Gate-Out first."
-                    )
-                else:
-                    raise HTTPException(
-                        status_code=400,
-                        detail=f"Vehicle {vehicle_no} already has Gate-Out. Must do Gate-In first."
-                    )
+        # Check GATE IN/OUT SEQUENCE VALIDATION (first movement may be either type here)
+        validate_gate_sequence(db, vehicle_no, entry.gate_type, allow_first_gate_out=True)
         
         # Generate gate entry number (same for all entries)
-        gate_entry_no = generate_gate_entry_no_for_user(current_user.username)
+        gate_entry_no = generate_gate_entry_no_for_user(db, current_user.username)
         
         if not gate_entry_no:
-            user_details = fetch_user_details(current_user.username)
-            if user_details and user_details.get('warehouse_code'):
-                from app.utils.helpers import generate_gate_entry_number
-                gate_entry_no = generate_gate_entry_number(user_details['warehouse_code'])
-            
-            if not gate_entry_no:
-                raise HTTPException(
-                    status_code=500,
-                    detail="Failed to generate gate entry number. Please check user warehouse assignment."
-                )
+            raise HTTPException(
+                status_code=500,
+                detail="Failed to generate gate entry number. Please check user warehouse assignment."
+            )
         
         now = datetime.now()
         to_warehouse_code = None        
@@ -1240,10 +1280,10 @@ def create_multi_document_manual_entry(
             next_step = "Assign documents from insights tab when available"
             entry_type = "manual"
         
-        db.commit()
+        record_vehicle_movement(db, vehicle_no, entry.gate_type, gate_entry_no, now, current_user.warehouse_code)
         
         # ✅ UPDATED: Enhanced response with empty vehicle support
-        return {
+        response = {
             "message": f"Successfully created {entries_created} {entry_type.replace('_', ' ')} entr{'y' if entries_created == 1 else 'ies'}",
             "gate_entry_no": gate_entry_no,
             "vehicle_no": vehicle_no,
@@ -1255,6 +1295,10 @@ def create_multi_document_manual_entry(
             "entry_type": entry_type,  # ✅ NEW: "empty_vehicle" or "manual"
             "is_empty_vehicle": entry.no_of_documents == 0  # ✅ NEW: Flag for frontend
         }
+
+        save_idempotent_response(db, idempotency_key, current_user.username, response)
+        db.commit()
+        return response
         
     except HTTPException:
         raise
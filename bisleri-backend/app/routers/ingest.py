@@ -0,0 +1,134 @@
+# app/routers/ingest.py - Bulk replay of gate and raw material entries queued offline
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy.orm import Session
+from app.config import settings
+from app.database import get_db
+from app.schemas import BulkIngestRequest, BulkIngestItem
+from app.models import UsersMaster
+from app.auth import get_current_user
+from app.routers.gate import create_gate_movement
+from app.routers.raw_materials import create_raw_materials_record
+from app.utils.idempotency import claim_idempotency_key, save_idempotent_response
+from app.services.rollups import refresh_rolled_up_day
+from datetime import datetime, timedelta
+
+router = APIRouter(tags=["Bulk Ingest"])
+
+# Items replay with the idempotency scope of the matching single-entry endpoint, so an
+# entry that did reach the server before the connection dropped is not created twice
+ITEM_ENDPOINTS = {
+    "gate": "/enhanced-batch-gate-entry",
+    "raw_material": "/rm/create-entry",
+}
+
+def item_payload(item: BulkIngestItem):
+    return item.gate_entry if item.entry_type == "gate" else item.raw_material_entry
+
+def client_time(item: BulkIngestItem) -> datetime:
+    """Client timestamp as server-local naive time, like the rest of the gate data"""
+    timestamp = item.client_timestamp
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone().replace(tzinfo=None)
+    return timestamp
+
+def ingest_item(db: Session, item: BulkIngestItem, current_user: UsersMaster) -> dict:
+    """Create (or replay) one queued entry in the current transaction"""
+    payload = item_payload(item)
+    if payload is None:
+        raise HTTPException(status_code=400, detail=f"Missing {item.entry_type}_entry for entry type {item.entry_type}")
+
+    recorded_at = client_time(item)
+    if recorded_at > datetime.now() + timedelta(minutes=settings.BULK_INGEST_MAX_CLOCK_SKEW_MINUTES):
+        raise HTTPException(status_code=400, detail="Client timestamp is in the future")
+
+    endpoint = ITEM_ENDPOINTS[item.entry_type]
+    original = claim_idempotency_key(db, item.idempotency_key, current_user.username, endpoint, payload)
+    if original is not None:
+        return {"status": "replayed", "status_code": original.status_code, "response": original.response}
+
+    if item.entry_type == "gate":
+        response = create_gate_movement(db, payload, current_user, moved_at=recorded_at)
+    else:
+        response = create_raw_materials_record(db, payload, current_user, recorded_at=recorded_at)
+    # Entries replayed days later land on a day the dashboards may already read from rollups
+    refresh_rolled_up_day(db, recorded_at.date(), current_user.warehouse_code)
+
+    save_idempotent_response(db, item.idempotency_key, current_user.username, response)
+    return {"status": "created", "status_code": 200, "response": jsonable_encoder(response)}
+
+@router.post("/bulk-ingest")
+def bulk_ingest(
+    request: BulkIngestRequest,
+    db: Session = Depends(get_db),
+    current_user: UsersMaster = Depends(get_current_user)
+):
+    """Replay a batch of entries queued offline by the gate app.
+
+    Entries are grouped per vehicle and applied in the order sent, so Gate-In/Gate-Out
+    sequencing is checked the same way as for live entries. Each vehicle is committed in
+    its own transaction and each entry runs in a savepoint, so one rejected entry does not
+    undo the others. Returns one result per item, in request order.
+    """
+    if not request.items:
+        raise HTTPException(status_code=400, detail="No entries to ingest")
+    if len(request.items) > settings.BULK_INGEST_MAX_ITEMS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {settings.BULK_INGEST_MAX_ITEMS} entries per request"
+        )
+
+    # vehicle -> [(index, item)], vehicles in order of first appearance
+    vehicles = {}
+    for index, item in enumerate(request.items):
+        payload = item_payload(item)
+        # Same vehicle key as the gate sequence check (vehicle_state)
+        vehicle_no = payload.vehicle_no.strip().upper() if payload is not None else ""
+        vehicles.setdefault(vehicle_no, []).append((index, item))
+
+    results = [None] * len(request.items)
+    for vehicle_no, items in vehicles.items():
+        for index, item in items:
+            result = {
+                "index": index,
+                "idempotency_key": item.idempotency_key,
+                "entry_type": item.entry_type,
+                "vehicle_no": vehicle_no,
+            }
+            savepoint = db.begin_nested()
+            try:
+                result.update(ingest_item(db, item, current_user))
+                savepoint.commit()
+            except HTTPException as e:
+                savepoint.rollback()
+                result.update({"status": "rejected", "status_code": e.status_code, "error": e.detail})
+            except Exception as e:
+                savepoint.rollback()
+                print(f"Bulk ingest error for {item.idempotency_key}: {str(e)}")
+                result.update({"status": "failed", "status_code": 500, "error": f"Database error: {str(e)}"})
+            results[index] = result
+
+        try:
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            print(f"Bulk ingest commit error for vehicle {vehicle_no}: {str(e)}")
+            for index, _ in items:
+                if results[index]["status"] in ("created", "replayed"):
+                    results[index].update({
+                        "status": "failed",
+                        "status_code": 500,
+                        "error": f"Database error: {str(e)}",
+                        "response": None
+                    })
+
+    summary = {status: 0 for status in ("created", "replayed", "rejected", "failed")}
+    for result in results:
+        summary[result["status"]] += 1
+
+    return {
+        "message": f"Processed {len(results)} entries for {len(vehicles)} vehicles",
+        "total": len(results),
+        **summary,
+        "results": results
+    }
@@ -1,127 +1,280 @@
 # app/routers/insights.py - UPDATED WITH OPERATIONAL EDIT LOGIC
 from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from sqlalchemy import text
-from datetime import datetime, timedelta
-from app.database import get_db
-from app.models import InsightsData, DocumentData
+from sqlalchemy import Date, cast, func, select, text, tuple_, union_all
+from datetime import datetime, time, timedelta
+from app.config import settings
+from app.database import get_db, get_async_db
+from app.models import InsightsData, DocumentData, InsightsDailyRollup
+from app.models.insights import (
+    edit_state_columns, edit_status_expression, edit_button_config,
+    operational_field_filled, seconds_since_entry
+)
 from app.schemas import InsightsFilter, OperationalDataEdit, EnhancedMovementResponse, EditStatistics, KMReadingContext
-from app.auth import get_current_user
+from app.auth import get_current_user, get_current_user_async
+from app.utils.helpers import vehicle_search_pattern
+from app.utils.streaming import (
+    export_format, export_response, stream_format, stream_response, stream_rows, stream_rows_async
+)
+from app.services.rollups import rollup_span, outside_span, rollup_totals
 from app.models import UsersMaster 
 from pydantic import BaseModel
 from typing import Optional, List
+import base64
+import json
 
 router = APIRouter(tags=["Insights"])
 
+def _as_datetime(value):
+    """Filter dates arrive as ISO strings; asyncpg needs real datetime parameters.
+
+    Timezone-aware values become server-local naive time, like the timestamp columns.
+    """
+    if not isinstance(value, datetime):
+        try:
+            value = datetime.fromisoformat(str(value))
+        except ValueError:
+            raise HTTPException(status_code=400, detail=f"Invalid date: {value}")
+    if value.tzinfo is not None:
+        value = value.astimezone().replace(tzinfo=None)
+    return value
+
+# Keyset of /filtered-movements: date and time are nullable, so rows are ordered (and
+# the cursor compared) on the values with NULL replaced by the lowest date / time,
+# which puts rows without a date or time last
+MISSING_DATE = datetime.min
+MISSING_TIME = time.min
+MOVEMENT_KEYSET = (
+    func.coalesce(InsightsData.date, MISSING_DATE),
+    func.coalesce(InsightsData.time, MISSING_TIME),
+    InsightsData.id,
+)
+
+def _encode_cursor(movement) -> str:
+    """Opaque keyset cursor for the (date, time, id) position of the last row on a page"""
+    position = [
+        (movement.date or MISSING_DATE).isoformat(),
+        (movement.time or MISSING_TIME).isoformat(),
+        movement.id
+    ]
+    return base64.urlsafe_b64encode(json.dumps(position).encode()).decode()
+
+def _decode_cursor(cursor: str):
+    try:
+        date_value, time_value, row_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(date_value), time.fromisoformat(time_value), int(row_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def _page_size(filters: dict) -> int:
+    try:
+        page_size = int(filters.get('page_size') or settings.FILTERED_MOVEMENTS_PAGE_SIZE)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="page_size must be a number")
+    return max(1, min(page_size, settings.FILTERED_MOVEMENTS_MAX_PAGE_SIZE))
+
+def _movement_filters(filters: dict, current_user: UsersMaster) -> list:
+    """WHERE conditions of /filtered-movements (and its export) for `filters` and the user's scope"""
+    conditions = []
+    
+    # Date filters
+    if filters.get('from_date'):
+        conditions.append(InsightsData.date >= _as_datetime(filters['from_date']))
+    if filters.get('to_date'):
+        conditions.append(InsightsData.date <= _as_datetime(filters['to_date']))
+        
+    # ✅ ADD WAREHOUSE CODE FILTER HERE
+    if filters.get('warehouse_code'):
+        conditions.append(InsightsData.warehouse_code == filters['warehouse_code'])
+        
+    # ✅ ADD SITE CODE FILTER HERE  
+    if filters.get('site_code'):
+        conditions.append(InsightsData.site_code == filters['site_code'])
+        
+    # Vehicle number filter
+    if filters.get('vehicle_no'):
+        conditions.append(InsightsData.vehicle_no_norm.like(vehicle_search_pattern(filters['vehicle_no'])))
+        
+    # Movement type filter
+    if filters.get('movement_type'):
+        conditions.append(InsightsData.movement_type == filters['movement_type'])
+    
+    # Security filter for non-admins
+    user_roles = [r.strip().lower().replace(" ", "") for r in current_user.role.split(",")]
+    if not any(role in ["admin", "itadmin"] for role in user_roles):
+        conditions.append(InsightsData.warehouse_code == current_user.warehouse_code)
+    
+    return conditions
+
+def _movement_dict(row, now: datetime) -> dict:
+    """One /filtered-movements result from an InsightsData row with edit_state_columns"""
+    movement = row.InsightsData
+    
+    # Calculate document age
+    document_age_time = None
+    if movement.document_date:
+        time_diff = now - movement.document_date
+        total_seconds = int(time_diff.total_seconds())
+        hours = total_seconds // 3600
+        minutes = (total_seconds % 3600) // 60
+        seconds = total_seconds % 60
+        document_age_time = f"{hours:02d}:{minutes:02d}:{seconds:02d}"
+    
+    return {
+        "id": movement.id,
+        "gate_entry_no": movement.gate_entry_no,
+        "document_type": movement.document_type,
+        "sub_document_type": movement.sub_document_type,
+        "document_no": movement.document_no,  # NEW FIELD
+        "vehicle_no": movement.vehicle_no,
+        "date": movement.date.isoformat() if movement.date else None,
+        "time": movement.time.isoformat() if movement.time else None,
+        "movement_type": movement.movement_type,
+        "to_warehouse_code": movement.warehouse_code,
+        "security_name": movement.security_name,
+        "security_username": movement.security_username,
+        "site_code": movement.site_code,
+        "remarks": movement.remarks,
+        "document_date": movement.document_date.isoformat() if movement.document_date else None,
+        "document_age_time": document_age_time,
+        
+        # ✅ NEW: Operational fields
+        "driver_name": movement.driver_name,
+        "km_reading": movement.km_reading,
+        "loader_names": movement.loader_names,
+        "last_edited_at": movement.last_edited_at.isoformat() if movement.last_edited_at else None,
+        "edit_count": movement.edit_count or 0,
+        
+        # ✅ NEW: Edit status information
+        "edit_status": row.edit_status,
+        "time_remaining": row.time_remaining,
+        "is_operational_complete": row.is_operational_complete,
+        "missing_fields": row.missing_fields,
+        "can_edit": row.can_edit,
+        "edit_button_config": edit_button_config(
+            row.edit_status, row.can_edit, row.time_remaining, row.missing_fields, movement.edit_count
+        )
+    }
+
 @router.post("/filtered-movements")
-def get_enhanced_filtered_movements(
+async def get_enhanced_filtered_movements(
     filters: dict,
-    db: Session = Depends(get_db),
-    current_user: UsersMaster = Depends(get_current_user)
+    stream: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: UsersMaster = Depends(get_current_user_async)
 ):
-    """Get filtered movements with enhanced operational edit status"""
+    """Get filtered movements with enhanced operational edit status.
+
+    Results are paged newest first by (date, time, id). Pass the returned next_cursor as
+    "cursor" to get the next page; "page_size" is capped at FILTERED_MOVEMENTS_MAX_PAGE_SIZE
+    and "include_total": true adds the total number of matching rows.
+
+    With ?stream=json or ?stream=ndjson every matching row (from "cursor" on, if given) is
+    streamed as a JSON array / one object per line instead of returning a page.
+    """
     try:
-        # Build dynamic query
-        query = db.query(InsightsData)
-        
-        # Date filters
-        if filters.get('from_date'):
-            query = query.filter(InsightsData.date >= filters['from_date'])
-        if filters.get('to_date'):
-            query = query.filter(InsightsData.date <= filters['to_date'])
-            
-        # ✅ ADD WAREHOUSE CODE FILTER HERE
-        if filters.get('warehouse_code'):
-            query = query.filter(InsightsData.warehouse_code == filters['warehouse_code'])
-            
-        # ✅ ADD SITE CODE FILTER HERE  
-        if filters.get('site_code'):
-            query = query.filter(InsightsData.site_code == filters['site_code'])
-            
-        # Vehicle number filter
-        if filters.get('vehicle_no'):
-            vehicle_filter = f"%{filters['vehicle_no'].upper()}%"
-            query = query.filter(InsightsData.vehicle_no.ilike(vehicle_filter))
-            
-        # Movement type filter
-        if filters.get('movement_type'):
-            query = query.filter(InsightsData.movement_type == filters['movement_type'])
+        mode = stream_format(stream)
+        page_size = _page_size(filters)
         
-        # Security filter for non-admins
-        user_roles = [r.strip().lower().replace(" ", "") for r in current_user.role.split(",")]
-        if not any(role in ["admin", "itadmin"] for role in user_roles):
-            query = query.filter(InsightsData.warehouse_code == current_user.warehouse_code)
+        query = select(InsightsData).where(*_movement_filters(filters, current_user))
         
+        total = None
+        if filters.get('include_total') and not mode:
+            total = (await db.execute(select(func.count()).select_from(query.subquery()))).scalar()
         
-        # Execute query
-        movements = query.order_by(
-            InsightsData.date.desc(), 
-            InsightsData.time.desc()
-        ).all()
+        # Keyset pagination: continue after the last row of the previous page
+        if filters.get('cursor'):
+            query = query.filter(tuple_(*MOVEMENT_KEYSET) < tuple_(*_decode_cursor(filters['cursor'])))
         
-        # ✅ NEW: Enhanced response with operational edit status
-        result_list = []
-        for movement in movements:
-            # Calculate document age
-            document_age_time = None
-            if movement.document_date:
-                time_diff = datetime.now() - movement.document_date
-                total_seconds = int(time_diff.total_seconds())
-                hours = total_seconds // 3600
-                minutes = (total_seconds % 3600) // 60
-                seconds = total_seconds % 60
-                document_age_time = f"{hours:02d}:{minutes:02d}:{seconds:02d}"
-            
-            # ✅ NEW: Get edit status and button configuration
-            edit_button_config = movement.get_edit_button_config(
-                current_user.username, 
-                current_user.role
-            )
-            
-            result_list.append({
-                "id": movement.id,
-                "gate_entry_no": movement.gate_entry_no,
-                "document_type": movement.document_type,
-                "sub_document_type": movement.sub_document_type,
-                "document_no": movement.document_no,  # NEW FIELD
-                "vehicle_no": movement.vehicle_no,
-                "date": movement.date.isoformat() if movement.date else None,
-                "time": movement.time.isoformat() if movement.time else None,
-                "movement_type": movement.movement_type,
-                "to_warehouse_code": movement.warehouse_code,
-                "security_name": movement.security_name,
-                "security_username": movement.security_username,
-                "site_code": movement.site_code,
-                "remarks": movement.remarks,
-                "document_date": movement.document_date.isoformat() if movement.document_date else None,
-                "document_age_time": document_age_time,
-                
-                # ✅ NEW: Operational fields
-                "driver_name": movement.driver_name,
-                "km_reading": movement.km_reading,
-                "loader_names": movement.loader_names,
-                "last_edited_at": movement.last_edited_at.isoformat() if movement.last_edited_at else None,
-                "edit_count": movement.edit_count or 0,
-                
-                # ✅ NEW: Edit status information
-                "edit_status": movement.get_edit_status(),
-                "time_remaining": movement.get_time_remaining(),
-                "is_operational_complete": movement.is_operational_data_complete(),
-                "missing_fields": movement.get_missing_operational_fields(),
-                "can_edit": movement.can_be_edited(current_user.username, current_user.role),
-                "edit_button_config": edit_button_config
-            })
+        # Edit status columns are computed in the SELECT, against one "now" for the page
+        now = datetime.now()
+        query = query.add_columns(*edit_state_columns(now, current_user.username, current_user.role))
         
-        return {
+        order = [column.desc() for column in MOVEMENT_KEYSET]
+        if mode:
+            return stream_response(mode, stream_rows_async(query.order_by(*order), lambda row: _movement_dict(row, now)))
+        
+        # Execute query (one extra row tells whether there is a next page)
+        result = await db.execute(query.order_by(*order).limit(page_size + 1))
+        rows = result.all()
+        has_more = len(rows) > page_size
+        rows = rows[:page_size]
+        
+        result_list = [_movement_dict(row, now) for row in rows]
+        
+        response = {
             "count": len(result_list),
             "results": result_list,
-            "filters_applied": filters
+            "filters_applied": filters,
+            "page_size": page_size,
+            "has_more": has_more,
+            "next_cursor": _encode_cursor(rows[-1].InsightsData) if has_more else None
         }
+        if total is not None:
+            response["total"] = total
+        return response
         
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error in enhanced filtered movements: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Filter error: {str(e)}")
 
+# (header, column) of /export-movements, in file order
+MOVEMENT_EXPORT_COLUMNS = [
+    ("Date", cast(InsightsData.date, Date)),
+    ("Time", InsightsData.time),
+    ("Gate Entry No", InsightsData.gate_entry_no),
+    ("Vehicle No", InsightsData.vehicle_no),
+    ("Document No", InsightsData.document_no),
+    ("Document Type", InsightsData.document_type),
+    ("Sub Document Type", InsightsData.sub_document_type),
+    ("Movement Type", InsightsData.movement_type),
+    ("Warehouse", InsightsData.warehouse_code),
+    ("Site", InsightsData.site_code),
+    ("Security Guard", InsightsData.security_name),
+    ("Security Username", InsightsData.security_username),
+    ("Remarks", InsightsData.remarks),
+    ("Document Date", InsightsData.document_date),
+    ("Driver Name", InsightsData.driver_name),
+    ("KM Reading", InsightsData.km_reading),
+    ("Loader Names", InsightsData.loader_names),
+    ("Edit Count", func.coalesce(InsightsData.edit_count, 0)),
+    ("Last Edited At", InsightsData.last_edited_at),
+]
+
+@router.post("/export-movements")
+def export_filtered_movements(
+    filters: dict,
+    format: str = "csv",
+    current_user: UsersMaster = Depends(get_current_user)
+):
+    """Download every movement matching /filtered-movements filters as CSV or XLSX (?format=xlsx).
+
+    Same filters and warehouse scoping as /filtered-movements, without paging: rows are
+    streamed from a server-side cursor, newest first, as the file is written.
+    """
+    try:
+        file_format = export_format(format)
+        query = select(*[column for _, column in MOVEMENT_EXPORT_COLUMNS]).where(
+            *_movement_filters(filters, current_user)
+        ).order_by(InsightsData.date.desc(), InsightsData.time.desc(), InsightsData.id.desc())
+        
+        return export_response(
+            file_format,
+            f"movements_{datetime.now().strftime('%Y%m%d_%H%M%S')}",
+            [header for header, _ in MOVEMENT_EXPORT_COLUMNS],
+            stream_rows(query, list),
+            sheet_title="Movements"
+        )
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Error exporting filtered movements: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Export error: {str(e)}")
+
 @router.put("/update-operational-data")
 def update_operational_data(
     edit_data: OperationalDataEdit,
@@ -220,19 +373,74 @@ def get_edit_statistics(
 ):
     """Get statistics about record completion and edit status"""
     try:
-        base_query = db.query(InsightsData)
-        
-        # Filter by warehouse for non-admins
-        if current_user.role != "Admin":
-            base_query = base_query.filter(
-                InsightsData.warehouse_code == current_user.warehouse_code
+        now = datetime.now()
+        
+        # Filtered by warehouse for non-admins (raw rows and daily rollups)
+        def scope(model):
+            if current_user.role != "Admin":
+                return [model.warehouse_code == current_user.warehouse_code]
+            return []
+        
+        # Records from last 30 days: days already rolled up come from insights_daily_rollup
+        # (all past the 48-hour window, i.e. expired and not editable today), the rest from raw rows
+        thirty_days_ago = now - timedelta(days=30)
+        span = rollup_span(db, thirty_days_ago.date())
+        conditions = scope(InsightsData) + [
+            InsightsData.date >= thirty_days_ago.date(),
+            outside_span(InsightsData.date, span)
+        ]
+        rolled_up = rollup_totals(db, InsightsDailyRollup, span, scope, [
+            "movements", "missing_driver", "missing_km", "missing_loaders", "total_edits"
+        ])
+        
+        # Most edited record: best raw row vs best per-day rollup candidate
+        candidates = [
+            select(InsightsData.edit_count, InsightsData.id, InsightsData.gate_entry_no)
+            .filter(*conditions, InsightsData.edit_count > 0)
+        ]
+        if span is not None:
+            candidates.append(
+                select(InsightsDailyRollup.max_edit_count, InsightsDailyRollup.most_edited_id,
+                       InsightsDailyRollup.most_edited_gate_entry_no)
+                .filter(InsightsDailyRollup.day >= span[0], InsightsDailyRollup.day <= span[1],
+                        *scope(InsightsDailyRollup), InsightsDailyRollup.max_edit_count > 0)
             )
+        candidates = union_all(*candidates).subquery()
+        most_edited = (
+            select(candidates.c.gate_entry_no)
+            .order_by(candidates.c.edit_count.desc(), candidates.c.id)
+            .limit(1)
+            .scalar_subquery()
+        )
         
-        # Get all records from last 30 days
-        thirty_days_ago = datetime.now() - timedelta(days=30)
-        records = base_query.filter(InsightsData.date >= thirty_days_ago.date()).all()
-        
-        if not records:
+        # All raw-row counters in one pass over the rows (conditional aggregates)
+        edit_status = edit_status_expression(now)
+        elapsed = seconds_since_entry(now)
+        edit_count = func.coalesce(InsightsData.edit_count, 0)
+        stats = db.query(
+            func.count().label("total_records"),
+            func.count().filter(edit_status == 'needs_completion').label("needs_completion"),
+            func.count().filter(edit_status == 'editable').label("complete_and_editable"),
+            func.count().filter(edit_status == 'expired').label("expired"),
+            func.count().filter(elapsed <= 6 * 3600).label("within_6_hours"),
+            func.count().filter(elapsed > 6 * 3600, elapsed <= 12 * 3600).label("within_12_hours"),
+            func.count().filter(elapsed > 12 * 3600, elapsed <= 24 * 3600).label("within_24_hours"),
+            func.count().filter(~operational_field_filled(InsightsData.driver_name)).label("missing_driver"),
+            func.count().filter(~operational_field_filled(InsightsData.km_reading)).label("missing_km"),
+            func.count().filter(~operational_field_filled(InsightsData.loader_names)).label("missing_loaders"),
+            func.coalesce(func.sum(edit_count), 0).label("total_edits"),
+            most_edited.label("most_edited_record")
+        ).filter(*conditions).one()
+        
+        # Edited today, rolled-up days included (documents can be assigned to old manual entries)
+        edited_today = db.query(func.count()).filter(
+            *scope(InsightsData),
+            InsightsData.date >= thirty_days_ago.date(),
+            InsightsData.last_edited_at >= datetime.combine(now.date(), time.min)
+        ).scalar()
+        
+        total_records = stats.total_records + rolled_up["movements"]
+        if not total_records:
             return EditStatistics(
                 total_records=0, needs_completion=0, complete_and_editable=0,
                 expired=0, completion_percentage=0.0, within_6_hours=0,
@@ -241,76 +449,16 @@ def get_edit_statistics(
                 most_edited_record=None, avg_edits_per_record=0.0
             )
         
-        # Calculate statistics
-        total_records = len(records)
-        needs_completion = 0
-        complete_and_editable = 0
-        expired = 0
-        
-        within_6_hours = 0
-        within_12_hours = 0
-        within_24_hours = 0
-        
-        missing_driver = 0
-        missing_km = 0
-        missing_loaders = 0
-        
-        edited_today = 0
-        edit_counts = []
-        max_edits = 0
-        most_edited_record = None
-        
-        today = datetime.now().date()
-        
-        for record in records:
-            edit_status = record.get_edit_status()
-            
-            # Count by edit status
-            if edit_status == 'needs_completion':
-                needs_completion += 1
-            elif edit_status == 'editable':
-                complete_and_editable += 1
-            elif edit_status == 'expired':
-                expired += 1
-            
-            # Count missing fields
-            missing_fields = record.get_missing_operational_fields()
-            if 'driver_name' in missing_fields:
-                missing_driver += 1
-            if 'km_reading' in missing_fields:
-                missing_km += 1
-            if 'loader_names' in missing_fields:
-                missing_loaders += 1
-            
-            # Time-based counting
-            if record.date and record.time:
-                record_datetime = datetime.combine(record.date, record.time)
-                time_elapsed = datetime.now() - record_datetime
-                
-                if time_elapsed <= timedelta(hours=6):
-                    within_6_hours += 1
-                elif time_elapsed <= timedelta(hours=12):
-                    within_12_hours += 1
-                elif time_elapsed <= timedelta(hours=24):
-                    within_24_hours += 1
-            
-            # Edit tracking
-            edit_count = record.edit_count or 0
-            edit_counts.append(edit_count)
-            
-            if edit_count > max_edits:
-                max_edits = edit_count
-                most_edited_record = record.gate_entry_no
-            
-            if record.last_edited_at and record.last_edited_at.date() == today:
-                edited_today += 1
+        needs_completion = stats.needs_completion
+        complete_and_editable = stats.complete_and_editable
+        expired = stats.expired + rolled_up["movements"]
         
         # Calculate completion percentage
         operational_complete = complete_and_editable + expired  # Expired records are assumed complete
         completion_percentage = (operational_complete / total_records * 100) if total_records > 0 else 0.0
         
         # Calculate average edits
-        avg_edits = sum(edit_counts) / len(edit_counts) if edit_counts else 0.0
+        avg_edits = (int(stats.total_edits) + rolled_up["total_edits"]) / total_records
         
         return EditStatistics(
             total_records=total_records,
@@ -318,14 +466,14 @@ def get_edit_statistics(
             complete_and_editable=complete_and_editable,
             expired=expired,
             completion_percentage=round(completion_percentage, 1),
-            within_6_hours=within_6_hours,
-            within_12_hours=within_12_hours,
-            within_24_hours=within_24_hours,
-            missing_driver=missing_driver,
-            missing_km=missing_km,
-            missing_loaders=missing_loaders,
+            within_6_hours=stats.within_6_hours,
+            within_12_hours=stats.within_12_hours,
+            within_24_hours=stats.within_24_hours,
+            missing_driver=stats.missing_driver + rolled_up["missing_driver"],
+            missing_km=stats.missing_km + rolled_up["missing_km"],
+            missing_loaders=stats.missing_loaders + rolled_up["missing_loaders"],
             edited_today=edited_today,
-            most_edited_record=most_edited_record,
+            most_edited_record=stats.most_edited_record,
             avg_edits_per_record=round(avg_edits, 1)
         )
         
@@ -396,7 +544,11 @@ def get_records_needing_completion(
 ):
     """Get all records that need operational data completion (YELLOW button candidates)"""
     try:
-        base_query = db.query(InsightsData)
+        now = datetime.now()
+        base_query = db.query(
+            InsightsData,
+            *edit_state_columns(now, current_user.username, current_user.role)
+        )
         
         # Filter by warehouse for non-admins
         if current_user.role != "Admin":
@@ -404,31 +556,28 @@ def get_records_needing_completion(
                 InsightsData.warehouse_code == current_user.warehouse_code
             )
         
-        # Only get records within 48-hour edit window
-        twenty_four_hours_ago = datetime.now() - timedelta(hours=48)
-        recent_records = base_query.filter(
-            InsightsData.date >= twenty_four_hours_ago.date()
+        # Only get records within 48-hour edit window that need completion
+        twenty_four_hours_ago = now - timedelta(hours=48)
+        rows = base_query.filter(
+            InsightsData.date >= twenty_four_hours_ago.date(),
+            edit_status_expression(now) == 'needs_completion'
         ).all()
         
-        # Filter records that need completion
         needing_completion = []
-        for record in recent_records:
-            if record.get_edit_status() == 'needs_completion':
-                button_config = record.get_edit_button_config(
-                    current_user.username, 
-                    current_user.role
+        for row in rows:
+            record = row.InsightsData
+            needing_completion.append({
+                "gate_entry_no": record.gate_entry_no,
+                "vehicle_no": record.vehicle_no,
+                "date": record.date.isoformat(),
+                "time": record.time.isoformat(),
+                "movement_type": record.movement_type,
+                "missing_fields": row.missing_fields,
+                "time_remaining": row.time_remaining,
+                "button_config": edit_button_config(
+                    row.edit_status, row.can_edit, row.time_remaining, row.missing_fields, record.edit_count
                 )
-                
-                needing_completion.append({
-                    "gate_entry_no": record.gate_entry_no,
-                    "vehicle_no": record.vehicle_no,
-                    "date": record.date.isoformat(),
-                    "time": record.time.isoformat(),
-                    "movement_type": record.movement_type,
-                    "missing_fields": record.get_missing_operational_fields(),
-                    "time_remaining": record.get_time_remaining(),
-                    "button_config": button_config
-                })
+            })
         
         return {
             "count": len(needing_completion),
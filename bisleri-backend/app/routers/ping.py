@@ -1,15 +1,26 @@
 # app/routers/ping.py
 
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy import text
 from sqlalchemy.orm import Session
-from app.database import get_db
+from app.auth import get_current_user
+from app.database import get_db, get_pool_status
+from app.models import UsersMaster
+from app.routers.admin import normalize_roles
 
 router = APIRouter(prefix="/ping", tags=["Ping"])
 
 @router.get("/db")
 def ping_db(db: Session = Depends(get_db)):
     try:
-        db.execute("SELECT 1")
+        db.execute(text("SELECT 1"))
         return {"status": "success", "message": "Database connection is healthy!"}
     except Exception as e:
-        return {"status": "error", "message": str(e)}
\ No newline at end of file
+        return {"status": "error", "message": str(e)}
+
+@router.get("/pool")
+def ping_pool(current_user: UsersMaster = Depends(get_current_user)):
+    """Connection pool occupancy and checkout wait times (per worker process); admins only"""
+    if not any(r in ["admin", "itadmin"] for r in normalize_roles(current_user.role)):
+        raise HTTPException(status_code=403, detail="Only Admin/ITAdmin can view pool status")
+    return get_pool_status()
@@ -1,65 +1,84 @@
 # app/routers/raw_materials.py
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, Header, HTTPException, status
 from sqlalchemy.orm import Session
-from sqlalchemy import text
+from sqlalchemy import func, select, text
 from app.database import get_db
 from app.schemas.raw_materials_schemas import RawMaterialsCreate, RawMaterialsResponse, RawMaterialsEdit
-from app.models import RawMaterialsData, UsersMaster
+from app.models import RawMaterialsData, RawMaterialsDailyRollup, UsersMaster
 from app.auth import get_current_user
-from app.utils.helpers import generate_gate_entry_no_for_user, validate_vehicle_number
+from app.utils.helpers import generate_gate_entry_no_for_user, validate_vehicle_number, vehicle_search_pattern
+from app.utils.idempotency import begin_idempotent_request, save_idempotent_response
+from app.utils.streaming import export_format, export_response, stream_format, stream_response, stream_rows
+from app.services.rollups import rollup_span, outside_span, rollup_totals, count_distinct_vehicles
 from datetime import datetime, timedelta
-from typing import List
+from typing import List, Optional
 
 router = APIRouter(prefix="/rm", tags=["Raw Materials"])
 
+def create_raw_materials_record(db: Session, entry: RawMaterialsCreate, current_user: UsersMaster,
+                                recorded_at: Optional[datetime] = None) -> RawMaterialsResponse:
+    """Insert one raw materials entry without committing and return its response.
+
+    recorded_at overrides the entry time (bulk ingest replays entries captured offline).
+    """
+    # Validate vehicle number format
+    if not validate_vehicle_number(entry.vehicle_no):
+        raise HTTPException(
+            status_code=400,
+            detail="Invalid vehicle number format"
+        )
+    
+    now = recorded_at or datetime.now()
+    
+    # Generate gate entry number (replayed entries use the series of their own year)
+    gate_entry_no = generate_gate_entry_no_for_user(db, current_user.username, now.year)
+    if not gate_entry_no:
+        raise HTTPException(
+            status_code=500,
+            detail="Failed to generate gate entry number"
+        )
+    
+    security_name = f"{current_user.first_name} {current_user.last_name}"
+    
+    # Create raw materials entry
+    rm_entry = RawMaterialsData(
+        gate_entry_no=gate_entry_no,
+        gate_type=entry.gate_type,
+        vehicle_no=entry.vehicle_no.upper(),
+        document_no=entry.document_no,
+        name_of_party=entry.name_of_party,
+        description_of_material=entry.description_of_material,
+        quantity=entry.quantity,
+        date_time=now,
+        security_name=security_name,
+        security_username=current_user.username,
+        warehouse_code=current_user.warehouse_code,
+        site_code=current_user.site_code,
+        edit_count=0
+    )
+    
+    db.add(rm_entry)
+    db.flush()
+    return RawMaterialsResponse.model_validate(rm_entry, from_attributes=True)
+
 @router.post("/create-entry", response_model=RawMaterialsResponse)
 def create_raw_materials_entry(
     entry: RawMaterialsCreate,
+    idempotency_key: Optional[str] = Header(None),
     db: Session = Depends(get_db),
     current_user: UsersMaster = Depends(get_current_user)
 ):
     """Create raw materials gate entry"""
     try:
-        # Validate vehicle number format
-        if not validate_vehicle_number(entry.vehicle_no):
-            raise HTTPException(
-                status_code=400,
-                detail="Invalid vehicle number format"
-            )
-        
-        # Generate gate entry number
-        gate_entry_no = generate_gate_entry_no_for_user(current_user.username)
-        if not gate_entry_no:
-            raise HTTPException(
-                status_code=500,
-                detail="Failed to generate gate entry number"
-            )
+        replay = begin_idempotent_request(db, idempotency_key, current_user.username, "/rm/create-entry", entry)
+        if replay:
+            return replay
         
-        now = datetime.now()
-        security_name = f"{current_user.first_name} {current_user.last_name}"
-        
-        # Create raw materials entry
-        rm_entry = RawMaterialsData(
-            gate_entry_no=gate_entry_no,
-            gate_type=entry.gate_type,
-            vehicle_no=entry.vehicle_no.upper(),
-            document_no=entry.document_no,
-            name_of_party=entry.name_of_party,
-            description_of_material=entry.description_of_material,
-            quantity=entry.quantity,
-            date_time=now,
-            security_name=security_name,
-            security_username=current_user.username,
-            warehouse_code=current_user.warehouse_code,
-            site_code=current_user.site_code,
-            edit_count=0
-        )
+        response = create_raw_materials_record(db, entry, current_user)
         
-        db.add(rm_entry)
+        save_idempotent_response(db, idempotency_key, current_user.username, response)
         db.commit()
-        db.refresh(rm_entry)
-        
-        return rm_entry
+        return response
         
     except HTTPException:
         raise
@@ -71,82 +90,105 @@ def create_raw_materials_entry(
             detail=f"Database error: {str(e)}"
         )
 
+def _rm_filters(filters: dict, current_user: UsersMaster) -> list:
+    """WHERE conditions of /filtered-entries for `filters` and the user's warehouse"""
+    conditions = []
+    
+    # Date filters
+    if filters.get('from_date'):
+        from_date = datetime.strptime(filters['from_date'], '%Y-%m-%d').date()
+        conditions.append(RawMaterialsData.date_time >= from_date)
+    if filters.get('to_date'):
+        to_date = datetime.strptime(filters['to_date'], '%Y-%m-%d').date()
+        # Add one day and convert to end of day
+        end_date = datetime.combine(to_date, datetime.max.time())
+        conditions.append(RawMaterialsData.date_time <= end_date)
+        
+    # Vehicle number filter
+    if filters.get('vehicle_no'):
+        conditions.append(RawMaterialsData.vehicle_no_norm.like(vehicle_search_pattern(filters['vehicle_no'])))
+        
+    # Movement type filter
+    if filters.get('movement_type'):
+        conditions.append(RawMaterialsData.gate_type == filters['movement_type'])
+    
+    # Security filter for non-admins
+    if current_user.role != "Admin":
+        conditions.append(RawMaterialsData.warehouse_code == current_user.warehouse_code)
+    
+    return conditions
+
+def _rm_entry_dict(entry: RawMaterialsData, now: datetime, can_edit_any: bool, username: str) -> dict:
+    """One filtered-entries result with its edit status; can_edit_any lets the user
+    edit other guards' entries (the 48-hour window still applies)"""
+    # Check if entry can be edited (48-hour window)
+    time_since_creation = now - entry.date_time
+    can_edit = (
+        time_since_creation <= timedelta(hours=48) and
+        (can_edit_any or entry.security_username == username)
+    )
+    
+    # Calculate time remaining
+    time_remaining = None
+    if time_since_creation <= timedelta(hours=48):
+        remaining_seconds = (timedelta(hours=48) - time_since_creation).total_seconds()
+        hours = int(remaining_seconds // 3600)
+        minutes = int((remaining_seconds % 3600) // 60)
+        time_remaining = f"{hours}h {minutes}m"
+    
+    return {
+        "id": entry.id,
+        "gate_entry_no": entry.gate_entry_no,
+        "gate_type": entry.gate_type,
+        "vehicle_no": entry.vehicle_no,
+        "document_no": entry.document_no,
+        "name_of_party": entry.name_of_party,
+        "description_of_material": entry.description_of_material,
+        "quantity": entry.quantity,
+        "date_time": entry.date_time.isoformat(),
+        "security_name": entry.security_name,
+        "security_username": entry.security_username,
+        "warehouse_code": entry.warehouse_code,
+        "site_code": entry.site_code,
+        "last_edited_at": entry.last_edited_at.isoformat() if entry.last_edited_at else None,
+        "edit_count": entry.edit_count or 0,
+        "can_edit": can_edit,
+        "time_remaining": time_remaining
+    }
+
 @router.post("/filtered-entries")
 def get_filtered_rm_entries(
     filters: dict,
+    stream: Optional[str] = None,
     db: Session = Depends(get_db),
     current_user: UsersMaster = Depends(get_current_user)
 ):
-    """Get filtered raw materials entries"""
+    """Get filtered raw materials entries.
+
+    ?stream=json or ?stream=ndjson streams every matching entry (no 5000 row cap) as a
+    JSON array / one object per line instead of the usual response.
+    """
     try:
-        # Build dynamic query
-        query = db.query(RawMaterialsData)
-        
-        # Date filters
-        if filters.get('from_date'):
-            from_date = datetime.strptime(filters['from_date'], '%Y-%m-%d').date()
-            query = query.filter(RawMaterialsData.date_time >= from_date)
-        if filters.get('to_date'):
-            to_date = datetime.strptime(filters['to_date'], '%Y-%m-%d').date()
-            # Add one day and convert to end of day
-            end_date = datetime.combine(to_date, datetime.max.time())
-            query = query.filter(RawMaterialsData.date_time <= end_date)
-            
-        # Vehicle number filter
-        if filters.get('vehicle_no'):
-            vehicle_filter = f"%{filters['vehicle_no'].upper()}%"
-            query = query.filter(RawMaterialsData.vehicle_no.ilike(vehicle_filter))
-            
-        # Movement type filter
-        if filters.get('movement_type'):
-            query = query.filter(RawMaterialsData.gate_type == filters['movement_type'])
-        
-        # Security filter for non-admins
-        if current_user.role != "Admin":
-            query = query.filter(RawMaterialsData.warehouse_code == current_user.warehouse_code)
+        mode = stream_format(stream)
+        conditions = _rm_filters(filters, current_user)
+        can_edit_any = current_user.role == "Admin"
+        now = datetime.now()
+        
+        if mode:
+            query = select(RawMaterialsData).where(*conditions).order_by(
+                RawMaterialsData.date_time.desc(), RawMaterialsData.id.desc()
+            )
+            return stream_response(mode, stream_rows(
+                query, lambda row: _rm_entry_dict(row.RawMaterialsData, now, can_edit_any, current_user.username)
+            ))
         
         # Execute query
-        entries = query.order_by(
+        entries = db.query(RawMaterialsData).filter(*conditions).order_by(
             RawMaterialsData.date_time.desc()
         ).limit(5000).all()
         
         # Format response with edit status
-        result_list = []
-        for entry in entries:
-            # Check if entry can be edited (48-hour window)
-            time_since_creation = datetime.now() - entry.date_time
-            can_edit = (
-                time_since_creation <= timedelta(hours=48) and
-                (current_user.role == "Admin" or entry.security_username == current_user.username)
-            )
- 
-            # Calculate time remaining
-            time_remaining = None
-            if time_since_creation <= timedelta(hours=48):
-                remaining_seconds = (timedelta(hours=48) - time_since_creation).total_seconds()
-                hours = int(remaining_seconds // 3600)
-                minutes = int((remaining_seconds % 3600) // 60)
-                time_remaining = f"{hours}h {minutes}m"
-            
-            result_list.append({
-                "id": entry.id,
-                "gate_entry_no": entry.gate_entry_no,
-                "gate_type": entry.gate_type,
-                "vehicle_no": entry.vehicle_no,
-                "document_no": entry.document_no,
-                "name_of_party": entry.name_of_party,
-                "description_of_material": entry.description_of_material,
-                "quantity": entry.quantity,
-                "date_time": entry.date_time.isoformat(),
-                "security_name": entry.security_name,
-                "security_username": entry.security_username,
-                "warehouse_code": entry.warehouse_code,
-                "site_code": entry.site_code,
-                "last_edited_at": entry.last_edited_at.isoformat() if entry.last_edited_at else None,
-                "edit_count": entry.edit_count or 0,
-                "can_edit": can_edit,
-                "time_remaining": time_remaining
-            })
+        result_list = [_rm_entry_dict(entry, now, can_edit_any, current_user.username) for entry in entries]
         
         return {
             "count": len(result_list),
@@ -154,6 +196,8 @@ def get_filtered_rm_entries(
             "filters_applied": filters
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error in filtered RM entries: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Filter error: {str(e)}")
@@ -252,20 +296,31 @@ def get_rm_statistics(
         
         current_roles = normalize_roles(current_user.role)
         
-        base_query = db.query(RawMaterialsData)
-        
-        # ✅ FIX: Check for normalized admin roles
-        if not any(r in ["securityadmin", "itadmin"] for r in current_roles):
-            # Non-admin: filter by warehouse
-            base_query = base_query.filter(
-                RawMaterialsData.warehouse_code == current_user.warehouse_code
-            )
+        # ✅ FIX: Check for normalized admin roles (applied to raw rows and daily rollups)
+        def scope(model):
+            if not any(r in ["securityadmin", "itadmin"] for r in current_roles):
+                # Non-admin: filter by warehouse
+                return [model.warehouse_code == current_user.warehouse_code]
+            return []
         
-        # Get records from last 30 days
+        # Get records from last 30 days: whole days already rolled up come from
+        # raw_materials_daily_rollup, the rest (partial first day, recent days) from raw rows
         thirty_days_ago = datetime.now() - timedelta(days=30)
-        recent_records = base_query.filter(RawMaterialsData.date_time >= thirty_days_ago).all()
-        
-        if not recent_records:
+        span = rollup_span(db, thirty_days_ago)
+        conditions = scope(RawMaterialsData) + [
+            RawMaterialsData.date_time >= thirty_days_ago,
+            outside_span(RawMaterialsData.date_time, span)
+        ]
+        stats = db.query(
+            func.count().label("entries"),
+            func.count().filter(RawMaterialsData.gate_type == "Gate-In").label("gate_in_count"),
+            func.count().filter(RawMaterialsData.gate_type == "Gate-Out").label("gate_out_count"),
+            func.count().filter(func.coalesce(RawMaterialsData.edit_count, 0) > 0).label("edited_entries")
+        ).filter(*conditions).one()
+        rolled_up = rollup_totals(db, RawMaterialsDailyRollup, span, scope, list(stats._fields))
+        
+        total_entries = stats.entries + rolled_up["entries"]
+        if not total_entries:
             return {
                 "total_entries": 0,
                 "gate_in_count": 0,
@@ -276,11 +331,12 @@ def get_rm_statistics(
             }
         
         # Calculate statistics
-        total_entries = len(recent_records)
-        gate_in_count = len([r for r in recent_records if r.gate_type == "Gate-In"])
-        gate_out_count = len([r for r in recent_records if r.gate_type == "Gate-Out"])
-        unique_vehicles = len(set(r.vehicle_no for r in recent_records))
-        edited_entries = len([r for r in recent_records if (r.edit_count or 0) > 0])
+        gate_in_count = stats.gate_in_count + rolled_up["gate_in_count"]
+        gate_out_count = stats.gate_out_count + rolled_up["gate_out_count"]
+        unique_vehicles = count_distinct_vehicles(
+            db, "raw_materials", span, scope, select(RawMaterialsData.vehicle_no).where(*conditions)
+        )
+        edited_entries = stats.edited_entries + rolled_up["edited_entries"]
         
         return {
             "total_entries": total_entries,
@@ -295,99 +351,87 @@ def get_rm_statistics(
         print(f"Error getting RM statistics: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Statistics error: {str(e)}")
        
+def _admin_roles(current_user: UsersMaster) -> list:
+    """Normalized roles of an RM admin; 403 for anyone else"""
+    if hasattr(current_user, 'role') and current_user.role:
+        roles = [r.strip().lower().replace(" ", "") for r in current_user.role.split(",")]
+    else:
+        roles = []
+    
+    if not any(r in ["securityadmin", "itadmin"] for r in roles):
+        raise HTTPException(status_code=403, detail="Access denied")
+    return roles
+
+def _admin_rm_filters(filters: dict, current_user: UsersMaster, roles: list) -> list:
+    """WHERE conditions of /admin-filtered-entries (and its export) for `filters` and the admin's scope"""
+    conditions = []
+    
+    # ✅ NEW: Role-based filtering
+    if "securityadmin" in roles and "itadmin" not in roles:
+        # Security Admin: only their warehouse
+        conditions.append(RawMaterialsData.warehouse_code == current_user.warehouse_code)
+    else:
+        # IT Admin: can filter by site/warehouse if provided
+        if filters.get('site_code'):
+            conditions.append(RawMaterialsData.site_code == filters['site_code'])
+        if filters.get('warehouse_code'):
+            conditions.append(RawMaterialsData.warehouse_code == filters['warehouse_code'])
+    
+    # Date filters
+    if filters.get('from_date'):
+        from_date = datetime.strptime(filters['from_date'], '%Y-%m-%d').date()
+        conditions.append(RawMaterialsData.date_time >= from_date)
+    if filters.get('to_date'):
+        to_date = datetime.strptime(filters['to_date'], '%Y-%m-%d').date()
+        # Add one day and convert to end of day
+        end_date = datetime.combine(to_date, datetime.max.time())
+        conditions.append(RawMaterialsData.date_time <= end_date)
+        
+    # Vehicle number filter
+    if filters.get('vehicle_no'):
+        conditions.append(RawMaterialsData.vehicle_no_norm.like(vehicle_search_pattern(filters['vehicle_no'])))
+        
+    # Movement type filter
+    if filters.get('movement_type'):
+        conditions.append(RawMaterialsData.gate_type == filters['movement_type'])
+    
+    return conditions
+
 # ✅ ENHANCED: Admin filtered RM entries
 @router.post("/admin-filtered-entries")
 def get_admin_filtered_rm_entries(
     filters: dict,
+    stream: Optional[str] = None,
     db: Session = Depends(get_db),
     current_user: UsersMaster = Depends(get_current_user)
 ):
-    """Get filtered raw materials entries for admin with proper role-based access"""
+    """Get filtered raw materials entries for admin with proper role-based access.
+
+    ?stream=json or ?stream=ndjson streams every matching entry (no 5000 row cap) as a
+    JSON array / one object per line instead of the usual response.
+    """
     try:
-        # Normalize roles
-        if hasattr(current_user, 'role') and current_user.role:
-            roles = [r.strip().lower().replace(" ", "") for r in current_user.role.split(",")]
-        else:
-            roles = []
-        
-        if not any(r in ["securityadmin", "itadmin"] for r in roles):
-            raise HTTPException(status_code=403, detail="Access denied")
-        
-        # Build dynamic query
-        query = db.query(RawMaterialsData)
-        
-        # ✅ NEW: Role-based filtering
-        if "securityadmin" in roles and "itadmin" not in roles:
-            # Security Admin: only their warehouse
-            query = query.filter(RawMaterialsData.warehouse_code == current_user.warehouse_code)
-        else:
-            # IT Admin: can filter by site/warehouse if provided
-            if filters.get('site_code'):
-                query = query.filter(RawMaterialsData.site_code == filters['site_code'])
-            if filters.get('warehouse_code'):
-                query = query.filter(RawMaterialsData.warehouse_code == filters['warehouse_code'])
-        
-        # Date filters
-        if filters.get('from_date'):
-            from_date = datetime.strptime(filters['from_date'], '%Y-%m-%d').date()
-            query = query.filter(RawMaterialsData.date_time >= from_date)
-        if filters.get('to_date'):
-            to_date = datetime.strptime(filters['to_date'], '%Y-%m-%d').date()
-            # Add one day and convert to end of day
-            end_date = datetime.combine(to_date, datetime.max.time())
-            query = query.filter(RawMaterialsData.date_time <= end_date)
-            
-        # Vehicle number filter
-        if filters.get('vehicle_no'):
-            vehicle_filter = f"%{filters['vehicle_no'].upper()}%"
-            query = query.filter(RawMaterialsData.vehicle_no.ilike(vehicle_filter))
-            
-        # Movement type filter
-        if filters.get('movement_type'):
-            query = query.filter(RawMaterialsData.gate_type == filters['movement_type'])
+        roles = _admin_roles(current_user)
+        mode = stream_format(stream)
+        conditions = _admin_rm_filters(filters, current_user, roles)
+        can_edit_any = current_user.role == "Admin" or "itadmin" in roles
+        now = datetime.now()
+        
+        if mode:
+            query = select(RawMaterialsData).where(*conditions).order_by(
+                RawMaterialsData.date_time.desc(), RawMaterialsData.id.desc()
+            )
+            return stream_response(mode, stream_rows(
+                query, lambda row: _rm_entry_dict(row.RawMaterialsData, now, can_edit_any, current_user.username)
+            ))
         
         # Execute query
-        entries = query.order_by(
+        entries = db.query(RawMaterialsData).filter(*conditions).order_by(
             RawMaterialsData.date_time.desc()
         ).limit(5000).all()
         
         # Format response with edit status
-        result_list = []
-        for entry in entries:
-            # Check if entry can be edited (48-hour window)
-            time_since_creation = datetime.now() - entry.date_time
-            can_edit = (
-                time_since_creation <= timedelta(hours=48) and
-                (current_user.role == "Admin" or "itadmin" in roles or entry.security_username == current_user.username)
-            )
-
-            # Calculate time remaining
-            time_remaining = None
-            if time_since_creation <= timedelta(hours=48):
-                remaining_seconds = (timedelta(hours=48) - time_since_creation).total_seconds()
-                hours = int(remaining_seconds // 3600)
-                minutes = int((remaining_seconds % 3600) // 60)
-                time_remaining = f"{hours}h {minutes}m"
-            
-            result_list.append({
-                "id": entry.id,
-                "gate_entry_no": entry.gate_entry_no,
-                "gate_type": entry.gate_type,
-                "vehicle_no": entry.vehicle_no,
-                "document_no": entry.document_no,
-                "name_of_party": entry.name_of_party,
-                "description_of_material": entry.description_of_material,
-                "quantity": entry.quantity,
-                "date_time": entry.date_time.isoformat(),
-                "security_name": entry.security_name,
-                "security_username": entry.security_username,
-                "warehouse_code": entry.warehouse_code,
-                "site_code": entry.site_code,
-                "last_edited_at": entry.last_edited_at.isoformat() if entry.last_edited_at else None,
-                "edit_count": entry.edit_count or 0,
-                "can_edit": can_edit,
-                "time_remaining": time_remaining
-            })
+        result_list = [_rm_entry_dict(entry, now, can_edit_any, current_user.username) for entry in entries]
         
         return {
             "count": len(result_list),
@@ -397,6 +441,58 @@ def get_admin_filtered_rm_entries(
             "access_level": "itadmin" if "itadmin" in roles else "securityadmin"
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error in admin filtered RM entries: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"Filter error: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Filter error: {str(e)}")
+
+# (header, column) of /rm/admin-export-entries, in file order
+RM_EXPORT_COLUMNS = [
+    ("Gate Entry No", RawMaterialsData.gate_entry_no),
+    ("Gate Type", RawMaterialsData.gate_type),
+    ("Vehicle No", RawMaterialsData.vehicle_no),
+    ("Document No", RawMaterialsData.document_no),
+    ("Name of Party", RawMaterialsData.name_of_party),
+    ("Description", RawMaterialsData.description_of_material),
+    ("Quantity", RawMaterialsData.quantity),
+    ("Date Time", RawMaterialsData.date_time),
+    ("Security Guard", RawMaterialsData.security_name),
+    ("Security Username", RawMaterialsData.security_username),
+    ("Warehouse", RawMaterialsData.warehouse_code),
+    ("Site", RawMaterialsData.site_code),
+    ("Edit Count", func.coalesce(RawMaterialsData.edit_count, 0)),
+    ("Last Edited At", RawMaterialsData.last_edited_at),
+]
+
+@router.post("/admin-export-entries")
+def export_admin_filtered_rm_entries(
+    filters: dict,
+    format: str = "csv",
+    current_user: UsersMaster = Depends(get_current_user)
+):
+    """Download every RM entry matching /admin-filtered-entries filters as CSV or XLSX (?format=xlsx).
+
+    Same filters and role scoping as /admin-filtered-entries but without its 5000 row cap:
+    rows are streamed from a server-side cursor, newest first, as the file is written.
+    """
+    try:
+        roles = _admin_roles(current_user)
+        file_format = export_format(format)
+        query = select(*[column for _, column in RM_EXPORT_COLUMNS]).where(
+            *_admin_rm_filters(filters, current_user, roles)
+        ).order_by(RawMaterialsData.date_time.desc(), RawMaterialsData.id.desc())
+        
+        return export_response(
+            file_format,
+            f"rm_entries_{datetime.now().strftime('%Y%m%d_%H%M%S')}",
+            [header for header, _ in RM_EXPORT_COLUMNS],
+            stream_rows(query, list),
+            sheet_title="RM Entries"
+        )
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Error exporting admin filtered RM entries: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Export error: {str(e)}")
@@ -1,29 +1,51 @@
 from fastapi import APIRouter, HTTPException
+from app.config import settings
 from app.services.data_sync_service import data_sync_service
+from app.services.sync_lock import SyncAlreadyRunning
+from app.services.sync_scheduler import sync_scheduler
+from app.services.mfabric_listener import mfabric_listener
 
 router = APIRouter(prefix="/sync", tags=["sync"])
 
 @router.post("/manual")
-async def manual_sync():
-    """Manually trigger data sync from mfabric tables to document_data"""
+def manual_sync(full: bool = False):
+    """Manually trigger data sync from mfabric tables to document_data (full=true rebuilds everything)
+
+    Waits up to SYNC_LOCK_WAIT_SECONDS for a running sync to finish, then returns 409.
+    """
     try:
-        success = data_sync_service.push_to_document_data()
+        success = data_sync_service.push_to_document_data(
+            full=full,
+            trigger="manual",
+            lock_mode="wait",
+            lock_timeout=settings.SYNC_LOCK_WAIT_SECONDS
+        )
         if success:
             return {"message": "Data sync completed successfully", "status": "success"}
         else:
             raise HTTPException(status_code=500, detail="Data sync failed")
+    except SyncAlreadyRunning as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Sync error: {str(e)}")
 
 @router.get("/status")
-async def sync_status():
-    """Get current sync status and record counts"""
+def sync_status():
+    """Get current sync status, record counts, scheduler state and recent run history"""
     try:
         status = data_sync_service.get_sync_status()
         if status:
+            status["scheduler"] = sync_scheduler.get_status()
+            status["listener"] = mfabric_listener.get_status()
+            status["lock_holder"] = data_sync_service.get_lock_holder()
+            status["recent_runs"] = data_sync_service.get_recent_runs(settings.SYNC_RUN_HISTORY_LIMIT)
             return status
         else:
             raise HTTPException(status_code=500, detail="Could not retrieve sync status")
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Status error: {str(e)}")
 
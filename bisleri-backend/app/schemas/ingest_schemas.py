@@ -0,0 +1,28 @@
+# app/schemas/ingest_schemas.py - Bulk replay of entries queued offline by the gate app
+from pydantic import BaseModel, validator
+from datetime import datetime
+from typing import Optional, List
+from .gate_schemas import EnhancedGateEntryCreate
+from .raw_materials_schemas import RawMaterialsCreate
+
+class BulkIngestItem(BaseModel):
+    entry_type: str  # "gate" or "raw_material"
+    idempotency_key: str  # Same key the app would send as Idempotency-Key on the single call
+    client_timestamp: datetime  # When the guard captured the entry on the device
+    gate_entry: Optional[EnhancedGateEntryCreate] = None
+    raw_material_entry: Optional[RawMaterialsCreate] = None
+
+    @validator('entry_type')
+    def validate_entry_type(cls, v):
+        if v not in ['gate', 'raw_material']:
+            raise ValueError('Entry type must be gate or raw_material')
+        return v
+
+    @validator('idempotency_key')
+    def validate_idempotency_key(cls, v):
+        if not v or not v.strip():
+            raise ValueError('Idempotency key is required')
+        return v.strip()
+
+class BulkIngestRequest(BaseModel):
+    items: List[BulkIngestItem]  # In the order they were captured
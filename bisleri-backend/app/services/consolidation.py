@@ -0,0 +1,329 @@
+# app/services/consolidation.py - Shared mfabric -> document_data consolidation engine
+#
+# Used by both the scheduled csv_to_DB.py run and the API-triggered DataSyncService,
+# so this module must only depend on SQLAlchemy (callers pass in their own engine).
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from sqlalchemy import text
+
+logger = logging.getLogger(__name__)
+
+# BIS Item Pattern - Items that should have paired PPJRTWMRT containers
+BIS_ITEM_PATTERN = 'BIS-20LTR01'
+CONTAINER_ITEM = 'PPJRTWMRT'
+
+# Incremental sync: re-aggregate only documents loaded into the mfabric tables (per the
+# mfabric_document_changes log the triggers keep) after the stored watermark minus this
+# lookback, which covers loads still uncommitted when the previous run read the log
+DEFAULT_LOOKBACK_HOURS = 24
+
+# Columns every source provides, with how they are aggregated per document:
+#   "max"  -> MAX(col)
+#   "trim" -> NULLIF(TRIM(MAX(col)), '')   (blank strings become NULL)
+#   "sum"  -> SUM(COALESCE(col, 0))
+COMMON_COLUMNS = [
+    ("document_date", "max"),
+    ("transporter_name", "trim"),
+    ("vehicle_no", "trim"),
+    ("irn_no", "trim"),
+]
+
+# Declarative source -> document_data mapping. Only the per-source extra columns differ,
+# the dedupe / BIS-pairing / aggregate / upsert pipeline is generated from this.
+SOURCES = [
+    {
+        "label": "DeliveryChallan",
+        "table": "mfabric_deliverychallan_data",
+        "columns": [
+            ("e_way_bill_no", "trim"),
+            ("route_no", "trim"),
+            ("customer_code", "max"),
+            ("customer_name", "max"),
+        ],
+    },
+    {
+        "label": "Invoice",
+        "table": "mfabric_invoice_data",
+        "columns": [
+            ("e_way_bill_no", "max"),
+            ("customer_code", "max"),
+            ("customer_name", "max"),
+        ],
+    },
+    {
+        "label": "Transfer",
+        "table": "mfabric_transferorder_rgp_data",
+        "columns": [
+            ("e_way_bill_no", "trim"),
+            ("from_warehouse_code", "max"),
+            ("to_warehouse_code", "max"),
+            ("route_code", "max"),
+            ("direct_dispatch", "max"),
+            ("sub_document_type", "max"),
+            ("salesman", "max"),
+        ],
+    },
+]
+
+AGGREGATES = {
+    "max": "MAX({col})",
+    "trim": "NULLIF(TRIM(MAX({col})), '')",
+    "sum": "SUM(COALESCE({col}, 0))",
+}
+
+def get_source(label):
+    """Look up a source definition by label or table name"""
+    for source in SOURCES:
+        if label in (source["label"], source["table"]):
+            return source
+    raise ValueError(f"Unknown consolidation source: {label}")
+
+def empty_result():
+    return {"inserts": 0, "updates": 0, "unchanged": 0, "sample_documents": []}
+
+def build_consolidation_sql(source, scope=""):
+    """Generate the dedupe -> BIS pairing -> aggregate -> guarded upsert statement for a source"""
+    table = source["table"]
+    columns = COMMON_COLUMNS + source["columns"]
+    names = [name for name, _ in columns]
+
+    source_cols = ", ".join(["document_no", "linenum", "itemid", "site", "document_type"] + names + ["total_quantity"])
+    aggregates = ",\n                ".join(
+        f"{AGGREGATES[kind].format(col=name)} AS {name}" for name, kind in columns
+    )
+    insert_cols = ", ".join(["site", "document_type", "document_no"] + names + ["total_quantity"])
+    select_cols = ", ".join(["site", "document_type", "document_no"] + names + ["total_quantity::text"])
+    updated = ["site", "document_type"] + names + ["total_quantity"]
+    set_clause = ",\n                ".join(f"{name} = EXCLUDED.{name}" for name in updated)
+    current_values = ", ".join(f"document_data.{name}" for name in updated)
+    new_values = ", ".join(f"EXCLUDED.{name}" for name in updated)
+
+    return f"""
+        WITH source_data AS (
+            SELECT DISTINCT ON (document_no, linenum)
+                {source_cols}
+            FROM {table}{scope}
+            ORDER BY document_no, linenum
+        ),
+        bis_items AS (
+            SELECT
+                document_no,
+                linenum,
+                itemid,
+                total_quantity,
+                ROW_NUMBER() OVER (
+                    PARTITION BY document_no, total_quantity
+                    ORDER BY linenum
+                ) as bis_rn
+            FROM source_data
+            WHERE itemid LIKE '{BIS_ITEM_PATTERN}%'
+        ),
+        matched_containers AS (
+            SELECT
+                p.document_no,
+                p.linenum,
+                ROW_NUMBER() OVER (
+                    PARTITION BY p.document_no, p.total_quantity
+                    ORDER BY p.linenum
+                ) as container_rn
+            FROM source_data p
+            WHERE p.itemid = '{CONTAINER_ITEM}'
+                AND EXISTS (
+                    SELECT 1
+                    FROM bis_items b
+                    WHERE b.document_no = p.document_no
+                    AND b.total_quantity = p.total_quantity
+                )
+        ),
+        skip_list AS (
+            SELECT DISTINCT
+                m.document_no,
+                m.linenum
+            FROM matched_containers m
+            INNER JOIN bis_items b
+                ON b.document_no = m.document_no
+                AND b.bis_rn = m.container_rn
+            INNER JOIN source_data s
+                ON s.document_no = m.document_no
+                AND s.linenum = m.linenum
+            WHERE s.total_quantity = b.total_quantity
+        ),
+        filtered AS (
+            SELECT s.*
+            FROM source_data s
+            WHERE NOT EXISTS (
+                SELECT 1 FROM skip_list sl
+                WHERE sl.document_no = s.document_no
+                AND sl.linenum = s.linenum
+            )
+        ),
+        aggregated AS (
+            SELECT
+                document_no,
+                site,
+                document_type,
+                {aggregates},
+                {AGGREGATES["sum"].format(col="total_quantity")} AS total_quantity
+            FROM filtered
+            GROUP BY document_no, site, document_type
+        ),
+        upserted AS (
+            INSERT INTO document_data ({insert_cols})
+            SELECT {select_cols}
+            FROM aggregated
+            ON CONFLICT (document_no) DO UPDATE SET
+                {set_clause}
+            WHERE ({current_values})
+                IS DISTINCT FROM ({new_values})
+            RETURNING document_no, (xmax = 0) AS inserted
+        )
+        SELECT
+            (SELECT COUNT(*) FROM aggregated) AS candidates,
+            COUNT(*) FILTER (WHERE inserted) AS inserts,
+            COUNT(*) FILTER (WHERE NOT inserted) AS updates,
+            (ARRAY_AGG(document_no))[1:3] AS sample_documents
+        FROM upserted;
+    """
+
+def get_watermark(conn, source_table):
+    """Get the ingestion time covered by the last run of a source table (None = never synced)"""
+    result = conn.execute(text("""
+        SELECT last_change_at FROM sync_watermarks
+        WHERE source_table = :source_table
+    """), {"source_table": source_table})
+    row = result.fetchone()
+    return row[0] if row else None
+
+def get_change_marker(conn, source_table):
+    """Newest change recorded for a source in mfabric_document_changes (or now if none).
+
+    Read before consolidating: everything up to it is then covered by the run.
+    """
+    return conn.execute(text("""
+        SELECT COALESCE(MAX(changed_at), NOW()) FROM mfabric_document_changes
+        WHERE source_table = :source_table
+    """), {"source_table": source_table}).scalar()
+
+def save_watermark(conn, source_table, change_marker):
+    """Advance the watermark to the change marker read before the run"""
+    conn.execute(text(f"""
+        INSERT INTO sync_watermarks (source_table, last_change_at, last_document_date, last_run_at)
+        SELECT :source_table, :change_marker, MAX(document_date), NOW() FROM {source_table}
+        ON CONFLICT (source_table) DO UPDATE SET
+            last_change_at = EXCLUDED.last_change_at,
+            last_document_date = COALESCE(EXCLUDED.last_document_date, sync_watermarks.last_document_date),
+            last_run_at = EXCLUDED.last_run_at
+    """), {"source_table": source_table, "change_marker": change_marker})
+
+def get_sync_scope(conn, source_table, full, lookback_hours=DEFAULT_LOOKBACK_HOURS):
+    """Build the WHERE clause and params limiting a run to recently loaded documents"""
+    if full:
+        return "", {}
+
+    try:
+        with conn.begin_nested():
+            watermark = get_watermark(conn, source_table)
+    except Exception as e:
+        logger.warning(f"Could not read watermark for {source_table}, falling back to full run: {str(e)}")
+        return "", {}
+
+    if watermark is None:
+        logger.info(f"  No watermark for {source_table} - processing all documents")
+        return "", {}
+
+    since = watermark - timedelta(hours=lookback_hours)
+    logger.info(f"  Incremental: documents loaded since {since} (watermark {watermark})")
+    scope = """
+            WHERE document_no IN (
+                SELECT document_no FROM mfabric_document_changes
+                WHERE source_table = :source_table AND changed_at >= :since
+            )"""
+    return scope, {"source_table": source_table, "since": since}
+
+def consolidate_source(engine, source, full=False, lookback_hours=DEFAULT_LOOKBACK_HOURS):
+    """Consolidate one source table into document_data in its own transaction/connection"""
+    with engine.begin() as conn:
+        conn.execute(text("SET LOCAL TIME ZONE 'UTC'"))
+
+        try:
+            with conn.begin_nested():
+                change_marker = get_change_marker(conn, source["table"])
+        except Exception as e:
+            # No change log (migration not applied): full run, watermark left unset
+            logger.warning(f"Could not read change log for {source['table']}, falling back to full run: {str(e)}")
+            change_marker, full = None, True
+
+        scope, params = get_sync_scope(conn, source["table"], full, lookback_hours)
+        result = conn.execute(text(build_consolidation_sql(source, scope)), params)
+        stats = _upsert_stats(result.fetchone())
+        if change_marker is not None:
+            try:
+                with conn.begin_nested():
+                    save_watermark(conn, source["table"], change_marker)
+            except Exception as e:
+                logger.warning(f"Could not save watermark for {source['table']}: {str(e)}")
+
+    return stats
+
+def consolidate_documents(engine, source, document_nos):
+    """Consolidate only the given document_nos of one source (near-real-time path).
+
+    Leaves the watermark alone; the periodic sync still covers these documents.
+    """
+    scope = """
+            WHERE document_no = ANY(:document_nos)"""
+    with engine.begin() as conn:
+        conn.execute(text("SET LOCAL TIME ZONE 'UTC'"))
+        result = conn.execute(text(build_consolidation_sql(source, scope)), {"document_nos": list(document_nos)})
+        return _upsert_stats(result.fetchone())
+
+def _upsert_stats(row):
+    candidates, inserts, updates, sample_documents = row
+    return {
+        "inserts": inserts,
+        "updates": updates,
+        "unchanged": candidates - inserts - updates,
+        "sample_documents": sample_documents or [],
+    }
+
+def _consolidate_and_log(engine, source, full, lookback_hours):
+    label = source["label"]
+    logger.info(f"Processing {label} data...")
+    started = time.monotonic()
+    try:
+        stats = consolidate_source(engine, source, full, lookback_hours)
+        stats["seconds"] = round(time.monotonic() - started, 2)
+        logger.info(
+            f"✓ {label}: {stats['inserts']} inserted, {stats['updates']} updated, "
+            f"{stats['unchanged']} unchanged ({stats['seconds']}s)"
+        )
+        if stats["sample_documents"]:
+            logger.info(f"  Sample documents: {stats['sample_documents']}")
+        return stats
+    except Exception as e:
+        logger.error(f"✗ {label} processing failed: {str(e)}")
+        return dict(empty_result(), error=str(e))
+
+def run_consolidation(engine, full=False, sources=None, lookback_hours=DEFAULT_LOOKBACK_HOURS, parallel=False):
+    """Consolidate every source; one failing source does not stop the others.
+
+    With parallel=True each source runs on its own pooled connection in a thread,
+    so wall time is the slowest source instead of the sum of all of them.
+    """
+    sources = SOURCES if sources is None else sources
+
+    if not parallel or len(sources) < 2:
+        return {
+            source["label"]: _consolidate_and_log(engine, source, full, lookback_hours)
+            for source in sources
+        }
+
+    logger.info(f"Running {len(sources)} sources in parallel")
+    with ThreadPoolExecutor(max_workers=len(sources), thread_name_prefix="consolidate") as pool:
+        futures = {
+            source["label"]: pool.submit(_consolidate_and_log, engine, source, full, lookback_hours)
+            for source in sources
+        }
+        return {label: future.result() for label, future in futures.items()}
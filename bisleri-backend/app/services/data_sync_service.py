@@ -1,14 +1,23 @@
 import logging
+import threading
+import time
 from datetime import datetime
 from sqlalchemy import text
 from app.database import engine
 from app.config import settings
+from app.services.consolidation import run_consolidation
+from app.services.sync_lock import SyncAlreadyRunning, get_lock_holder, sync_lock
 
 logger = logging.getLogger(__name__)
 
 class DataSyncService:
     def __init__(self):
         self.log_file = "sync_log.txt"
+        self._run_lock = threading.Lock()  # One consolidation at a time within this process
+
+    @property
+    def is_running(self) -> bool:
+        return self._run_lock.locked()
     
     def log_message(self, message: str):
         """Log messages to both file and console"""
@@ -23,87 +32,143 @@ class DataSyncService:
         logger.info(message)
         print(log_entry)
     
-    def push_to_document_data(self) -> bool:
-        """Push data directly from mfabric tables to document_data table"""
+    def start_run(self, trigger: str, mode: str, status: str = "running"):
+        """Insert a sync_runs row and return its id (None if history could not be written)"""
         try:
             with engine.begin() as conn:
-                # Set UTC timezone
-                conn.execute(text("SET TIME ZONE 'UTC';"))
-                
-                # Insert from mfabric_deliverychallan_data
-                result1 = conn.execute(text("""
-                    INSERT INTO document_data (
-                        site, document_type, document_no, document_date,
-                        e_way_bill_no, transporter_name, vehicle_no, irn_no,
-                        from_warehouse_code, warehouse_name, route_code, route_no,
-                        customer_code, customer_name, direct_dispatch, total_quantity,
-                        to_warehouse_code, sub_document_type, salesman
-                    )
-                    SELECT 
-                        site, document_type, document_no, document_date,
-                        e_way_bill_no, transporter_name, vehicle_no, irn_no,
-                        NULL AS from_warehouse_code, NULL AS warehouse_name,
-                        NULL AS route_code, route_no,
-                        customer_code, NULL AS customer_name,
-                        NULL AS direct_dispatch, total_quantity::varchar,
-                        NULL AS to_warehouse_code, NULL AS sub_document_type,
-                        NULL AS salesman
-                    FROM mfabric_deliverychallan_data
-                    ON CONFLICT (document_no) DO NOTHING;
-                """))
-                
-                # Insert from mfabric_invoice_data
-                result2 = conn.execute(text("""
-                    INSERT INTO document_data (
-                        site, document_type, document_no, document_date,
-                        e_way_bill_no, transporter_name, vehicle_no, irn_no,
-                        from_warehouse_code, warehouse_name, route_code, route_no,
-                        customer_code, customer_name, direct_dispatch, total_quantity,
-                        to_warehouse_code, sub_document_type, salesman
-                    )
-                    SELECT 
-                        site, document_type, document_no, document_date,
-                        e_way_bill_no, transporter_name, vehicle_no, irn_no,
-                        NULL AS from_warehouse_code, NULL AS warehouse_name,
-                        NULL AS route_code, NULL AS route_no,
-                        customer_code, customer_name,
-                        NULL AS direct_dispatch, total_quantity::varchar,
-                        NULL AS to_warehouse_code, NULL AS sub_document_type,
-                        NULL AS salesman
-                    FROM mfabric_invoice_data
-                    ON CONFLICT (document_no) DO NOTHING;
-                """))
-                
-                # Insert from mfabric_transferorder_rgp_data
-                result3 = conn.execute(text("""
-                    INSERT INTO document_data (
-                        site, document_type, document_no, document_date,
-                        e_way_bill_no, transporter_name, vehicle_no, irn_no,
-                        from_warehouse_code, warehouse_name, route_code, route_no,
-                        customer_code, customer_name, direct_dispatch, total_quantity,
-                        to_warehouse_code, sub_document_type, salesman
-                    )
-                    SELECT 
-                        site, document_type, document_no, document_date,
-                        e_way_bill_no, transporter_name, vehicle_no, irn_no,
-                        from_warehouse_code, NULL AS warehouse_name,
-                        route_code, NULL AS route_no,
-                        NULL AS customer_code, NULL AS customer_name,
-                        direct_dispatch, total_quantity::varchar,
-                        to_warehouse_code, sub_document_type, salesman
-                    FROM mfabric_transferorder_rgp_data
-                    ON CONFLICT (document_no) DO NOTHING;
-                """))
-                
-                # Get row counts
-                total_rows = result1.rowcount + result2.rowcount + result3.rowcount
-                
-            self.log_message(f"Successfully pushed {total_rows} new records from mfabric tables to document_data")
-            return True
+                return conn.execute(text("""
+                    INSERT INTO sync_runs (trigger, mode, status, started_at, inserts, updates, unchanged)
+                    VALUES (:trigger, :mode, :status, NOW(), 0, 0, 0)
+                    RETURNING id
+                """), {"trigger": trigger, "mode": mode, "status": status}).scalar()
+        except Exception as e:
+            logger.warning(f"Could not record sync run: {str(e)}")
+            return None
+
+    def finish_run(self, run_id, status: str, started: float, inserts: int = 0,
+                   updates: int = 0, unchanged: int = 0, error: str = None):
+        """Close a sync_runs row with its outcome and counts"""
+        if run_id is None:
+            return
+        try:
+            with engine.begin() as conn:
+                conn.execute(text("""
+                    UPDATE sync_runs SET
+                        status = :status,
+                        finished_at = NOW(),
+                        duration_seconds = :duration,
+                        inserts = :inserts,
+                        updates = :updates,
+                        unchanged = :unchanged,
+                        error = :error
+                    WHERE id = :run_id
+                """), {
+                    "run_id": run_id,
+                    "status": status,
+                    "duration": round(time.monotonic() - started, 2),
+                    "inserts": inserts,
+                    "updates": updates,
+                    "unchanged": unchanged,
+                    "error": error
+                })
+        except Exception as e:
+            logger.warning(f"Could not update sync run {run_id}: {str(e)}")
+
+    def push_to_document_data(self, full: bool = False, trigger: str = "manual",
+                              lock_mode: str = "skip", lock_timeout: float = 0) -> bool:
+        """Consolidate mfabric tables into document_data (same pipeline as csv_to_DB.py)
+
+        Only one consolidation runs at a time across all processes (see sync_lock).
+        Raises SyncAlreadyRunning if the lock could not be acquired per lock_mode.
+        """
+        mode = "full" if full else "incremental"
+        # One deadline for both waits, so callers never wait longer than lock_timeout
+        deadline = time.monotonic() + lock_timeout
+        if lock_mode == "wait":
+            acquired = self._run_lock.acquire(timeout=lock_timeout)
+        else:
+            acquired = self._run_lock.acquire(blocking=False)
+        if not acquired:
+            self.skip_run(trigger, mode, SyncAlreadyRunning())
+
+        try:
+            with sync_lock(engine, trigger, lock_mode, max(deadline - time.monotonic(), 0)):
+                return self._consolidate(full, trigger, mode)
+        except SyncAlreadyRunning as e:
+            self.skip_run(trigger, mode, e)
+        except Exception as e:
+            self.log_message(f"Error while pushing to document_data: {str(e)}")
+            return False
+        finally:
+            self._run_lock.release()
+
+    def skip_run(self, trigger: str, mode: str, error: SyncAlreadyRunning):
+        """Record a run that was skipped because another one holds the lock, then re-raise"""
+        self.log_message(f"{error}, skipping {trigger} run")
+        self.finish_run(self.start_run(trigger, mode, "skipped"), "skipped", time.monotonic(), error=str(error))
+        raise error
+
+    def _consolidate(self, full: bool, trigger: str, mode: str) -> bool:
+        started = time.monotonic()
+        run_id = self.start_run(trigger, mode)
+        try:
+            results = run_consolidation(
+                engine,
+                full=full,
+                lookback_hours=settings.SYNC_WATERMARK_LOOKBACK_HOURS,
+                parallel=settings.SYNC_PARALLEL
+            )
+
+            failed = [label for label, stats in results.items() if stats.get("error")]
+            total_inserts = sum(stats["inserts"] for stats in results.values())
+            total_updates = sum(stats["updates"] for stats in results.values())
+            total_unchanged = sum(stats["unchanged"] for stats in results.values())
+
+            self.log_message(
+                f"Consolidated mfabric tables into document_data: {total_inserts} inserted, "
+                f"{total_updates} updated, {total_unchanged} unchanged"
+                + (f" (failed: {', '.join(failed)})" if failed else "")
+            )
+            self.finish_run(
+                run_id,
+                "failed" if failed else "success",
+                started,
+                total_inserts,
+                total_updates,
+                total_unchanged,
+                "; ".join(f"{label}: {results[label]['error']}" for label in failed) or None
+            )
+            return not failed
             
         except Exception as e:
             self.log_message(f"Error while pushing to document_data: {str(e)}")
+            self.finish_run(run_id, "failed", started, error=str(e))
             return False
+
+    def get_lock_holder(self):
+        """Who currently holds the cross-process sync lock (None when idle)"""
+        try:
+            with engine.connect() as conn:
+                return get_lock_holder(conn)
+        except Exception as e:
+            logger.warning(f"Could not read sync lock holder: {str(e)}")
+            return None
+
+    def get_recent_runs(self, limit: int = 20):
+        """Most recent sync_runs rows, newest first"""
+        try:
+            with engine.connect() as conn:
+                rows = conn.execute(text("""
+                    SELECT id, trigger, mode, status, started_at, finished_at,
+                           duration_seconds, inserts, updates, unchanged, error
+                    FROM sync_runs
+                    ORDER BY started_at DESC
+                    LIMIT :limit
+                """), {"limit": limit}).mappings().all()
+                return [dict(row) for row in rows]
+        except Exception as e:
+            logger.warning(f"Could not read sync run history: {str(e)}")
+            return []
     
     def get_sync_status(self):
         """Get current sync status and counts"""
@@ -0,0 +1,215 @@
+# app/services/mfabric_listener.py - Near-real-time mfabric -> document_data consolidation
+#
+# The notify_mfabric_change() triggers send the document_nos of every load on the
+# mfabric staging tables; one listener (elected with an advisory lock across workers)
+# consolidates them in debounced batches under the sync lock. The periodic sync still
+# covers everything, so a batch that fails is only retried, never lost for good.
+import json
+import logging
+import select
+import threading
+import time
+from datetime import datetime
+from typing import Optional
+import psycopg2
+from app.config import settings
+from app.database import engine
+from app.services.consolidation import consolidate_documents, get_source
+from app.services.sync_lock import SyncAlreadyRunning, sync_lock
+
+logger = logging.getLogger(__name__)
+
+# Channel used by the notify_mfabric_change() triggers on the mfabric staging tables
+NOTIFY_CHANNEL = "mfabric_changes"
+
+# Session advisory lock electing the one listener across all workers/processes ("BLSN")
+LISTENER_LOCK_KEY = 0x424C534E
+
+# How often a standby listener checks whether the active one went away
+STANDBY_RETRY_SECONDS = 10
+
+class MfabricListener:
+    """Consolidates mfabric documents into document_data seconds after they land.
+
+    Holds a dedicated LISTEN connection, collects the document_nos sent by the staging
+    table triggers and consolidates them in one batch per source once notifications
+    stop arriving for `debounce_seconds` (or after `max_delay_seconds` at the latest).
+    Bulk loads only send a marker and are left to the periodic sync.
+
+    Every API worker starts one, but only the holder of LISTENER_LOCK_KEY listens; the
+    others stand by and take over when its connection goes away. Batches are consolidated
+    under the sync lock, so they never overlap a scheduled or manual sync.
+    """
+
+    def __init__(self, debounce_seconds: float = None, max_delay_seconds: float = None):
+        self.debounce_seconds = debounce_seconds if debounce_seconds is not None else settings.MFABRIC_LISTENER_DEBOUNCE_SECONDS
+        self.max_delay_seconds = max_delay_seconds if max_delay_seconds is not None else settings.MFABRIC_LISTENER_MAX_DELAY_SECONDS
+        self._pending = {}  # source table -> set of document_nos
+        self._first_pending_at = None
+        self._last_notify_at = None
+        self._retry_after = 0.0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.connected = False
+        self.active = False  # Holds LISTENER_LOCK_KEY (False while standing by)
+        self.last_flush_at: Optional[datetime] = None
+        self.documents_consolidated = 0
+        self.bulk_loads_seen = 0
+
+    @property
+    def is_running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self.is_running:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run_forever, name="mfabric-listener", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def run_forever(self):
+        """LISTEN until stopped, reconnecting with backoff if the connection drops"""
+        backoff = 1
+        while not self._stop.is_set():
+            try:
+                self._listen()
+                backoff = 1
+            except Exception as e:
+                self.connected = False
+                logger.error(f"mfabric listener error, reconnecting in {backoff}s: {str(e)}")
+                self._stop.wait(backoff)
+                backoff = min(backoff * 2, 60)
+
+    def _listen(self):
+        conn = psycopg2.connect(
+            host=settings.DB_HOST,
+            port=settings.DB_PORT,
+            dbname=settings.DB_NAME,
+            user=settings.DB_USER,
+            password=settings.DB_PASSWORD,
+            application_name="bisleri-mfabric-listener"
+        )
+        try:
+            conn.set_session(autocommit=True)
+            self.connected = True
+            if not self._elect(conn):
+                return
+            with conn.cursor() as cur:
+                cur.execute(f"LISTEN {NOTIFY_CHANNEL}")
+            logger.info(f"mfabric listener waiting for notifications on '{NOTIFY_CHANNEL}'")
+
+            while not self._stop.is_set():
+                if select.select([conn], [], [], self._poll_timeout()) != ([], [], []):
+                    conn.poll()
+                    while conn.notifies:
+                        self._collect(conn.notifies.pop(0).payload)
+                if self._due():
+                    self.flush()
+        finally:
+            self.connected = self.active = False
+            conn.close()
+
+    def _elect(self, conn) -> bool:
+        """Wait until this listener holds LISTENER_LOCK_KEY (released with the connection)"""
+        standing_by = False
+        while not self._stop.is_set():
+            with conn.cursor() as cur:
+                cur.execute("SELECT pg_try_advisory_lock(%s)", (LISTENER_LOCK_KEY,))
+                if cur.fetchone()[0]:
+                    self.active = True
+                    return True
+            if not standing_by:
+                logger.info("Another mfabric listener is active, standing by")
+                standing_by = True
+            self._stop.wait(STANDBY_RETRY_SECONDS)
+        return False
+
+    def _poll_timeout(self) -> float:
+        if not self._pending:
+            return 1.0
+        return max(0.05, min(self.debounce_seconds, 1.0))
+
+    def _collect(self, payload: str):
+        try:
+            event = json.loads(payload)
+        except ValueError:
+            logger.warning(f"Ignoring malformed mfabric notification: {payload[:200]}")
+            return
+
+        if event.get("bulk"):
+            self.bulk_loads_seen += 1
+            logger.info(f"Bulk load of {event.get('count')} documents into {event.get('table')} - left to periodic sync")
+            return
+
+        now = time.monotonic()
+        self._pending.setdefault(event["table"], set()).update(event.get("document_nos") or [])
+        self._first_pending_at = self._first_pending_at or now
+        self._last_notify_at = now
+
+    def _due(self) -> bool:
+        if not self._pending:
+            return False
+        now = time.monotonic()
+        if now < self._retry_after:
+            return False
+        return (now - self._last_notify_at >= self.debounce_seconds
+                or now - self._first_pending_at >= self.max_delay_seconds)
+
+    def flush(self):
+        """Consolidate every pending document, one transaction per source table"""
+        pending, self._pending = self._pending, {}
+        self._first_pending_at = self._last_notify_at = None
+
+        handled = set()  # consolidated, or already requeued by the per-table retry
+        try:
+            with sync_lock(engine, "listener", "wait", self.max_delay_seconds):
+                for table, document_nos in pending.items():
+                    handled.add(table)
+                    try:
+                        stats = consolidate_documents(engine, get_source(table), sorted(document_nos))
+                        self.documents_consolidated += stats["inserts"] + stats["updates"]
+                        logger.info(
+                            f"Near-real-time sync {table}: {len(document_nos)} documents, "
+                            f"{stats['inserts']} inserted, {stats['updates']} updated"
+                        )
+                    except Exception as e:
+                        logger.error(f"Near-real-time sync of {table} failed, will retry: {str(e)}")
+                        self._retry(table, document_nos)
+        except SyncAlreadyRunning as e:
+            # A long sync holds the lock; keep the batch for after it
+            logger.info(f"{e}, near-real-time sync will retry")
+            for table, document_nos in pending.items():
+                self._retry(table, document_nos)
+        except Exception as e:
+            # Taking the lock or connecting failed (e.g. the database went away)
+            logger.error(f"Near-real-time sync failed, will retry: {str(e)}")
+            for table, document_nos in pending.items():
+                if table not in handled:
+                    self._retry(table, document_nos)
+        self.last_flush_at = datetime.now()
+
+    def _retry(self, table: str, document_nos):
+        """Put documents back in the queue, flushed again after max_delay_seconds"""
+        self._pending.setdefault(table, set()).update(document_nos)
+        self._first_pending_at = self._last_notify_at = time.monotonic()
+        self._retry_after = self._first_pending_at + self.max_delay_seconds
+
+    def get_status(self):
+        return {
+            "enabled": self.is_running,
+            "connected": self.connected,
+            "active": self.active,
+            "pending_documents": sum(len(docs) for docs in self._pending.values()),
+            "documents_consolidated": self.documents_consolidated,
+            "bulk_loads_seen": self.bulk_loads_seen,
+            "last_flush_at": self.last_flush_at,
+        }
+
+# Singleton instance
+mfabric_listener = MfabricListener()
@@ -0,0 +1,238 @@
+# app/services/rollups.py - Daily rollups behind the dashboard / statistics endpoints
+#
+# insights_data and raw_materials_data rows can only be edited for 48 hours, so once a
+# day is older than today - 2 its totals never change. advance_daily_rollups() (run by
+# the sync scheduler) rolls those closed days up per warehouse and records the last
+# covered day in sync_watermarks. The stats endpoints read covered days from the rollup
+# tables and everything newer (including "today") from the raw rows. Entries written
+# late for an already covered day (offline /bulk-ingest replays) and the few edits allowed
+# past the window (/assign-document-to-manual-entry) refresh that day on write.
+import logging
+from datetime import date, datetime, time, timedelta
+from typing import Callable, List, Optional, Tuple
+from sqlalchemy import Date, cast, delete, distinct, func, insert, literal, or_, select, text, true, union
+from sqlalchemy.dialects.postgresql import aggregate_order_by, array_agg
+from app.config import settings
+from app.models import (
+    InsightsData, RawMaterialsData,
+    InsightsDailyRollup, RawMaterialsDailyRollup, DailyVehicleActivity
+)
+from app.models.insights import operational_field_filled
+
+logger = logging.getLogger(__name__)
+
+# sync_watermarks.source_table of the rollups; last_document_date is the last covered day
+ROLLUP_WATERMARK = "daily_rollups"
+
+# Days that can still change: today and the two days before (48-hour edit window)
+OPEN_DAYS = 3
+
+# Advisory lock namespace for refreshing one rolled-up day on write ("ROLL")
+ROLLUP_LOCK_NAMESPACE = 0x524F4C4C
+
+READ_WATERMARK_SQL = """
+    SELECT CAST(last_document_date AS DATE) FROM sync_watermarks
+    WHERE source_table = :source_table
+"""
+
+SET_WATERMARK_SQL = """
+    UPDATE sync_watermarks
+    SET last_document_date = CAST(:day AS TIMESTAMP), last_run_at = NOW()
+    WHERE source_table = :source_table
+"""
+
+# Oldest day with any gate data, where the first backfill starts
+FIRST_DAY_SQL = """
+    SELECT CAST(LEAST(
+        (SELECT MIN(date) FROM insights_data),
+        (SELECT MIN(date_time) FROM raw_materials_data)
+    ) AS DATE)
+"""
+
+def closed_through(today: date = None) -> date:
+    """Last day whose rows can no longer be edited"""
+    return (today or date.today()) - timedelta(days=OPEN_DAYS)
+
+def _day_start(day: date) -> datetime:
+    return datetime.combine(day, time.min)
+
+def refresh_daily_rollups(db, first_day: date, last_day: date, warehouse_code: Optional[str] = None):
+    """Rebuild the rollups of days first_day..last_day (one warehouse, or all) from the raw rows.
+
+    `db` is a Session or Connection; runs in the caller's transaction.
+    """
+    start, end = _day_start(first_day), _day_start(last_day + timedelta(days=1))
+
+    def scoped(model):
+        conditions = [model.day >= first_day, model.day <= last_day]
+        if warehouse_code is not None:
+            conditions.append(model.warehouse_code == warehouse_code)
+        return conditions
+
+    insights_rows = [InsightsData.date >= start, InsightsData.date < end]
+    rm_rows = [RawMaterialsData.date_time >= start, RawMaterialsData.date_time < end]
+    if warehouse_code is not None:
+        insights_rows.append(InsightsData.warehouse_code == warehouse_code)
+        rm_rows.append(RawMaterialsData.warehouse_code == warehouse_code)
+
+    for model in (InsightsDailyRollup, RawMaterialsDailyRollup, DailyVehicleActivity):
+        db.execute(delete(model).where(*scoped(model)))
+
+    # insights_data: one row per day / warehouse / site
+    day = cast(InsightsData.date, Date)
+    gate_entry_no = func.nullif(InsightsData.gate_entry_no, '')
+    edit_count = func.coalesce(InsightsData.edit_count, 0)
+    driver, km, loaders = (operational_field_filled(getattr(InsightsData, field))
+                           for field in ('driver_name', 'km_reading', 'loader_names'))
+    most_edited_order = (InsightsData.edit_count.desc(), InsightsData.id)
+    db.execute(insert(InsightsDailyRollup).from_select(
+        ["day", "warehouse_code", "site_code", "movements", "gate_in_entries", "gate_out_entries",
+         "operational_complete", "missing_driver", "missing_km", "missing_loaders", "multiple_edits",
+         "total_edits", "max_edit_count", "most_edited_id", "most_edited_gate_entry_no", "updated_at"],
+        select(
+            day,
+            InsightsData.warehouse_code,
+            InsightsData.site_code,
+            func.count(),
+            func.count(distinct(gate_entry_no)).filter(InsightsData.movement_type == "Gate-In"),
+            func.count(distinct(gate_entry_no)).filter(InsightsData.movement_type == "Gate-Out"),
+            func.count().filter(driver, km, loaders),
+            func.count().filter(~driver),
+            func.count().filter(~km),
+            func.count().filter(~loaders),
+            func.count().filter(edit_count > 1),
+            func.coalesce(func.sum(edit_count), 0),
+            func.coalesce(func.max(InsightsData.edit_count), 0),
+            array_agg(aggregate_order_by(InsightsData.id, *most_edited_order))
+                .filter(InsightsData.edit_count > 0)[1],
+            array_agg(aggregate_order_by(InsightsData.gate_entry_no, *most_edited_order))
+                .filter(InsightsData.edit_count > 0)[1],
+            func.now()
+        ).where(*insights_rows).group_by(day, InsightsData.warehouse_code, InsightsData.site_code)
+    ))
+
+    # raw_materials_data
+    rm_day = cast(RawMaterialsData.date_time, Date)
+    db.execute(insert(RawMaterialsDailyRollup).from_select(
+        ["day", "warehouse_code", "site_code", "entries", "gate_in_count", "gate_out_count",
+         "edited_entries", "updated_at"],
+        select(
+            rm_day,
+            RawMaterialsData.warehouse_code,
+            RawMaterialsData.site_code,
+            func.count(),
+            func.count().filter(RawMaterialsData.gate_type == "Gate-In"),
+            func.count().filter(RawMaterialsData.gate_type == "Gate-Out"),
+            func.count().filter(func.coalesce(RawMaterialsData.edit_count, 0) > 0),
+            func.now()
+        ).where(*rm_rows).group_by(rm_day, RawMaterialsData.warehouse_code, RawMaterialsData.site_code)
+    ))
+
+    # Vehicles per day; blank insights vehicle numbers are never counted
+    activity_columns = ["source", "day", "warehouse_code", "site_code", "vehicle_no"]
+    db.execute(insert(DailyVehicleActivity).from_select(activity_columns, select(
+        literal("insights"), day, InsightsData.warehouse_code, InsightsData.site_code, InsightsData.vehicle_no
+    ).where(*insights_rows, InsightsData.vehicle_no != '').distinct()))
+    db.execute(insert(DailyVehicleActivity).from_select(activity_columns, select(
+        literal("raw_materials"), rm_day, RawMaterialsData.warehouse_code, RawMaterialsData.site_code,
+        RawMaterialsData.vehicle_no
+    ).where(*rm_rows).distinct()))
+
+def advance_daily_rollups(engine, today: date = None) -> int:
+    """Roll up every closed day not covered yet; returns the number of days rolled up.
+
+    Works in chunks of ROLLUP_CHUNK_DAYS days, one transaction each, with the watermark
+    row locked so concurrent runners and late-entry refreshes wait for each other.
+    """
+    target = closed_through(today)
+    params = {"source_table": ROLLUP_WATERMARK}
+    rolled = 0
+    while True:
+        with engine.begin() as conn:
+            conn.execute(text("""
+                INSERT INTO sync_watermarks (source_table) VALUES (:source_table)
+                ON CONFLICT (source_table) DO NOTHING
+            """), params)
+            covered = conn.execute(text(READ_WATERMARK_SQL + " FOR UPDATE"), params).scalar()
+            if covered is None:
+                first_day = conn.execute(text(FIRST_DAY_SQL)).scalar()
+                covered = first_day - timedelta(days=1) if first_day else target
+
+            last_day = min(covered + timedelta(days=settings.ROLLUP_CHUNK_DAYS), target)
+            if last_day > covered:
+                refresh_daily_rollups(conn, covered + timedelta(days=1), last_day)
+                rolled += (last_day - covered).days
+            conn.execute(text(SET_WATERMARK_SQL), {**params, "day": max(last_day, covered)})
+
+        if last_day >= target or last_day <= covered:
+            return rolled
+
+def refresh_rolled_up_day(db, day: date, warehouse_code: Optional[str]):
+    """Rebuild an already rolled-up day after rows dated `day` were added or edited.
+
+    Call after writing the rows, in the same transaction. Holds the watermark row
+    (FOR SHARE) so a concurrent advance_daily_rollups run waits for this commit.
+    """
+    db.flush()
+    covered = db.execute(text(READ_WATERMARK_SQL + " FOR SHARE"), {"source_table": ROLLUP_WATERMARK}).scalar()
+    if covered is None or day > covered:
+        return
+
+    # Two late entries for the same day / warehouse rebuild one after the other
+    db.execute(
+        text("SELECT pg_advisory_xact_lock(CAST(:namespace AS INTEGER), hashtext(CAST(:key AS TEXT)))"),
+        {"namespace": ROLLUP_LOCK_NAMESPACE, "key": f"{day.isoformat()}|{warehouse_code}"}
+    )
+    refresh_daily_rollups(db, day, day, warehouse_code)
+
+def rolled_up_through(db) -> Optional[date]:
+    """Last day covered by the rollups (None before the first run)"""
+    return db.execute(text(READ_WATERMARK_SQL), {"source_table": ROLLUP_WATERMARK}).scalar()
+
+def rollup_span(db, start, end: Optional[date] = None) -> Optional[Tuple[date, date]]:
+    """(first_day, last_day) of the range start..end that can be read from the rollups.
+
+    `start` may be a datetime, in which case a partial first day is left to the raw rows;
+    `end` defaults to open-ended. Returns None when no day of the range is covered.
+    """
+    covered = rolled_up_through(db)
+    if covered is None:
+        return None
+    if isinstance(start, datetime):
+        first_day = start.date() if start.time() == time.min else start.date() + timedelta(days=1)
+    else:
+        first_day = start
+    last_day = min(covered, end) if end else covered
+    return (first_day, last_day) if first_day <= last_day else None
+
+def outside_span(column, span: Optional[Tuple[date, date]]):
+    """Condition on a raw date/timestamp column selecting the rows not covered by `span`"""
+    if span is None:
+        return true()
+    first_day, last_day = span
+    return or_(column < _day_start(first_day), column >= _day_start(last_day + timedelta(days=1)))
+
+def rollup_totals(db, model, span, scope: Callable[..., List], columns: List[str]) -> dict:
+    """Sum rollup `columns` over the days of `span`, filtered by scope(model)"""
+    if span is None:
+        return {column: 0 for column in columns}
+    row = db.execute(
+        select(*[func.coalesce(func.sum(getattr(model, column)), 0).label(column) for column in columns])
+        .where(model.day >= span[0], model.day <= span[1], *scope(model))
+    ).one()
+    return {column: int(row._mapping[column]) for column in columns}
+
+def count_distinct_vehicles(db, source: str, span, scope: Callable[..., List], raw_vehicles) -> int:
+    """Distinct vehicles over rolled-up days (daily_vehicle_activity) plus `raw_vehicles`,
+    a SELECT of the vehicle_no column for the rows outside the span"""
+    vehicles = raw_vehicles
+    if span is not None:
+        vehicles = union(raw_vehicles, select(DailyVehicleActivity.vehicle_no).where(
+            DailyVehicleActivity.source == source,
+            DailyVehicleActivity.day >= span[0],
+            DailyVehicleActivity.day <= span[1],
+            *scope(DailyVehicleActivity)
+        ))
+    else:
+        vehicles = vehicles.distinct()
+    return db.execute(select(func.count()).select_from(vehicles.subquery())).scalar()
@@ -0,0 +1,107 @@
+# app/services/sync_lock.py - Cross-process guard for the document_data consolidation
+#
+# csv_to_DB.py, the scheduler and the /sync endpoints may live in different processes,
+# so the guard is a Postgres session-level advisory lock held on a dedicated connection.
+# Like consolidation.py this module only depends on SQLAlchemy.
+import logging
+import os
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from sqlalchemy import text
+
+logger = logging.getLogger(__name__)
+
+# Advisory lock key shared by every consolidation runner ("BSYN")
+SYNC_LOCK_KEY = 0x4253594E
+
+# application_name of the connection holding the lock, used to report the holder:
+# "bisleri-sync:<holder>:<pid>" while waiting, "bisleri-sync@<epoch acquired>:<holder>:<pid>" once held
+LOCK_APPLICATION_PREFIX = "bisleri-sync"
+
+LOCK_POLL_SECONDS = 0.5
+
+class SyncAlreadyRunning(Exception):
+    """Raised when another process holds the sync lock"""
+
+    def __init__(self, holder=None):
+        self.holder = holder
+        if holder:
+            message = f"Sync already running ({holder['application_name']}, pid {holder['pid']})"
+        else:
+            message = "Sync already running"
+        super().__init__(message)
+
+@contextmanager
+def sync_lock(engine, holder: str, mode: str = "skip", timeout: float = 0):
+    """Hold the consolidation lock for the duration of the block.
+
+    mode="skip" gives up immediately if the lock is taken, mode="wait" polls for up
+    to `timeout` seconds. Raises SyncAlreadyRunning when the lock was not acquired.
+    """
+    if mode not in ("skip", "wait"):
+        raise ValueError(f"Unknown sync lock mode: {mode}")
+
+    conn = engine.connect().execution_options(isolation_level="AUTOCOMMIT")
+    acquired = False
+    try:
+        application_name = f"{LOCK_APPLICATION_PREFIX}:{holder}:{os.getpid()}"[:63]
+        conn.execute(text("SELECT set_config('application_name', :name, false)"), {"name": application_name})
+
+        deadline = time.monotonic() + (timeout if mode == "wait" else 0)
+        while True:
+            acquired = conn.execute(text("SELECT pg_try_advisory_lock(:key)"), {"key": SYNC_LOCK_KEY}).scalar()
+            if acquired or time.monotonic() >= deadline:
+                break
+            time.sleep(LOCK_POLL_SECONDS)
+
+        if not acquired:
+            raise SyncAlreadyRunning(get_lock_holder(conn))
+
+        # Record when the lock was taken; pg_stat_activity has no such timestamp
+        application_name = f"{LOCK_APPLICATION_PREFIX}@{int(time.time())}:{holder}:{os.getpid()}"[:63]
+        conn.execute(text("SELECT set_config('application_name', :name, false)"), {"name": application_name})
+        logger.info(f"Acquired sync lock as {application_name}")
+        yield
+    finally:
+        try:
+            if acquired:
+                conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": SYNC_LOCK_KEY})
+            conn.execute(text("RESET application_name"))
+        except Exception as e:
+            # The lock dies with the session; make sure this connection is not reused
+            logger.warning(f"Could not release sync lock cleanly: {str(e)}")
+            conn.invalidate()
+        conn.close()
+
+def get_lock_holder(conn):
+    """Return who currently holds the sync lock, or None if it is free"""
+    row = conn.execute(text("""
+        SELECT
+            a.pid,
+            a.application_name,
+            a.client_addr::text AS client_addr
+        FROM pg_locks l
+        JOIN pg_stat_activity a ON a.pid = l.pid
+        WHERE l.locktype = 'advisory'
+            AND l.granted
+            AND l.database = (SELECT oid FROM pg_database WHERE datname = current_database())
+            AND ((l.classid::bigint << 32) | l.objid::bigint) = :key
+            AND l.objsubid = 1
+        LIMIT 1
+    """), {"key": SYNC_LOCK_KEY}).mappings().fetchone()
+    if not row:
+        return None
+    holder = dict(row)
+    holder["held_since"] = lock_acquired_at(holder["application_name"])
+    return holder
+
+def lock_acquired_at(application_name):
+    """Acquisition time encoded in the holder's application_name (None if not recorded)"""
+    prefix = f"{LOCK_APPLICATION_PREFIX}@"
+    if not application_name or not application_name.startswith(prefix):
+        return None
+    try:
+        return datetime.fromtimestamp(int(application_name[len(prefix):].split(":", 1)[0]), timezone.utc)
+    except ValueError:
+        return None
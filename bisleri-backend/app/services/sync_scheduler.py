@@ -0,0 +1,119 @@
+import asyncio
+import logging
+import random
+from datetime import datetime, timedelta
+from typing import Optional
+from app.config import settings
+from app.database import engine
+from app.services.data_sync_service import data_sync_service
+from app.services.rollups import advance_daily_rollups
+from app.services.sync_lock import SyncAlreadyRunning
+from app.utils.idempotency import purge_expired_idempotency_keys
+
+logger = logging.getLogger(__name__)
+
+class SyncScheduler:
+    """Periodically runs the mfabric -> document_data consolidation on the shared engine.
+
+    Runs as an asyncio task (FastAPI lifespan or scheduler.py); the blocking
+    consolidation itself is pushed to a worker thread so the event loop stays free.
+    """
+
+    def __init__(self, interval_seconds: int = None, jitter_seconds: int = None,
+                 run_on_start: bool = None):
+        self.interval_seconds = interval_seconds if interval_seconds is not None else settings.SYNC_INTERVAL_SECONDS
+        self.jitter_seconds = jitter_seconds if jitter_seconds is not None else settings.SYNC_JITTER_SECONDS
+        self.run_on_start = run_on_start if run_on_start is not None else settings.SYNC_RUN_ON_START
+        self._task: Optional[asyncio.Task] = None
+        self.next_run_at: Optional[datetime] = None
+        self.last_run_at: Optional[datetime] = None
+        self.last_result: Optional[bool] = None
+        self.skipped_runs = 0
+
+    @property
+    def is_running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        if self.is_running:
+            return
+        self._task = asyncio.create_task(self.run_forever(), name="sync-scheduler")
+        logger.info(
+            f"Sync scheduler started: every {self.interval_seconds}s "
+            f"(+0-{self.jitter_seconds}s jitter)"
+        )
+
+    async def stop(self):
+        if not self.is_running:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        self.next_run_at = None
+        logger.info("Sync scheduler stopped")
+
+    async def run_forever(self):
+        if self.run_on_start:
+            await self.run_once()
+        while True:
+            delay = self.interval_seconds + random.uniform(0, self.jitter_seconds)
+            self.next_run_at = datetime.now() + timedelta(seconds=delay)
+            await asyncio.sleep(delay)
+            await self.run_once()
+            await self.run_maintenance()
+
+    async def run_once(self) -> Optional[bool]:
+        """Run one scheduled sync unless one is already in progress (here or elsewhere)"""
+        if data_sync_service.is_running:
+            self.skipped_runs += 1
+            logger.info("Previous sync still running, skipping this tick")
+            return None
+
+        self.last_run_at = datetime.now()
+        try:
+            self.last_result = await asyncio.to_thread(
+                data_sync_service.push_to_document_data, trigger="scheduled", lock_mode="skip"
+            )
+        except SyncAlreadyRunning as e:
+            # Another process (csv_to_DB.py, scheduler.py, a manual sync) is consolidating
+            self.skipped_runs += 1
+            logger.info(f"Skipping scheduled sync: {str(e)}")
+            return None
+        except Exception as e:
+            logger.error(f"Scheduled sync failed: {str(e)}")
+            self.last_result = False
+        return self.last_result
+
+    async def run_maintenance(self):
+        """Housekeeping that rides on the sync interval"""
+        try:
+            purged = await asyncio.to_thread(purge_expired_idempotency_keys, engine)
+            if purged:
+                logger.info(f"Purged {purged} expired idempotency keys")
+        except Exception as e:
+            logger.error(f"Idempotency key purge failed: {str(e)}")
+
+        try:
+            rolled = await asyncio.to_thread(advance_daily_rollups, engine)
+            if rolled:
+                logger.info(f"Rolled up {rolled} days of gate data")
+        except Exception as e:
+            logger.error(f"Daily rollup failed: {str(e)}")
+
+    def get_status(self):
+        return {
+            "enabled": self.is_running,
+            "interval_seconds": self.interval_seconds,
+            "jitter_seconds": self.jitter_seconds,
+            "sync_in_progress": data_sync_service.is_running,
+            "last_run_at": self.last_run_at,
+            "last_result": self.last_result,
+            "next_run_at": self.next_run_at,
+            "skipped_runs": self.skipped_runs,
+        }
+
+# Singleton instance
+sync_scheduler = SyncScheduler()
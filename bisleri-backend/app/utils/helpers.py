@@ -1,142 +1,172 @@
-# app/utils/helpers.py - UPDATED with dual table check for gate entry numbers
+# app/utils/helpers.py - Gate entry numbers allocated from per-warehouse yearly counters
+import logging
 import string
 import random
 from datetime import datetime
-import psycopg2
-from app.config import settings
-
-def get_connection():
-    """Get database connection using raw psycopg2"""
-    return psycopg2.connect(
-        host=settings.DB_HOST,
-        port=settings.DB_PORT,
-        database=settings.DB_NAME,
-        user=settings.DB_USER,
-        password=settings.DB_PASSWORD
-    )
+from fastapi import HTTPException
+from sqlalchemy import text
+from sqlalchemy.orm import Session
 
-def fetch_user_details(username):
-    """Fetch fresh user details from users_master table"""
-    conn = get_connection()
-    cursor = conn.cursor()
-    try:
-        cursor.execute("""
-            SELECT username, site_code, warehouse_code, warehouse_name
-            FROM users_master
-            WHERE username = %s
-        """, (username,))
-        result = cursor.fetchone()
-        
-        if result:
-            return {
-                "username": result[0],
-                "site_code": result[1],
-                "warehouse_code": result[2],
-                "warehouse_name": result[3]
-            }
-        return None
-    except Exception as e:
-        print(f"Error fetching user details: {str(e)}")
-        return None
-    finally:
-        cursor.close()
-        conn.close()
+logger = logging.getLogger(__name__)
 
-def check_gate_entry_exists(gate_entry_no):
-    """Check if gate entry number exists in either insights_data or raw_materials_data"""
-    conn = get_connection()
-    cursor = conn.cursor()
-    try:
-        # Check insights_data table
-        cursor.execute("""
-            SELECT 1 FROM insights_data WHERE gate_entry_no = %s
-            UNION
-            SELECT 1 FROM raw_materials_data WHERE gate_entry_no = %s
-            LIMIT 1
-        """, (gate_entry_no, gate_entry_no))
-        result = cursor.fetchone()
-        return result is not None 
+# The lookups below run on the caller's Session: database errors are raised, not
+# swallowed, since the caller's transaction is aborted after one anyway
+
+def fetch_user_details(db: Session, username):
+    """Fetch fresh user details from users_master table (None if the user doesn't exist)"""
+    result = db.execute(text("""
+        SELECT username, site_code, warehouse_code, warehouse_name
+        FROM users_master
+        WHERE username = :username
+    """), {"username": username}).fetchone()
     
-    except Exception as e:
-        print(f"Error checking gate entry existence: {str(e)}")
-        return True  # Assume exists to be safe
-    finally:
-        cursor.close()
-        conn.close()
+    if result:
+        return {
+            "username": result[0],
+            "site_code": result[1],
+            "warehouse_code": result[2],
+            "warehouse_name": result[3]
+        }
+    return None
+
+def check_gate_entry_exists(db: Session, gate_entry_no):
+    """Check if gate entry number exists in either insights_data or raw_materials_data"""
+    result = db.execute(text("""
+        SELECT 1 FROM insights_data WHERE gate_entry_no = :gate_entry_no
+        UNION
+        SELECT 1 FROM raw_materials_data WHERE gate_entry_no = :gate_entry_no
+        LIMIT 1
+    """), {"gate_entry_no": gate_entry_no}).fetchone()
+    return result is not None
+
+# Gate entry numbers are {warehouse_code}{year}{6-digit sequence}
+GATE_ENTRY_SEQUENCE_DIGITS = 6
+MAX_GATE_ENTRY_SEQUENCE = 10 ** GATE_ENTRY_SEQUENCE_DIGITS - 1
+
+# Allocates the next per-warehouse-per-year sequence number in one round trip. Returns no
+# row for an unknown warehouse; "taken" flags numbers already used by the old random scheme.
+ALLOCATE_GATE_ENTRY_SQL = """
+    WITH next AS (
+        INSERT INTO gate_entry_counters (warehouse_code, year, last_value, updated_at)
+        SELECT CAST(:warehouse_code AS VARCHAR), CAST(:year AS INTEGER), 1, NOW()
+        WHERE EXISTS (SELECT 1 FROM location_master WHERE warehouse_code = :warehouse_code)
+        ON CONFLICT (warehouse_code, year) DO UPDATE SET
+            last_value = gate_entry_counters.last_value + 1,
+            updated_at = NOW()
+        RETURNING last_value
+    ),
+    candidate AS (
+        SELECT last_value, CAST(:prefix AS VARCHAR) || LPAD(last_value::text, 6, '0') AS gate_entry_no
+        FROM next
+    )
+    SELECT
+        last_value,
+        gate_entry_no,
+        EXISTS (SELECT 1 FROM insights_data i WHERE i.gate_entry_no = candidate.gate_entry_no)
+            OR EXISTS (SELECT 1 FROM raw_materials_data r WHERE r.gate_entry_no = candidate.gate_entry_no) AS taken
+    FROM candidate
+"""
+
+def generate_gate_entry_number(db: Session, warehouse_code, year: int = None):
+    """Allocate the next gate entry number for a warehouse from gate_entry_counters.
+
+    Runs on the caller's Session, so no second pooled connection is needed. The counter
+    row stays locked until the caller commits: other entries for the same warehouse wait
+    for that, so allocate the number last, right before writing the entry. An entry
+    that is rolled back gives its number back (the increment is rolled back with it).
+
+    Numbers that collide with legacy random ones are skipped. Returns None for an
+    unknown warehouse or an exhausted year; database errors are raised.
+
+    `year` picks the number series (default: this year); entries replayed from an
+    earlier year are numbered in that year's series.
+    """
+    year = year or datetime.now().year
+    params = {
+        "warehouse_code": warehouse_code,
+        "year": year,
+        "prefix": f"{warehouse_code}{year}"
+    }
+
+    while True:
+        result = db.execute(text(ALLOCATE_GATE_ENTRY_SQL), params).fetchone()
 
-def generate_gate_entry_number(warehouse_code):
-    """Generate gate entry number with warehouse validation and dual table check"""
-    conn = get_connection()
-    cursor = conn.cursor()
-    try:
-        # Validate warehouse_code exists in location_master
-        cursor.execute("""
-            SELECT warehouse_code FROM location_master WHERE warehouse_code = %s
-        """, (warehouse_code,))
-        result = cursor.fetchone()
-        
         if not result:
-            print(f"Warehouse code {warehouse_code} not found in location_master")
+            logger.warning(f"Warehouse code {warehouse_code} not found in location_master")
             return None
-            
-        warehouse_id = result[0]
-        year = datetime.now().strftime("%Y")
-        
-        # Generate unique gate entry number by checking both tables
-        max_attempts = 100  # Prevent infinite loop
-        for attempt in range(max_attempts):
-            random_digits = ''.join(random.choices(string.digits, k=6))
-            gate_entry_no = f"{warehouse_id}{year}{random_digits}"
-            
-            # Check if this number exists in either table
-            if not check_gate_entry_exists(gate_entry_no):
-                return gate_entry_no
-        
-        print(f"Failed to generate unique gate entry number after {max_attempts} attempts")
-        return None
-        
-    except Exception as e:
-        print(f"Error generating gate entry number: {str(e)}")
-        return None
-    finally:
-        cursor.close()
-        conn.close()
 
-def generate_gate_entry_no_for_user(username):
+        last_value, gate_entry_no, taken = result
+        if last_value > MAX_GATE_ENTRY_SEQUENCE:
+            logger.warning(f"Gate entry numbers exhausted for warehouse {warehouse_code} in {year}")
+            return None
+        if not taken:
+            return gate_entry_no
+
+def generate_gate_entry_no_for_user(db: Session, username, year: int = None):
     """
     Complete function to generate gate entry number for a user
-    Now checks both insights_data and raw_materials_data for uniqueness
+    Numbers come from the warehouse's yearly counter (see generate_gate_entry_number)
     """
-    try:
-        # Step 1: Get fresh user details
-        user_details = fetch_user_details(username)
-        if not user_details:
-            print(f"User {username} not found in database")
-            return None
-            
-        warehouse_code = user_details.get('warehouse_code')
-        if not warehouse_code:
-            print(f"User {username} has no warehouse_code assigned")
-            return None
-            
-        # Step 2: Generate gate entry number with dual table check
-        gate_entry_no = generate_gate_entry_number(warehouse_code)
-        if not gate_entry_no:
-            print(f"Failed to generate gate entry number for warehouse {warehouse_code}")
-            return None
-            
-        return gate_entry_no
+    # Step 1: Get fresh user details
+    user_details = fetch_user_details(db, username)
+    if not user_details:
+        logger.warning(f"User {username} not found in database")
+        return None
         
-    except Exception as e:
-        print(f"Error in generate_gate_entry_no_for_user: {str(e)}")
+    warehouse_code = user_details.get('warehouse_code')
+    if not warehouse_code:
+        logger.warning(f"User {username} has no warehouse_code assigned")
         return None
+        
+    # Step 2: Allocate the next gate entry number for the warehouse
+    gate_entry_no = generate_gate_entry_number(db, warehouse_code, year)
+    if not gate_entry_no:
+        logger.warning(f"Failed to generate gate entry number for warehouse {warehouse_code}")
+        return None
+        
+    return gate_entry_no
 
 # Legacy function for backward compatibility
-def generate_gate_entry_no(warehouse_code: str = "ATDVG") -> str:
+def generate_gate_entry_no(db: Session, warehouse_code: str = "ATDVG") -> str:
     """Legacy function - use generate_gate_entry_no_for_user instead"""
-    result = generate_gate_entry_number(warehouse_code)
+    result = generate_gate_entry_number(db, warehouse_code)
     return result if result else f"ATDVG{datetime.now().strftime('%Y')}{''.join(random.choices(string.digits, k=6))}"
 
+# SQLSTATE raised when a lock wait exceeds lock_timeout
+LOCK_NOT_AVAILABLE = "55P03"
+
+RECORD_VEHICLE_MOVEMENT_SQL = """
+    INSERT INTO vehicle_state (vehicle_no, movement_type, gate_entry_no, date, time, warehouse_code, updated_at)
+    VALUES (:vehicle_no, :movement_type, :gate_entry_no, :date, :time, :warehouse_code, NOW())
+    ON CONFLICT (vehicle_no) DO UPDATE
+    SET movement_type = EXCLUDED.movement_type,
+        gate_entry_no = EXCLUDED.gate_entry_no,
+        date = EXCLUDED.date,
+        time = EXCLUDED.time,
+        warehouse_code = EXCLUDED.warehouse_code,
+        updated_at = NOW()
+    WHERE vehicle_state.date IS NULL
+        OR (EXCLUDED.date, EXCLUDED.time) > (vehicle_state.date, COALESCE(vehicle_state.time, TIME '00:00'))
+"""
+
+def record_vehicle_movement(db: Session, vehicle_no: str, movement_type: str,
+                            gate_entry_no: str, moved_at: datetime, warehouse_code: str):
+    """
+    Store a gate movement as the vehicle's current state (vehicle_state), unless the
+    vehicle already has a later movement (an offline entry replayed after live ones).
+    Runs in the caller's transaction so it commits or rolls back with the insights_data rows;
+    errors are not swallowed for the same reason.
+    """
+    db.execute(text(RECORD_VEHICLE_MOVEMENT_SQL), {
+        "vehicle_no": vehicle_no,
+        "movement_type": movement_type,
+        "gate_entry_no": gate_entry_no,
+        # insights_data stores the date part as a midnight DateTime
+        "date": datetime.combine(moved_at.date(), datetime.min.time()),
+        "time": moved_at.time(),
+        "warehouse_code": warehouse_code,
+    })
+
 def validate_document_date(date_str: str) -> bool:
     """Validate document date format"""
     try:
@@ -154,6 +184,17 @@ def clean_vehicle_number(vehicle_no: str) -> str:
     cleaned = ''.join(char for char in cleaned if char.isalnum())
     return cleaned
 
+def vehicle_search_pattern(vehicle_no: str) -> str:
+    """LIKE pattern for partial plate searches against the vehicle_no_norm columns
+    (trigram indexed); cleaning also strips any LIKE wildcards from the input.
+
+    Raises HTTPException(400) when nothing searchable is left ("%%" would match every row).
+    """
+    cleaned = clean_vehicle_number(vehicle_no)
+    if not cleaned:
+        raise HTTPException(status_code=400, detail="Vehicle number must contain letters or digits")
+    return f"%{cleaned}%"
+
 def validate_vehicle_number(vehicle_no: str) -> bool:
     """Validate Indian vehicle number format"""
     if not vehicle_no:
@@ -203,22 +244,29 @@ def clean_string(text: str) -> str:
     
     return text.strip().replace('\n', ' ').replace('\r', '')
 
-# ✅ TEST THE RAW SQL FUNCTIONS
+# ✅ TEST THE GATE ENTRY FUNCTIONS
 if __name__ == "__main__":
-    print("Testing Raw SQL Gate Entry Number Generation:")
+    from app.database import SessionLocal
+
+    print("Testing Gate Entry Number Generation:")
     print("=" * 60)
     
-    # Test user details fetch
-    test_username = "testuser"  # Replace with actual username
-    user_details = fetch_user_details(test_username)
-    print(f"User Details for {test_username}:")
-    print(f"  Result: {user_details}")
-    
-    if user_details and user_details.get('warehouse_code'):
-        warehouse_code = user_details['warehouse_code']
-        print(f"\nTesting gate entry generation for warehouse: {warehouse_code}")
+    db = SessionLocal()
+    try:
+        # Test user details fetch
+        test_username = "testuser"  # Replace with actual username
+        user_details = fetch_user_details(db, test_username)
+        print(f"User Details for {test_username}:")
+        print(f"  Result: {user_details}")
         
-        # Test gate entry number generation
-        for i in range(3):
-            gate_no = generate_gate_entry_number(warehouse_code)
-            print(f"  Generated: {gate_no}")
\ No newline at end of file
+        if user_details and user_details.get('warehouse_code'):
+            warehouse_code = user_details['warehouse_code']
+            print(f"\nTesting gate entry generation for warehouse: {warehouse_code}")
+            
+            # Test gate entry number generation (consumes real numbers)
+            for i in range(3):
+                gate_no = generate_gate_entry_number(db, warehouse_code)
+                print(f"  Generated: {gate_no}")
+    finally:
+        db.rollback()
+        db.close()
@@ -0,0 +1,127 @@
+# app/utils/idempotency.py - Idempotency-Key support for the create endpoints
+#
+# The key row is inserted in the same transaction as the entry it protects and filled
+# with the response just before commit, so an entry and its replayable response always
+# commit (or roll back) together. A retry arriving while the original request is still
+# running blocks on the uncommitted key row, then replays the stored response.
+import hashlib
+import json
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from sqlalchemy import delete, func, select, text
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.orm import Session
+from app.config import settings
+from app.models import IdempotencyKey
+from app.utils.helpers import LOCK_NOT_AVAILABLE
+
+MAX_KEY_LENGTH = 100
+
+def request_hash(payload) -> str:
+    """sha256 of the request body, to reject a key reused for a different request"""
+    body = json.dumps(jsonable_encoder(payload), sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(body.encode("utf-8")).hexdigest()
+
+def claim_idempotency_key(db: Session, idempotency_key: str, username: str,
+                          endpoint: str, payload) -> Optional[IdempotencyKey]:
+    """Claim the key for this request in the current transaction.
+
+    Returns None if the key was claimed (new or expired key), otherwise the completed
+    original request. Raises HTTPException(422) if the key was used for a different
+    request and HTTPException(409) if the original request is still running after
+    IDEMPOTENCY_KEY_WAIT_MS (the transaction is then aborted; the caller rolls back).
+    """
+    if len(idempotency_key) > MAX_KEY_LENGTH:
+        raise HTTPException(status_code=400, detail=f"Idempotency-Key must be at most {MAX_KEY_LENGTH} characters")
+
+    body_hash = request_hash(payload)
+    now = datetime.now(timezone.utc)
+    claim = insert(IdempotencyKey).values(
+        idempotency_key=idempotency_key,
+        username=username,
+        endpoint=endpoint,
+        request_hash=body_hash,
+        created_at=now,
+        expires_at=now + timedelta(hours=settings.IDEMPOTENCY_KEY_TTL_HOURS)
+    )
+    # An expired key is reclaimed in place; a live one is left alone
+    claim = claim.on_conflict_do_update(
+        index_elements=[IdempotencyKey.idempotency_key, IdempotencyKey.username],
+        set_={
+            "endpoint": claim.excluded.endpoint,
+            "request_hash": claim.excluded.request_hash,
+            "status_code": None,
+            "response": None,
+            "created_at": claim.excluded.created_at,
+            "expires_at": claim.excluded.expires_at,
+        },
+        where=IdempotencyKey.expires_at < func.now()
+    ).returning(IdempotencyKey.idempotency_key)
+
+    try:
+        db.execute(text("SELECT set_config('lock_timeout', :timeout, true)"),
+                   {"timeout": f"{settings.IDEMPOTENCY_KEY_WAIT_MS}ms"})
+        claimed = db.execute(claim).first()
+        db.execute(text("SET LOCAL lock_timeout TO DEFAULT"))
+    except DBAPIError as e:
+        if getattr(e.orig, "pgcode", None) == LOCK_NOT_AVAILABLE:
+            raise HTTPException(
+                status_code=409,
+                detail="A request with this Idempotency-Key is still being processed. Please retry."
+            )
+        raise
+
+    if claimed:
+        return None
+
+    original = db.execute(
+        select(IdempotencyKey).where(
+            IdempotencyKey.idempotency_key == idempotency_key,
+            IdempotencyKey.username == username
+        )
+    ).scalar_one()
+    if original.endpoint != endpoint or original.request_hash != body_hash:
+        raise HTTPException(
+            status_code=422,
+            detail="Idempotency-Key was already used for a different request"
+        )
+    return original
+
+def begin_idempotent_request(db: Session, idempotency_key: Optional[str], username: str,
+                             endpoint: str, payload) -> Optional[JSONResponse]:
+    """Claim the key for this request, or return the stored response of the original one.
+
+    Returns None when the caller should process the request (no key, new key or expired
+    key); see claim_idempotency_key for the errors raised.
+    """
+    if not idempotency_key:
+        return None
+    original = claim_idempotency_key(db, idempotency_key, username, endpoint, payload)
+    if original is None:
+        return None
+
+    print(f"Replaying {endpoint} response for Idempotency-Key {idempotency_key}")
+    return JSONResponse(
+        status_code=original.status_code,
+        content=original.response,
+        headers={"Idempotent-Replayed": "true"}
+    )
+
+def save_idempotent_response(db: Session, idempotency_key: Optional[str], username: str,
+                             response, status_code: int = 200):
+    """Store the response on the claimed key; call right before the request's commit"""
+    if not idempotency_key:
+        return
+    key = db.get(IdempotencyKey, (idempotency_key, username))
+    key.status_code = status_code
+    key.response = jsonable_encoder(response)
+
+def purge_expired_idempotency_keys(engine) -> int:
+    """Delete keys past their TTL; returns the number removed"""
+    with engine.begin() as conn:
+        result = conn.execute(delete(IdempotencyKey).where(IdempotencyKey.expires_at < func.now()))
+    return result.rowcount
@@ -0,0 +1,210 @@
+# app/utils/streaming.py - Streaming large result sets (CSV / XLSX exports, JSON / NDJSON)
+#
+# Rows are read through a server-side cursor in batches of STREAM_BATCH_SIZE and written
+# out as they arrive, so memory stays flat however many rows match. Responses have no
+# Content-Length and go out with chunked transfer encoding.
+import csv
+import io
+import json
+import tempfile
+from datetime import date, datetime, time
+from decimal import Decimal
+from typing import AsyncIterator, Callable, Iterable, Iterator, List, Optional
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+from openpyxl import Workbook
+from app.config import settings
+from app.database import SessionLocal, AsyncSessionLocal
+
+EXPORT_FORMATS = ("csv", "xlsx")
+
+EXPORT_MEDIA_TYPES = {
+    "csv": "text/csv; charset=utf-8",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
+
+# ?stream= modes of the list endpoints: one JSON array, or one JSON object per line
+STREAM_MEDIA_TYPES = {
+    "json": "application/json",
+    "ndjson": "application/x-ndjson",
+}
+
+# CSV / JSON text is sent in pieces of roughly this size
+CHUNK_CHARS = 64 * 1024
+XLSX_READ_BYTES = 64 * 1024
+
+def stream_query(statement, batch_size: Optional[int] = None) -> Iterator:
+    """Yield the result rows of an ORM `statement` batch by batch.
+
+    Uses its own session: the request's session is closed before a StreamingResponse
+    body runs. yield_per makes psycopg2 use a named (server-side) cursor, so only one
+    batch of rows is held at a time.
+    """
+    db = SessionLocal()
+    try:
+        result = db.execute(statement.execution_options(yield_per=batch_size or settings.STREAM_BATCH_SIZE))
+        for row in result:
+            yield row
+    finally:
+        db.close()
+
+async def stream_query_async(statement, batch_size: Optional[int] = None) -> AsyncIterator:
+    """stream_query for async endpoints: an asyncpg server-side cursor on its own AsyncSession"""
+    async with AsyncSessionLocal() as db:
+        result = await db.stream(statement.execution_options(yield_per=batch_size or settings.STREAM_BATCH_SIZE))
+        async for row in result:
+            yield row
+
+def stream_rows(statement, convert: Callable) -> Iterator:
+    """Stream `statement` and convert each result row, logging failures.
+
+    Headers are already sent when a query fails mid-stream, so the error can only be
+    logged and the response cut short.
+    """
+    try:
+        for row in stream_query(statement):
+            yield convert(row)
+    except Exception as e:
+        print(f"Streaming error: {str(e)}")
+        raise
+
+async def stream_rows_async(statement, convert: Callable) -> AsyncIterator:
+    try:
+        async for row in stream_query_async(statement):
+            yield convert(row)
+    except Exception as e:
+        print(f"Streaming error: {str(e)}")
+        raise
+
+def export_value(value):
+    """Cell value for an export: dates as ISO strings, None as blank"""
+    if value is None:
+        return ""
+    if isinstance(value, (datetime, date, time)):
+        return value.isoformat()
+    return value
+
+def csv_chunks(header: List[str], rows: Iterable[list]) -> Iterator[bytes]:
+    # BOM so Excel opens the UTF-8 file with the right encoding
+    buffer = io.StringIO()
+    buffer.write("\ufeff")
+    writer = csv.writer(buffer)
+    writer.writerow(header)
+    for row in rows:
+        writer.writerow([export_value(value) for value in row])
+        if buffer.tell() >= CHUNK_CHARS:
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode("utf-8")
+
+def xlsx_chunks(header: List[str], rows: Iterable[list], sheet_title: str = "Export") -> Iterator[bytes]:
+    # Write-only workbooks keep rows in a temporary file rather than in memory; the
+    # finished .xlsx (a zip) is spooled to disk and then sent in pieces
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet(title=sheet_title)
+    sheet.append(header)
+    for row in rows:
+        sheet.append([export_value(value) for value in row])
+
+    with tempfile.TemporaryFile() as output:
+        workbook.save(output)
+        output.seek(0)
+        while True:
+            chunk = output.read(XLSX_READ_BYTES)
+            if not chunk:
+                break
+            yield chunk
+
+def export_format(value: Optional[str]) -> str:
+    """Validate a requested export format; call before starting the response"""
+    file_format = (value or "csv").lower()
+    if file_format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unsupported export format: {value}")
+    return file_format
+
+def export_response(file_format: str, filename: str, header: List[str], rows: Iterable[list],
+                    sheet_title: str = "Export") -> StreamingResponse:
+    """StreamingResponse with `rows` written as a CSV or XLSX attachment"""
+    if file_format == "xlsx":
+        body = xlsx_chunks(header, rows, sheet_title)
+    else:
+        body = csv_chunks(header, rows)
+    return StreamingResponse(
+        body,
+        media_type=EXPORT_MEDIA_TYPES[file_format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}.{file_format}"'}
+    )
+
+def json_value(value):
+    """json.dumps default for the column types the list endpoints return"""
+    if isinstance(value, (datetime, date, time)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+class JsonStreamWriter:
+    """Encodes items as one JSON array or as NDJSON, handing back ~CHUNK_CHARS pieces"""
+
+    def __init__(self, stream_format: str):
+        self.ndjson = stream_format == "ndjson"
+        self.buffer = io.StringIO()
+        self.empty = True
+        if not self.ndjson:
+            self.buffer.write("[")
+
+    def write(self, item) -> Optional[bytes]:
+        if not self.ndjson and not self.empty:
+            self.buffer.write(",")
+        self.buffer.write(json.dumps(item, default=json_value))
+        if self.ndjson:
+            self.buffer.write("\n")
+        self.empty = False
+        if self.buffer.tell() >= CHUNK_CHARS:
+            return self._take()
+        return None
+
+    def close(self) -> bytes:
+        if not self.ndjson:
+            self.buffer.write("]")
+        return self._take()
+
+    def _take(self) -> bytes:
+        chunk = self.buffer.getvalue().encode("utf-8")
+        self.buffer.seek(0)
+        self.buffer.truncate()
+        return chunk
+
+def json_chunks(stream_format: str, items: Iterable) -> Iterator[bytes]:
+    writer = JsonStreamWriter(stream_format)
+    for item in items:
+        chunk = writer.write(item)
+        if chunk:
+            yield chunk
+    yield writer.close()
+
+async def json_chunks_async(stream_format: str, items: AsyncIterator) -> AsyncIterator[bytes]:
+    writer = JsonStreamWriter(stream_format)
+    async for item in items:
+        chunk = writer.write(item)
+        if chunk:
+            yield chunk
+    yield writer.close()
+
+def stream_format(value: Optional[str]) -> Optional[str]:
+    """Validate a ?stream= mode (json / ndjson); None means a regular response"""
+    if not value:
+        return None
+    mode = value.lower()
+    if mode not in STREAM_MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail=f"Unsupported stream mode: {value}, use json or ndjson")
+    return mode
+
+def stream_response(mode: str, items) -> StreamingResponse:
+    """StreamingResponse with `items` (dicts, sync or async iterable) as a JSON array or NDJSON"""
+    if hasattr(items, "__aiter__"):
+        body = json_chunks_async(mode, items)
+    else:
+        body = json_chunks(mode, items)
+    return StreamingResponse(body, media_type=STREAM_MEDIA_TYPES[mode])
@@ -1,8 +1,11 @@
+import argparse
 import logging
 import os
 from datetime import datetime
 from sqlalchemy import create_engine, text
 from dotenv import load_dotenv
+from app.services.consolidation import BIS_ITEM_PATTERN, SOURCES, empty_result, run_consolidation
+from app.services.sync_lock import SyncAlreadyRunning, sync_lock
 
 # Load environment variables if needed
 load_dotenv()
@@ -12,8 +15,12 @@ DB_HOST = os.getenv("DB_HOST")
 DB_PORT = os.getenv("DB_PORT")
 DB_NAME = os.getenv("DB_NAME")
 
-# BIS Item Pattern - Items that should have paired PPJRTWMRT containers
-BIS_ITEM_PATTERN = 'BIS-20LTR01'
+# Incremental sync: re-aggregate only documents loaded (mfabric_document_changes) after
+# the stored watermark minus this lookback, whatever their document_date
+WATERMARK_LOOKBACK_HOURS = int(os.getenv("SYNC_WATERMARK_LOOKBACK_HOURS", "24"))
+
+# Run the three sources concurrently (one connection each) unless disabled
+SYNC_PARALLEL = os.getenv("SYNC_PARALLEL", "true").lower() in ("1", "true", "yes")
 
 # Setup logging
 log_file = "upload_log.txt"
@@ -45,13 +52,9 @@ engine = create_engine(
 with engine.begin() as conn:
     conn.execute(text("SET TIME ZONE 'UTC';"))
 
-def check_source_tables():
+def check_source_tables(full=True):
     """Check if source tables exist and have data"""
-    tables_to_check = [
-        'mfabric_deliverychallan_data',
-        'mfabric_invoice_data', 
-        'mfabric_transferorder_rgp_data'
-    ]
+    tables_to_check = [source['table'] for source in SOURCES]
     
     logging.info("=" * 60)
     logging.info("CHECKING SOURCE TABLES")
@@ -78,8 +81,8 @@ def check_source_tables():
                     table_counts[table] = row_count
                     logging.info(f"✓ {table}: {row_count} rows")
                     
-                    # Check for duplicates
-                    if row_count > 0:
+                    # Check for duplicates (full scan - only worth it on full runs)
+                    if full and row_count > 0:
                         dup_result = conn.execute(text(f"""
                             SELECT COUNT(*) as total_records,
                                    COUNT(DISTINCT document_no) as unique_documents,
@@ -145,10 +148,10 @@ def check_target_table_before():
         logging.error(f"Error checking target table: {str(e)}")
         return 0
 
-def push_to_document_data():
+def push_to_document_data(full=False, parallel=SYNC_PARALLEL):
     try:
         # Check source tables first
-        source_counts = check_source_tables()
+        source_counts = check_source_tables(full)
         
         # Check target table before
         initial_count = check_target_table_before()
@@ -167,414 +170,27 @@ def push_to_document_data():
         logging.info("  - Transporter: Use first non-NULL transporter_name")
         logging.info("  - Clean: Convert spaces to NULL")
         logging.info("  - Data Type: Cast total_quantity to text")
-        logging.info("  - Conflicts: UPDATE existing records (ON CONFLICT DO UPDATE)")
+        logging.info("  - Conflicts: UPDATE existing records only when a column changed (IS DISTINCT FROM)")
+        if full:
+            logging.info("  - Mode: FULL rebuild of all documents")
+        else:
+            logging.info(f"  - Mode: INCREMENTAL (documents loaded since watermark minus {WATERMARK_LOOKBACK_HOURS}h lookback)")
+        logging.info(f"  - Execution: {'PARALLEL (one connection per source)' if parallel else 'SEQUENTIAL'}")
         logging.info("=" * 60)
         
-        insertion_results = {}
-        
-        # Process DeliveryChallan
-        logging.info("Processing DeliveryChallan data...")
-        if source_counts.get('mfabric_deliverychallan_data', 0) > 0:
-            try:
-                with engine.begin() as conn:
-                    result = conn.execute(text(f"""
-                        WITH source_data AS (
-                            SELECT DISTINCT ON (document_no, linenum)
-                                document_no, linenum, itemid, site, document_type, document_date,
-                                e_way_bill_no, transporter_name, vehicle_no, irn_no,
-                                route_no, customer_code, customer_name, total_quantity
-                            FROM mfabric_deliverychallan_data
-                            ORDER BY document_no, linenum
-                        ),
-                        bis_items AS (
-                            SELECT 
-                                document_no,
-                                linenum,
-                                itemid,
-                                total_quantity,
-                                ROW_NUMBER() OVER (
-                                    PARTITION BY document_no, total_quantity 
-                                    ORDER BY linenum
-                                ) as bis_rn
-                            FROM source_data
-                            WHERE itemid LIKE 'BIS-20LTR01%'
-                        ),
-                        matched_ppjrtwmrt AS (
-                            SELECT 
-                                p.document_no,
-                                p.linenum,
-                                ROW_NUMBER() OVER (
-                                    PARTITION BY p.document_no, p.total_quantity 
-                                    ORDER BY p.linenum
-                                ) as ppjr_rn
-                            FROM source_data p
-                            WHERE p.itemid = 'PPJRTWMRT'
-                                AND EXISTS (
-                                    SELECT 1 
-                                    FROM bis_items b 
-                                    WHERE b.document_no = p.document_no 
-                                    AND b.total_quantity = p.total_quantity
-                                )
-                        ),
-                        skip_list AS (
-                            SELECT DISTINCT
-                                m.document_no,
-                                m.linenum
-                            FROM matched_ppjrtwmrt m
-                            INNER JOIN bis_items b 
-                                ON b.document_no = m.document_no 
-                                AND b.bis_rn = m.ppjr_rn
-                            INNER JOIN source_data s
-                                ON s.document_no = m.document_no
-                                AND s.linenum = m.linenum
-                            WHERE s.total_quantity = b.total_quantity
-                        ),
-                        filtered_dc AS (
-                            SELECT 
-                                s.document_no, s.linenum, s.site, s.document_type, s.document_date,
-                                s.e_way_bill_no, s.transporter_name, s.vehicle_no, s.irn_no,
-                                s.route_no, s.customer_code, s.customer_name, s.total_quantity
-                            FROM source_data s
-                            WHERE NOT EXISTS (
-                                SELECT 1 FROM skip_list sl 
-                                WHERE sl.document_no = s.document_no 
-                                AND sl.linenum = s.linenum
-                            )
-                        ),
-                        aggregated_dc AS (
-                            SELECT 
-                                document_no,
-                                site, 
-                                document_type, 
-                                MAX(document_date) as document_date,
-                                NULLIF(TRIM(MAX(e_way_bill_no)), '') as e_way_bill_no,
-                                COALESCE(
-                                    NULLIF(TRIM(MAX(CASE WHEN transporter_name IS NOT NULL THEN transporter_name END)), ''),
-                                    NULL
-                                ) as transporter_name,
-                                NULLIF(TRIM(MAX(vehicle_no)), '') as vehicle_no,
-                                NULLIF(TRIM(MAX(irn_no)), '') as irn_no,
-                                NULLIF(TRIM(MAX(route_no)), '') as route_no,
-                                MAX(customer_code) as customer_code,
-                                MAX(customer_name) as customer_name,
-                                SUM(COALESCE(total_quantity, 0)) as total_quantity
-                            FROM filtered_dc
-                            GROUP BY document_no, site, document_type
-                        )
-                        INSERT INTO document_data (
-                            site, document_type, document_no, document_date,
-                            e_way_bill_no, transporter_name, vehicle_no, irn_no,
-                            route_no, customer_code, customer_name, total_quantity
-                        )
-                        SELECT 
-                            site, document_type, document_no, document_date,
-                            e_way_bill_no, transporter_name, vehicle_no, irn_no,
-                            route_no, customer_code, customer_name, total_quantity::text
-                        FROM aggregated_dc
-                        ON CONFLICT (document_no) DO UPDATE SET
-                            site = EXCLUDED.site,
-                            document_type = EXCLUDED.document_type,
-                            document_date = EXCLUDED.document_date,
-                            e_way_bill_no = EXCLUDED.e_way_bill_no,
-                            transporter_name = EXCLUDED.transporter_name,
-                            vehicle_no = EXCLUDED.vehicle_no,
-                            irn_no = EXCLUDED.irn_no,
-                            route_no = EXCLUDED.route_no,
-                            customer_code = EXCLUDED.customer_code,
-                            customer_name = EXCLUDED.customer_name,
-                            total_quantity = EXCLUDED.total_quantity
-                        RETURNING document_no, 
-                            CASE WHEN xmax = 0 THEN 'INSERT' ELSE 'UPDATE' END as action;
-                    """))
-                    
-                    results = result.fetchall()
-                    inserts = sum(1 for r in results if r[1] == 'INSERT')
-                    updates = sum(1 for r in results if r[1] == 'UPDATE')
-                    insertion_results['DeliveryChallan'] = {'inserts': inserts, 'updates': updates}
-                    
-                    logging.info(f"✓ DeliveryChallan: {inserts} inserted, {updates} updated")
-                    
-                    if len(results) > 0:
-                        logging.info(f"  Sample documents: {[r[0] for r in results[:3]]}")
-                
-            except Exception as e:
-                logging.error(f"✗ DeliveryChallan processing failed: {str(e)}")
-                insertion_results['DeliveryChallan'] = {'inserts': 0, 'updates': 0}
-        else:
-            logging.warning("⚠ Skipping DeliveryChallan - no source data")
-            insertion_results['DeliveryChallan'] = {'inserts': 0, 'updates': 0}
-
-        # Process Invoice
-        logging.info("Processing Invoice data...")
-        if source_counts.get('mfabric_invoice_data', 0) > 0:
-            try:
-                with engine.begin() as conn:
-                    result = conn.execute(text(f"""
-                        WITH source_data AS (
-                            SELECT DISTINCT ON (document_no, linenum)
-                                document_no, linenum, itemid, site, document_type, document_date,
-                                e_way_bill_no, transporter_name, vehicle_no, irn_no,
-                                customer_code, customer_name, total_quantity
-                            FROM mfabric_invoice_data
-                            ORDER BY document_no, linenum
-                        ),
-                        bis_items AS (
-                            SELECT 
-                                document_no,
-                                linenum,
-                                itemid,
-                                total_quantity,
-                                ROW_NUMBER() OVER (
-                                    PARTITION BY document_no, total_quantity 
-                                    ORDER BY linenum
-                                ) as bis_rn
-                            FROM source_data
-                            WHERE itemid LIKE 'BIS-20LTR01%'
-                        ),
-                        matched_ppjrtwmrt AS (
-                            SELECT 
-                                p.document_no,
-                                p.linenum,
-                                ROW_NUMBER() OVER (
-                                    PARTITION BY p.document_no, p.total_quantity 
-                                    ORDER BY p.linenum
-                                ) as ppjr_rn
-                            FROM source_data p
-                            WHERE p.itemid = 'PPJRTWMRT'
-                                AND EXISTS (
-                                    SELECT 1 
-                                    FROM bis_items b 
-                                    WHERE b.document_no = p.document_no 
-                                    AND b.total_quantity = p.total_quantity
-                                )
-                        ),
-                        skip_list AS (
-                            SELECT DISTINCT
-                                m.document_no,
-                                m.linenum
-                            FROM matched_ppjrtwmrt m
-                            INNER JOIN bis_items b 
-                                ON b.document_no = m.document_no 
-                                AND b.bis_rn = m.ppjr_rn
-                            INNER JOIN source_data s
-                                ON s.document_no = m.document_no
-                                AND s.linenum = m.linenum
-                            WHERE s.total_quantity = b.total_quantity
-                        ),
-                        filtered_inv AS (
-                            SELECT 
-                                s.document_no, s.linenum, s.site, s.document_type, s.document_date,
-                                s.e_way_bill_no, s.transporter_name, s.vehicle_no, s.irn_no,
-                                s.customer_code, s.customer_name, s.total_quantity
-                            FROM source_data s
-                            WHERE NOT EXISTS (
-                                SELECT 1 FROM skip_list sl 
-                                WHERE sl.document_no = s.document_no 
-                                AND sl.linenum = s.linenum
-                            )
-                        ),
-                        aggregated_inv AS (
-                            SELECT 
-                                document_no,
-                                site, 
-                                document_type, 
-                                MAX(document_date) as document_date,
-                                MAX(e_way_bill_no) as e_way_bill_no,
-                                COALESCE(
-                                    NULLIF(TRIM(MAX(CASE WHEN transporter_name IS NOT NULL THEN transporter_name END)), ''),
-                                    NULL
-                                ) as transporter_name,
-                                NULLIF(TRIM(MAX(vehicle_no)), '') as vehicle_no,
-                                NULLIF(TRIM(MAX(irn_no)), '') as irn_no,
-                                MAX(customer_code) as customer_code,
-                                MAX(customer_name) as customer_name,
-                                SUM(COALESCE(total_quantity, 0)) as total_quantity
-                            FROM filtered_inv
-                            GROUP BY document_no, site, document_type
-                        )
-                        INSERT INTO document_data (
-                            site, document_type, document_no, document_date,
-                            e_way_bill_no, transporter_name, vehicle_no, irn_no,
-                            customer_code, customer_name, total_quantity
-                        )
-                        SELECT 
-                            site, document_type, document_no, document_date,
-                            e_way_bill_no, transporter_name, vehicle_no, irn_no,
-                            customer_code, customer_name, total_quantity::text
-                        FROM aggregated_inv
-                        ON CONFLICT (document_no) DO UPDATE SET
-                            site = EXCLUDED.site,
-                            document_type = EXCLUDED.document_type,
-                            document_date = EXCLUDED.document_date,
-                            e_way_bill_no = EXCLUDED.e_way_bill_no,
-                            transporter_name = EXCLUDED.transporter_name,
-                            vehicle_no = EXCLUDED.vehicle_no,
-                            irn_no = EXCLUDED.irn_no,
-                            customer_code = EXCLUDED.customer_code,
-                            customer_name = EXCLUDED.customer_name,
-                            total_quantity = EXCLUDED.total_quantity
-                        RETURNING document_no, 
-                            CASE WHEN xmax = 0 THEN 'INSERT' ELSE 'UPDATE' END as action;
-                    """))
-                    
-                    results = result.fetchall()
-                    inserts = sum(1 for r in results if r[1] == 'INSERT')
-                    updates = sum(1 for r in results if r[1] == 'UPDATE')
-                    insertion_results['Invoice'] = {'inserts': inserts, 'updates': updates}
-                    
-                    logging.info(f"✓ Invoice: {inserts} inserted, {updates} updated")
-                    
-                    if len(results) > 0:
-                        logging.info(f"  Sample documents: {[r[0] for r in results[:3]]}")
-                
-            except Exception as e:
-                logging.error(f"✗ Invoice processing failed: {str(e)}")
-                insertion_results['Invoice'] = {'inserts': 0, 'updates': 0}
-        else:
-            logging.warning("⚠ Skipping Invoice - no source data")
-            insertion_results['Invoice'] = {'inserts': 0, 'updates': 0}
+        # Skip sources without any staging data, consolidate the rest
+        sources = []
+        for source in SOURCES:
+            if source_counts.get(source['table'], 0) > 0:
+                sources.append(source)
+            else:
+                logging.warning(f"⚠ Skipping {source['label']} - no source data")
 
-        # Process Transfer
-        logging.info("Processing Transfer data...")
-        if source_counts.get('mfabric_transferorder_rgp_data', 0) > 0:
-            try:
-                with engine.begin() as conn:
-                    result = conn.execute(text(f"""
-                        WITH source_data AS (
-                            SELECT DISTINCT ON (document_no, linenum)
-                                document_no, linenum, itemid, site, document_type, document_date,
-                                e_way_bill_no, transporter_name, vehicle_no, irn_no,
-                                from_warehouse_code, to_warehouse_code, route_code,
-                                direct_dispatch, sub_document_type, salesman, total_quantity
-                            FROM mfabric_transferorder_rgp_data
-                            ORDER BY document_no, linenum
-                        ),
-                        bis_items AS (
-                            SELECT 
-                                document_no,
-                                linenum,
-                                itemid,
-                                total_quantity,
-                                ROW_NUMBER() OVER (
-                                    PARTITION BY document_no, total_quantity 
-                                    ORDER BY linenum
-                                ) as bis_rn
-                            FROM source_data
-                            WHERE itemid LIKE 'BIS-20LTR01%'
-                        ),
-                        matched_ppjrtwmrt AS (
-                            SELECT 
-                                p.document_no,
-                                p.linenum,
-                                ROW_NUMBER() OVER (
-                                    PARTITION BY p.document_no, p.total_quantity 
-                                    ORDER BY p.linenum
-                                ) as ppjr_rn
-                            FROM source_data p
-                            WHERE p.itemid = 'PPJRTWMRT'
-                                AND EXISTS (
-                                    SELECT 1 
-                                    FROM bis_items b 
-                                    WHERE b.document_no = p.document_no 
-                                    AND b.total_quantity = p.total_quantity
-                                )
-                        ),
-                        skip_list AS (
-                            SELECT DISTINCT
-                                m.document_no,
-                                m.linenum
-                            FROM matched_ppjrtwmrt m
-                            INNER JOIN bis_items b 
-                                ON b.document_no = m.document_no 
-                                AND b.bis_rn = m.ppjr_rn
-                            INNER JOIN source_data s
-                                ON s.document_no = m.document_no
-                                AND s.linenum = m.linenum
-                            WHERE s.total_quantity = b.total_quantity
-                        ),
-                        filtered_to AS (
-                            SELECT 
-                                s.document_no, s.linenum, s.site, s.document_type, s.document_date,
-                                s.e_way_bill_no, s.transporter_name, s.vehicle_no, s.irn_no,
-                                s.from_warehouse_code, s.to_warehouse_code, s.route_code,
-                                s.direct_dispatch, s.sub_document_type, s.salesman, s.total_quantity
-                            FROM source_data s
-                            WHERE NOT EXISTS (
-                                SELECT 1 FROM skip_list sl 
-                                WHERE sl.document_no = s.document_no 
-                                AND sl.linenum = s.linenum
-                            )
-                        ),
-                        aggregated_to AS (
-                            SELECT 
-                                document_no,
-                                site, 
-                                document_type, 
-                                MAX(document_date) as document_date,
-                                NULLIF(TRIM(MAX(e_way_bill_no)), '') as e_way_bill_no,
-                                COALESCE(
-                                    NULLIF(TRIM(MAX(CASE WHEN transporter_name IS NOT NULL THEN transporter_name END)), ''),
-                                    NULL
-                                ) as transporter_name,
-                                NULLIF(TRIM(MAX(vehicle_no)), '') as vehicle_no,
-                                NULLIF(TRIM(MAX(irn_no)), '') as irn_no,
-                                MAX(from_warehouse_code) as from_warehouse_code,
-                                MAX(to_warehouse_code) as to_warehouse_code,
-                                MAX(route_code) as route_code,
-                                MAX(direct_dispatch) as direct_dispatch,
-                                MAX(sub_document_type) as sub_document_type,
-                                MAX(salesman) as salesman,
-                                SUM(COALESCE(total_quantity, 0)) as total_quantity
-                            FROM filtered_to
-                            GROUP BY document_no, site, document_type
-                        )
-                        INSERT INTO document_data (
-                            site, document_type, document_no, document_date,
-                            e_way_bill_no, transporter_name, vehicle_no, irn_no,
-                            from_warehouse_code, to_warehouse_code, route_code,
-                            direct_dispatch, sub_document_type, salesman, total_quantity
-                        )
-                        SELECT 
-                            site, document_type, document_no, document_date,
-                            e_way_bill_no, transporter_name, vehicle_no, irn_no,
-                            from_warehouse_code, to_warehouse_code, route_code,
-                            direct_dispatch, sub_document_type, salesman, total_quantity::text
-                        FROM aggregated_to
-                        ON CONFLICT (document_no) DO UPDATE SET
-                            site = EXCLUDED.site,
-                            document_type = EXCLUDED.document_type,
-                            document_date = EXCLUDED.document_date,
-                            e_way_bill_no = EXCLUDED.e_way_bill_no,
-                            transporter_name = EXCLUDED.transporter_name,
-                            vehicle_no = EXCLUDED.vehicle_no,
-                            irn_no = EXCLUDED.irn_no,
-                            from_warehouse_code = EXCLUDED.from_warehouse_code,
-                            to_warehouse_code = EXCLUDED.to_warehouse_code,
-                            route_code = EXCLUDED.route_code,
-                            direct_dispatch = EXCLUDED.direct_dispatch,
-                            sub_document_type = EXCLUDED.sub_document_type,
-                            salesman = EXCLUDED.salesman,
-                            total_quantity = EXCLUDED.total_quantity
-                        RETURNING document_no, 
-                            CASE WHEN xmax = 0 THEN 'INSERT' ELSE 'UPDATE' END as action;
-                    """))
-                    
-                    results = result.fetchall()
-                    inserts = sum(1 for r in results if r[1] == 'INSERT')
-                    updates = sum(1 for r in results if r[1] == 'UPDATE')
-                    insertion_results['Transfer'] = {'inserts': inserts, 'updates': updates}
-                    
-                    logging.info(f"✓ Transfer: {inserts} inserted, {updates} updated")
-                    
-                    if len(results) > 0:
-                        logging.info(f"  Sample documents: {[r[0] for r in results[:3]]}")
-                
-            except Exception as e:
-                logging.error(f"✗ Transfer processing failed: {str(e)}")
-                insertion_results['Transfer'] = {'inserts': 0, 'updates': 0}
-        else:
-            logging.warning("⚠ Skipping Transfer - no source data")
-            insertion_results['Transfer'] = {'inserts': 0, 'updates': 0}
+        insertion_results = {source['label']: empty_result() for source in SOURCES}
+        insertion_results.update(
+            run_consolidation(engine, full=full, sources=sources,
+                              lookback_hours=WATERMARK_LOOKBACK_HOURS, parallel=parallel)
+        )
 
         # Final results check
         logging.info("=" * 60)
@@ -589,10 +205,12 @@ def push_to_document_data():
                 
                 total_inserts = sum(r['inserts'] for r in insertion_results.values())
                 total_updates = sum(r['updates'] for r in insertion_results.values())
+                total_unchanged = sum(r['unchanged'] for r in insertion_results.values())
                 
                 logging.info(f"Initial record count: {initial_count}")
                 logging.info(f"Records inserted this cycle: {total_inserts}")
                 logging.info(f"Records updated this cycle: {total_updates}")
+                logging.info(f"Records unchanged this cycle: {total_unchanged}")
                 logging.info(f"Final record count: {final_count}")
                 
                 # Show breakdown by document type
@@ -623,13 +241,16 @@ def push_to_document_data():
                 # Show processing summary
                 logging.info("Processing Summary:")
                 for doc_type, stats in insertion_results.items():
-                    logging.info(f"  {doc_type}: {stats['inserts']} inserts, {stats['updates']} updates")
+                    logging.info(
+                        f"  {doc_type}: {stats['inserts']} inserts, {stats['updates']} updates, "
+                        f"{stats['unchanged']} unchanged ({stats.get('seconds', 0)}s)"
+                    )
                 
         except Exception as e:
             logging.error(f"Error in final results check: {str(e)}")
 
         logging.info("Successfully completed aggregated data push with updates to document_data.")
-        print(f"Data processing complete: {total_inserts} inserts, {total_updates} updates")
+        print(f"Data processing complete: {total_inserts} inserts, {total_updates} updates, {total_unchanged} unchanged")
         
     except Exception as e:
         logging.error(f"Error during data processing: {str(e)}")
@@ -637,4 +258,20 @@ def push_to_document_data():
 
 # Run the migration
 if __name__ == "__main__":
-    push_to_document_data()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Consolidate mfabric staging tables into document_data")
+    parser.add_argument("--full", action="store_true",
+                        help="Ignore watermarks and re-aggregate every document (rebuild)")
+    parser.add_argument("--parallel", dest="parallel", action="store_true", default=SYNC_PARALLEL,
+                        help="Consolidate the sources concurrently, one connection each (default)")
+    parser.add_argument("--sequential", dest="parallel", action="store_false",
+                        help="Consolidate the sources one after another")
+    parser.add_argument("--wait", type=float, default=0, metavar="SECONDS",
+                        help="Wait up to SECONDS for a running sync to finish instead of skipping")
+    args = parser.parse_args()
+
+    # Only one consolidation at a time across csv_to_DB.py, the scheduler and the API
+    try:
+        with sync_lock(engine, "csv_to_DB", "wait" if args.wait > 0 else "skip", args.wait):
+            push_to_document_data(full=args.full, parallel=args.parallel)
+    except SyncAlreadyRunning as e:
+        logging.warning(f"{str(e)} - skipping this run")
\ No newline at end of file
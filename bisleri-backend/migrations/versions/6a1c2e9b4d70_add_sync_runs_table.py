@@ -0,0 +1,45 @@
+"""add sync_runs table
+
+Revision ID: 6a1c2e9b4d70
+Revises: c5d2f8a0e914
+Create Date: 2026-10-17 10:05:12.518240
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '6a1c2e9b4d70'
+down_revision: Union[str, None] = 'c5d2f8a0e914'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('sync_runs',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('trigger', sa.String(length=20), nullable=False),
+        sa.Column('mode', sa.String(length=20), nullable=False),
+        sa.Column('status', sa.String(length=20), nullable=False),
+        sa.Column('started_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+        sa.Column('finished_at', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('duration_seconds', sa.Float(), nullable=True),
+        sa.Column('inserts', sa.Integer(), nullable=True),
+        sa.Column('updates', sa.Integer(), nullable=True),
+        sa.Column('unchanged', sa.Integer(), nullable=True),
+        sa.Column('error', sa.Text(), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_sync_runs_id'), 'sync_runs', ['id'], unique=False)
+    op.create_index('ix_sync_runs_started_at', 'sync_runs', ['started_at'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_sync_runs_started_at', table_name='sync_runs')
+    op.drop_index(op.f('ix_sync_runs_id'), table_name='sync_runs')
+    op.drop_table('sync_runs')
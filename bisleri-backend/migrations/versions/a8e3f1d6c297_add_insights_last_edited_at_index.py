@@ -0,0 +1,33 @@
+"""add insights last_edited_at index
+
+Revision ID: a8e3f1d6c297
+Revises: b3f9c2d7a614
+Create Date: 2026-10-17 23:42:08.513907
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a8e3f1d6c297'
+down_revision: Union[str, None] = 'b3f9c2d7a614'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # /edit-statistics counts rows edited today across rolled-up days too
+    with op.get_context().autocommit_block():
+        op.create_index('ix_insights_data_last_edited_at', 'insights_data', ['last_edited_at'], unique=False,
+                        postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_insights_data_last_edited_at', table_name='insights_data',
+                      postgresql_concurrently=True, if_exists=True)
@@ -0,0 +1,81 @@
+"""add daily rollup tables
+
+Revision ID: b3f9c2d7a614
+Revises: a8b2e4f19c63
+Create Date: 2026-10-17 19:42:08.316527
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b3f9c2d7a614'
+down_revision: Union[str, None] = 'a8b2e4f19c63'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Filled by the sync scheduler (app/services/rollups.py): the first run backfills
+    # history in chunks; until then the stats endpoints read raw rows as before.
+    op.create_table('insights_daily_rollup',
+        sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column('day', sa.Date(), nullable=False),
+        sa.Column('warehouse_code', sa.String(length=50), nullable=True),
+        sa.Column('site_code', sa.String(length=50), nullable=True),
+        sa.Column('movements', sa.Integer(), nullable=False),
+        sa.Column('gate_in_entries', sa.Integer(), nullable=False),
+        sa.Column('gate_out_entries', sa.Integer(), nullable=False),
+        sa.Column('operational_complete', sa.Integer(), nullable=False),
+        sa.Column('missing_driver', sa.Integer(), nullable=False),
+        sa.Column('missing_km', sa.Integer(), nullable=False),
+        sa.Column('missing_loaders', sa.Integer(), nullable=False),
+        sa.Column('multiple_edits', sa.Integer(), nullable=False),
+        sa.Column('total_edits', sa.Integer(), nullable=False),
+        sa.Column('max_edit_count', sa.Integer(), nullable=False),
+        sa.Column('most_edited_id', sa.Integer(), nullable=True),
+        sa.Column('most_edited_gate_entry_no', sa.String(length=50), nullable=True),
+        sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_insights_daily_rollup_day_warehouse_code', 'insights_daily_rollup', ['day', 'warehouse_code'], unique=False)
+
+    op.create_table('raw_materials_daily_rollup',
+        sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column('day', sa.Date(), nullable=False),
+        sa.Column('warehouse_code', sa.String(length=50), nullable=True),
+        sa.Column('site_code', sa.String(length=50), nullable=True),
+        sa.Column('entries', sa.Integer(), nullable=False),
+        sa.Column('gate_in_count', sa.Integer(), nullable=False),
+        sa.Column('gate_out_count', sa.Integer(), nullable=False),
+        sa.Column('edited_entries', sa.Integer(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_raw_materials_daily_rollup_day_warehouse_code', 'raw_materials_daily_rollup', ['day', 'warehouse_code'], unique=False)
+
+    op.create_table('daily_vehicle_activity',
+        sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column('source', sa.String(length=20), nullable=False),
+        sa.Column('day', sa.Date(), nullable=False),
+        sa.Column('warehouse_code', sa.String(length=50), nullable=True),
+        sa.Column('site_code', sa.String(length=50), nullable=True),
+        sa.Column('vehicle_no', sa.String(length=50), nullable=False),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_daily_vehicle_activity_source_day_warehouse_code', 'daily_vehicle_activity', ['source', 'day', 'warehouse_code'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_daily_vehicle_activity_source_day_warehouse_code', table_name='daily_vehicle_activity')
+    op.drop_table('daily_vehicle_activity')
+    op.drop_index('ix_raw_materials_daily_rollup_day_warehouse_code', table_name='raw_materials_daily_rollup')
+    op.drop_table('raw_materials_daily_rollup')
+    op.drop_index('ix_insights_daily_rollup_day_warehouse_code', table_name='insights_daily_rollup')
+    op.drop_table('insights_daily_rollup')
+    op.execute("DELETE FROM sync_watermarks WHERE source_table = 'daily_rollups'")
@@ -0,0 +1,82 @@
+"""add mfabric change notify triggers
+
+Revision ID: b7d41f0c3a95
+Revises: 6a1c2e9b4d70
+Create Date: 2026-10-17 11:20:37.904112
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b7d41f0c3a95'
+down_revision: Union[str, None] = '6a1c2e9b4d70'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+MFABRIC_TABLES = [
+    'mfabric_deliverychallan_data',
+    'mfabric_invoice_data',
+    'mfabric_transferorder_rgp_data',
+]
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Statement-level triggers: one NOTIFY per 200 distinct document_nos touched by a
+    # statement (NOTIFY payloads are capped at 8000 bytes). Bulk loads beyond 5000
+    # documents only send a "bulk" marker and are left to the periodic sync.
+    op.execute("""
+        CREATE OR REPLACE FUNCTION notify_mfabric_change() RETURNS trigger AS $$
+        DECLARE
+            doc_count integer;
+            chunk text[];
+        BEGIN
+            SELECT COUNT(DISTINCT document_no) INTO doc_count FROM changed_rows;
+
+            IF doc_count = 0 THEN
+                RETURN NULL;
+            ELSIF doc_count > 5000 THEN
+                PERFORM pg_notify('mfabric_changes', json_build_object(
+                    'table', TG_TABLE_NAME, 'bulk', true, 'count', doc_count
+                )::text);
+                RETURN NULL;
+            END IF;
+
+            FOR chunk IN
+                SELECT array_agg(document_no)
+                FROM (
+                    SELECT document_no, (ROW_NUMBER() OVER (ORDER BY document_no) - 1) / 200 AS bucket
+                    FROM (SELECT DISTINCT document_no FROM changed_rows WHERE document_no IS NOT NULL) d
+                ) b
+                GROUP BY bucket
+            LOOP
+                PERFORM pg_notify('mfabric_changes', json_build_object(
+                    'table', TG_TABLE_NAME, 'document_nos', chunk
+                )::text);
+            END LOOP;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+    """)
+
+    # Transition tables are not allowed on multi-event triggers, hence one per event
+    for table in MFABRIC_TABLES:
+        for event in ('INSERT', 'UPDATE'):
+            op.execute(f"""
+                CREATE TRIGGER {table}_notify_{event.lower()}
+                AFTER {event} ON {table}
+                REFERENCING NEW TABLE AS changed_rows
+                FOR EACH STATEMENT EXECUTE FUNCTION notify_mfabric_change()
+            """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for table in MFABRIC_TABLES:
+        for event in ('INSERT', 'UPDATE'):
+            op.execute(f"DROP TRIGGER IF EXISTS {table}_notify_{event.lower()} ON {table}")
+    op.execute("DROP FUNCTION IF EXISTS notify_mfabric_change()")
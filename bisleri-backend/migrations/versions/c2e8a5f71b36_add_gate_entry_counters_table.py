@@ -0,0 +1,34 @@
+"""add gate_entry_counters table
+
+Revision ID: c2e8a5f71b36
+Revises: b7d41f0c3a95
+Create Date: 2026-10-17 12:02:18.661903
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c2e8a5f71b36'
+down_revision: Union[str, None] = 'b7d41f0c3a95'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('gate_entry_counters',
+        sa.Column('warehouse_code', sa.String(length=50), nullable=False),
+        sa.Column('year', sa.Integer(), nullable=False),
+        sa.Column('last_value', sa.Integer(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+        sa.PrimaryKeyConstraint('warehouse_code', 'year')
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('gate_entry_counters')
@@ -0,0 +1,74 @@
+"""add mfabric document changes
+
+Revision ID: c5d2f8a0e914
+Revises: f803f93e7e2d
+Create Date: 2026-10-17 09:14:27.640281
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c5d2f8a0e914'
+down_revision: Union[str, None] = 'f803f93e7e2d'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+MFABRIC_TABLES = [
+    'mfabric_deliverychallan_data',
+    'mfabric_invoice_data',
+    'mfabric_transferorder_rgp_data',
+]
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # When each mfabric document was last written, whatever its document_date: the
+    # incremental sync watermark (sync_watermarks.last_change_at) is taken from here
+    op.create_table('mfabric_document_changes',
+        sa.Column('source_table', sa.String(length=100), nullable=False),
+        sa.Column('document_no', sa.String(length=255), nullable=False),
+        sa.Column('changed_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+        sa.PrimaryKeyConstraint('source_table', 'document_no')
+    )
+    op.create_index('ix_mfabric_document_changes_source_table_changed_at', 'mfabric_document_changes',
+                    ['source_table', 'changed_at'], unique=False)
+    op.add_column('sync_watermarks', sa.Column('last_change_at', sa.DateTime(timezone=True), nullable=True))
+
+    # One set-based upsert per statement (transition table), not one per loaded line
+    op.execute("""
+        CREATE OR REPLACE FUNCTION record_mfabric_change() RETURNS trigger AS $$
+        BEGIN
+            INSERT INTO mfabric_document_changes (source_table, document_no, changed_at)
+            SELECT DISTINCT TG_TABLE_NAME, document_no, NOW()
+            FROM changed_rows
+            WHERE document_no IS NOT NULL
+            ON CONFLICT (source_table, document_no) DO UPDATE SET changed_at = EXCLUDED.changed_at;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+    """)
+
+    for table in MFABRIC_TABLES:
+        for event in ('INSERT', 'UPDATE'):
+            op.execute(f"""
+                CREATE TRIGGER {table}_record_{event.lower()}
+                AFTER {event} ON {table}
+                REFERENCING NEW TABLE AS changed_rows
+                FOR EACH STATEMENT EXECUTE FUNCTION record_mfabric_change()
+            """)
+    # No backfill: sources without last_change_at get one full run first
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for table in MFABRIC_TABLES:
+        for event in ('INSERT', 'UPDATE'):
+            op.execute(f"DROP TRIGGER IF EXISTS {table}_record_{event.lower()} ON {table}")
+    op.execute("DROP FUNCTION IF EXISTS record_mfabric_change()")
+    op.drop_column('sync_watermarks', 'last_change_at')
+    op.drop_index('ix_mfabric_document_changes_source_table_changed_at', table_name='mfabric_document_changes')
+    op.drop_table('mfabric_document_changes')
@@ -0,0 +1,47 @@
+"""add gate hot path indexes
+
+Revision ID: d9f3b16e0c42
+Revises: c2e8a5f71b36
+Create Date: 2026-10-17 13:15:44.027561
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd9f3b16e0c42'
+down_revision: Union[str, None] = 'c2e8a5f71b36'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# (index name, table, columns) - kept in sync with __table_args__ on the models
+INDEXES = [
+    ('ix_document_data_vehicle_no_document_date', 'document_data', ['vehicle_no', 'document_date']),
+    ('ix_document_data_gate_entry_no', 'document_data', ['gate_entry_no']),
+    ('ix_insights_data_vehicle_no_date_time', 'insights_data', ['vehicle_no', 'date', 'time']),
+    ('ix_insights_data_gate_entry_no', 'insights_data', ['gate_entry_no']),
+    ('ix_insights_data_warehouse_code_date_time', 'insights_data', ['warehouse_code', 'date', 'time']),
+    ('ix_insights_data_date', 'insights_data', ['date']),
+    ('ix_raw_materials_data_gate_entry_no', 'raw_materials_data', ['gate_entry_no']),
+    ('ix_raw_materials_data_warehouse_code_date_time', 'raw_materials_data', ['warehouse_code', 'date_time']),
+    ('ix_raw_materials_data_date_time', 'raw_materials_data', ['date_time']),
+]
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # CONCURRENTLY so gate entries keep writing while the indexes build
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            op.create_index(name, table, columns, unique=False,
+                            postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        for name, table, _ in reversed(INDEXES):
+            op.drop_index(name, table_name=table, postgresql_concurrently=True, if_exists=True)
@@ -0,0 +1,59 @@
+"""add vehicle_no trigram search
+
+Revision ID: e4a7c93d51f8
+Revises: d9f3b16e0c42
+Create Date: 2026-10-17 14:02:18.613905
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e4a7c93d51f8'
+down_revision: Union[str, None] = 'd9f3b16e0c42'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Same expression as NORMALIZED_VEHICLE_NO in app/models/documents.py
+NORMALIZED_VEHICLE_NO = "upper(regexp_replace(vehicle_no, '[^A-Za-z0-9]', '', 'g'))"
+
+# (table, vehicle_no_norm length) - matches the vehicle_no column of each table
+TABLES = [
+    ('document_data', 100),
+    ('insights_data', 50),
+    ('raw_materials_data', 50),
+]
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+
+    # Adding a stored generated column rewrites the table under an exclusive lock,
+    # so run this in a quiet window on large databases
+    for table, length in TABLES:
+        op.add_column(table, sa.Column(
+            'vehicle_no_norm', sa.String(length),
+            sa.Computed(NORMALIZED_VEHICLE_NO, persisted=True), nullable=True
+        ))
+
+    with op.get_context().autocommit_block():
+        for table, _ in TABLES:
+            op.create_index(f'ix_{table}_vehicle_no_norm_trgm', table, ['vehicle_no_norm'],
+                            postgresql_using='gin',
+                            postgresql_ops={'vehicle_no_norm': 'gin_trgm_ops'},
+                            postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        for table, _ in reversed(TABLES):
+            op.drop_index(f'ix_{table}_vehicle_no_norm_trgm', table_name=table,
+                          postgresql_concurrently=True, if_exists=True)
+    for table, _ in reversed(TABLES):
+        op.drop_column(table, 'vehicle_no_norm')
+    # pg_trgm is left installed; other objects may depend on it
@@ -0,0 +1,47 @@
+"""add vehicle_state table
+
+Revision ID: f1c6d8a2e357
+Revises: e4a7c93d51f8
+Create Date: 2026-10-17 14:40:09.318276
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f1c6d8a2e357'
+down_revision: Union[str, None] = 'e4a7c93d51f8'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('vehicle_state',
+        sa.Column('vehicle_no', sa.String(length=50), nullable=False),
+        sa.Column('movement_type', sa.String(length=20), nullable=False),
+        sa.Column('gate_entry_no', sa.String(length=50), nullable=True),
+        sa.Column('date', sa.DateTime(), nullable=True),
+        sa.Column('time', sa.Time(), nullable=True),
+        sa.Column('warehouse_code', sa.String(length=50), nullable=True),
+        sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+        sa.PrimaryKeyConstraint('vehicle_no')
+    )
+
+    # Seed with each vehicle's latest movement, the row the sequence checks used to look up
+    op.execute("""
+        INSERT INTO vehicle_state (vehicle_no, movement_type, gate_entry_no, date, time, warehouse_code)
+        SELECT DISTINCT ON (vehicle_no)
+            vehicle_no, movement_type, gate_entry_no, date, time, warehouse_code
+        FROM insights_data
+        WHERE vehicle_no IS NOT NULL AND movement_type IS NOT NULL
+        ORDER BY vehicle_no, date DESC, time DESC
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('vehicle_state')
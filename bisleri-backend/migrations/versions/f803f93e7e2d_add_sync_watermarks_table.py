@@ -0,0 +1,33 @@
+"""add sync_watermarks table
+
+Revision ID: f803f93e7e2d
+Revises: 359063c9d0ab
+Create Date: 2026-10-17 09:12:41.304118
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f803f93e7e2d'
+down_revision: Union[str, None] = '359063c9d0ab'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('sync_watermarks',
+        sa.Column('source_table', sa.String(length=100), nullable=False),
+        sa.Column('last_document_date', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('last_run_at', sa.DateTime(timezone=True), nullable=True),
+        sa.PrimaryKeyConstraint('source_table')
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('sync_watermarks')
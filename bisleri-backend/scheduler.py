@@ -1,32 +1,35 @@
-import schedule
-import time
-import subprocess
-from datetime import datetime
+# Long-lived sync worker: runs the mfabric -> document_data consolidation in-process
+# on the pooled engine instead of spawning `python csv_to_DB.py` for every run.
+#
+# Use this when the API runs with several workers (set SYNC_SCHEDULER_ENABLED=false and
+# MFABRIC_LISTENER_ENABLED=false for the API then), otherwise the FastAPI lifespan
+# already runs the same scheduler and NOTIFY listener.
+import asyncio
+import logging
+from app.config import settings
+from app.services.mfabric_listener import mfabric_listener
+from app.services.sync_scheduler import SyncScheduler
 
 LOG_FILE = "scheduler_log.txt"
 
-def log(msg):
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    with open(LOG_FILE, "a") as f:
-        f.write(f"[{timestamp}] {msg}\n")
-    print(f"[{timestamp}] {msg}")
+logging.basicConfig(
+    level=logging.INFO,
+    format="[%(asctime)s] %(message)s",
+    datefmt="%Y-%m-%d %H:%M:%S",
+    handlers=[logging.FileHandler(LOG_FILE), logging.StreamHandler()]
+)
+logger = logging.getLogger(__name__)
 
-def job():
-    log("Running csv_to_DB.py to push data from mfabric tables...")
-    result = subprocess.run(["python", "csv_to_DB.py"], capture_output=True, text=True)
-    
-    if result.returncode == 0:
-        log("csv_to_DB.py completed successfully. document_data table updated.")
-    else:
-        log(f"Error in csv_to_DB.py:\n{result.stderr}")
+async def main():
+    scheduler = SyncScheduler()
+    if settings.MFABRIC_LISTENER_ENABLED:
+        mfabric_listener.start()
+    logger.info(f"Scheduler started. Will run every {scheduler.interval_seconds // 60} minutes.")
+    await scheduler.run_forever()
 
-# Run immediately once
-job()
-
-# Then schedule every 10 minutes
-schedule.every(10).minutes.do(job)
-log("Scheduler started. Will run every 10 minutes.")
-
-while True:
-    schedule.run_pending()
-    time.sleep(10)
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        mfabric_listener.stop()
+        logger.info("Scheduler stopped.")
@@ -0,0 +1,158 @@
+# verify_indexes.py - Check via EXPLAIN that the gate hot-path queries use their indexes
+#
+# Usage: python verify_indexes.py [--natural]
+#
+# By default sequential scans are disabled for the session, so the check answers
+# "can the planner use the index for this query" even on small dev databases where
+# a seq scan would be cheaper. --natural shows what the planner picks on real data.
+import argparse
+import json
+import os
+import sys
+from datetime import datetime, timedelta
+from sqlalchemy import text
+
+# Add the app directory to Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.database import engine
+
+SINCE = datetime.now() - timedelta(hours=48)
+
+# (name, query, params, indexes that must appear in the plan)
+HOT_QUERIES = [
+    (
+        "search_recent_documents",
+        """
+        SELECT * FROM document_data d
+        WHERE d.vehicle_no = :vehicle_no
+          AND d.document_date >= (CURRENT_TIMESTAMP AT TIME ZONE 'UTC') - INTERVAL '72 hours'
+        ORDER BY document_date DESC
+        """,
+        {"vehicle_no": "MH12AB1234"},
+        ["ix_document_data_vehicle_no_document_date"],
+    ),
+    (
+        "get_unassigned_documents_for_vehicle",
+        """
+        SELECT document_no FROM document_data
+        WHERE vehicle_no = :vehicle_no
+          AND document_date >= :since
+          AND (gate_entry_no IS NULL OR gate_entry_no = '')
+        ORDER BY document_date DESC
+        """,
+        {"vehicle_no": "MH12AB1234", "since": SINCE},
+        ["ix_document_data_vehicle_no_document_date"],
+    ),
+    (
+        "get_vehicle_history",
+        """
+        SELECT * FROM insights_data
+        WHERE vehicle_no = :vehicle_no
+        ORDER BY date DESC, time DESC
+        """,
+        {"vehicle_no": "MH12AB1234"},
+        ["ix_insights_data_vehicle_no_date_time"],
+    ),
+    (
+        "check_gate_entry_exists",
+        """
+        SELECT 1 FROM insights_data WHERE gate_entry_no = :gate_entry_no
+        UNION
+        SELECT 1 FROM raw_materials_data WHERE gate_entry_no = :gate_entry_no
+        LIMIT 1
+        """,
+        {"gate_entry_no": "ATDVG2026000001"},
+        ["ix_insights_data_gate_entry_no", "ix_raw_materials_data_gate_entry_no"],
+    ),
+    (
+        "documents_by_gate_entry_no",
+        "SELECT document_no FROM document_data WHERE gate_entry_no = :gate_entry_no",
+        {"gate_entry_no": "ATDVG2026000001"},
+        ["ix_document_data_gate_entry_no"],
+    ),
+    (
+        "insights_warehouse_date_filter",
+        """
+        SELECT * FROM insights_data
+        WHERE warehouse_code = :warehouse_code AND date >= :since
+        ORDER BY date DESC, time DESC
+        """,
+        {"warehouse_code": "ATDVG", "since": SINCE},
+        ["ix_insights_data_warehouse_code_date_time"],
+    ),
+    (
+        "insights_date_filter",
+        "SELECT * FROM insights_data WHERE date >= :since ORDER BY date DESC, time DESC",
+        {"since": SINCE},
+        ["ix_insights_data_date"],
+    ),
+    (
+        "raw_materials_warehouse_date_filter",
+        """
+        SELECT * FROM raw_materials_data
+        WHERE warehouse_code = :warehouse_code AND date_time >= :since
+        ORDER BY date_time DESC
+        """,
+        {"warehouse_code": "ATDVG", "since": SINCE},
+        ["ix_raw_materials_data_warehouse_code_date_time"],
+    ),
+    (
+        "documents_by_partial_vehicle_no",
+        "SELECT * FROM document_data WHERE vehicle_no_norm LIKE :pattern",
+        {"pattern": "%AB1234%"},
+        ["ix_document_data_vehicle_no_norm_trgm"],
+    ),
+    (
+        "insights_by_partial_vehicle_no",
+        "SELECT * FROM insights_data WHERE vehicle_no_norm LIKE :pattern",
+        {"pattern": "%AB1234%"},
+        ["ix_insights_data_vehicle_no_norm_trgm"],
+    ),
+    (
+        "raw_materials_by_partial_vehicle_no",
+        "SELECT * FROM raw_materials_data WHERE vehicle_no_norm LIKE :pattern",
+        {"pattern": "%AB1234%"},
+        ["ix_raw_materials_data_vehicle_no_norm_trgm"],
+    ),
+]
+
+def plan_nodes(plan):
+    """Yield every node of an EXPLAIN (FORMAT JSON) plan tree"""
+    yield plan
+    for child in plan.get("Plans", []):
+        yield from plan_nodes(child)
+
+def explain(conn, query, params):
+    raw = conn.execute(text(f"EXPLAIN (FORMAT JSON) {query}"), params).scalar()
+    plan = (json.loads(raw) if isinstance(raw, str) else raw)[0]["Plan"]
+    return list(plan_nodes(plan))
+
+def main():
+    parser = argparse.ArgumentParser(description="Verify gate hot-path queries use their indexes")
+    parser.add_argument("--natural", action="store_true",
+                        help="Keep sequential scans enabled (show the planner's real choice)")
+    args = parser.parse_args()
+
+    print("\n🔍 Verifying hot-path index usage...")
+    failures = 0
+    with engine.connect() as conn:
+        if not args.natural:
+            conn.execute(text("SET enable_seqscan = off"))
+
+        for name, query, params, expected in HOT_QUERIES:
+            nodes = explain(conn, query, params)
+            used = {node["Index Name"] for node in nodes if "Index Name" in node}
+            scans = ", ".join(sorted({node["Node Type"] for node in nodes if "Scan" in node["Node Type"]}))
+            missing = [index for index in expected if index not in used]
+            if missing:
+                failures += 1
+                print(f"  ❌ {name}: missing {', '.join(missing)} (plan: {scans})")
+            else:
+                print(f"  ✅ {name}: {', '.join(expected)} ({scans})")
+
+    print(f"\n{len(HOT_QUERIES) - failures}/{len(HOT_QUERIES)} hot queries use their indexes")
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
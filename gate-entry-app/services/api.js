@@ -165,6 +165,28 @@ export const gateAPI = {
   },
 };
 
+// /filtered-movements returns one page at a time (newest first); follow next_cursor
+// until has_more is false so the insights screens still get every matching movement
+const FILTERED_MOVEMENTS_PAGE_SIZE = 2000;
+
+const fetchAllFilteredMovements = async (filters) => {
+  const results = [];
+  let cursor = null;
+  let page;
+  do {
+    const response = await api.post('/filtered-movements', {
+      ...filters,
+      page_size: FILTERED_MOVEMENTS_PAGE_SIZE,
+      cursor,
+    });
+    page = response.data;
+    results.push(...page.results);
+    cursor = page.next_cursor;
+  } while (page.has_more && cursor);
+
+  return { ...page, count: results.length, results, has_more: false, next_cursor: null };
+};
+
 // ✅ MERGED: Complete Insights APIs
 export const insightsAPI = {
   getFilteredMovements: async (filters) => {
@@ -176,8 +198,7 @@ export const insightsAPI = {
       movement_type: filters.movement_type || null,
       vehicle_no: filters.vehicle_no || null,
     };
-    const response = await api.post('/filtered-movements', filterData);
-    return response.data;
+    return fetchAllFilteredMovements(filterData);
   },
 
   updateOperationalData: async (editData) => {
@@ -239,8 +260,7 @@ getAdminDashboardStats: async (filters = {}) => {
   },
 
   getAdminInsights: async (filters) => {
-    const response = await api.post('/filtered-movements', filters);
-    return response.data;
+    return fetchAllFilteredMovements(filters);
   },
   searchUsers: async (query) => {
     const response = await api.get(`/search-users`, { params: { q: query } });